@@ -1,15 +1,22 @@
+import tempfile
+
 from django import forms
 from django.contrib import admin, messages
 from django.urls import path
 from django.shortcuts import redirect, get_object_or_404
-from django.db import IntegrityError
+from django.http import FileResponse
 from django.utils.html import format_html
 from django.template.response import TemplateResponse
 
+from .currency import annotate_totals
 from .models import (
-    Category, Banner, Brand, Product, Quotation, QuotationLine,
-    # OrderStatus is defined in models.py
+    Category, Banner, Brand, Product, Quotation, QuotationLine, ExchangeRate,
+    OrderStatus, QuotationStatusLog, OutboundEmail, EmailStatus, ProductRecommendation, CatalogSnapshot,
+    JobLock, JobRun,
 )
+from .pdf import SPOOL_MAX_SIZE, render_many, render_merged_pdf, snapshot_quotations, write_zip
+from .variants import VARIANT_FIELDS, VariantError, create_variants, parse_variant_rows
+from .workflow import bulk_transition
 
 ###############################################
 # CATEGORY, BANNER, BRAND, & PRODUCT ADMIN
@@ -41,6 +48,27 @@ class ProductForm(forms.ModelForm):
         model = Product
         fields = '__all__'
 
+class ProductVariantsForm(forms.Form):
+    rows = forms.CharField(
+        label="Variants (CSV)",
+        widget=forms.Textarea(attrs={'rows': 16, 'cols': 100, 'style': 'font-family: monospace;'}),
+        help_text="One variant per line after a header row. name and sku are required; "
+                  "other columns override the template's fields, empty cells keep its values.",
+    )
+    copy_links = forms.BooleanField(
+        required=False, initial=True,
+        label="Copy the template's related products and compatible modules",
+    )
+    link_siblings = forms.BooleanField(
+        required=False, label="Relate the variants and the template to each other",
+    )
+
+    def clean_rows(self):
+        try:
+            return parse_variant_rows(self.cleaned_data['rows'])
+        except VariantError as e:
+            raise forms.ValidationError(e.errors)
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     form = ProductForm
@@ -139,6 +167,11 @@ class ProductAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.clone_view),
                 name='eshop_product_clone'
             ),
+            path(
+                '<int:product_id>/variants/',
+                self.admin_site.admin_view(self.variants_view),
+                name='eshop_product_variants'
+            ),
         ]
         return custom_urls + urls
 
@@ -153,33 +186,48 @@ class ProductAdmin(admin.ModelAdmin):
             messages.error(request, "SKU is required to clone the product.")
             return redirect(request.META.get('HTTP_REFERER', 'admin:index'))
 
-        if Product.objects.filter(name=new_model_name).exists():
-            messages.error(request, f"A product with Model Name '{new_model_name}' already exists.")
-            return redirect(request.META.get('HTTP_REFERER', 'admin:index'))
-
-        if Product.objects.filter(sku=new_sku).exists():
-            messages.error(request, f"A product with SKU '{new_sku}' already exists.")
-            return redirect(request.META.get('HTTP_REFERER', 'admin:index'))
-
         original_product = get_object_or_404(Product, pk=product_id)
-        old_related = original_product.related_products.all()
-        old_modules = original_product.compatible_modules.all()
-
-        original_product.pk = None
-        original_product.name = new_model_name
-        original_product.sku = new_sku
-
         try:
-            original_product.save()
-        except IntegrityError as e:
-            messages.error(request, f"Integrity error while saving clone: {str(e)}")
+            clone, = create_variants(original_product, [{'name': new_model_name, 'sku': new_sku}])
+        except VariantError as e:
+            for error in e.errors:
+                messages.error(request, error)
             return redirect(request.META.get('HTTP_REFERER', 'admin:index'))
 
-        original_product.related_products.set(old_related)
-        original_product.compatible_modules.set(old_modules)
-
         messages.success(request, f"Product cloned successfully with Model Name '{new_model_name}' and SKU '{new_sku}'.")
-        return redirect(f'../../{original_product.pk}/change/')
+        return redirect(f'../../{clone.pk}/change/')
+
+    def variants_view(self, request, product_id):
+        """Create many variants of a product from a CSV table of overrides."""
+        template = get_object_or_404(Product.objects.select_related('category', 'brand'), pk=product_id)
+        if request.method == 'POST':
+            form = ProductVariantsForm(request.POST)
+            if form.is_valid():
+                try:
+                    variants = create_variants(
+                        template,
+                        form.cleaned_data['rows'],
+                        copy_links=form.cleaned_data['copy_links'],
+                        link_siblings=form.cleaned_data['link_siblings'],
+                    )
+                except VariantError as e:
+                    for error in e.errors:
+                        form.add_error('rows', error)
+                else:
+                    messages.success(request, f"Created {len(variants)} variant(s) of {template.name}.")
+                    return redirect('admin:eshop_product_changelist')
+        else:
+            form = ProductVariantsForm(initial={'rows': "name,sku,original_price\n"})
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'original': template,
+            'form': form,
+            'variant_fields': VARIANT_FIELDS,
+            'title': f"Create variants of {template.name}",
+        }
+        return TemplateResponse(request, 'admin/eshop/product/variants.html', context)
 
     def clone_link(self, obj):
         url = f"{obj.pk}/clone/"
@@ -193,12 +241,65 @@ class ProductAdmin(admin.ModelAdmin):
 # QUOTATION & QUOTATION LINE ADMIN + ORDER MANAGEMENT
 ###############################################
 
+class QuotationStatusLogInline(admin.TabularInline):
+    model = QuotationStatusLog
+    extra = 0
+    can_delete = False
+    fields = ('from_status', 'to_status', 'changed_by', 'changed_at', 'note')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+def _transition_action(to_status, description):
+    def action(modeladmin, request, queryset):
+        selected = queryset.count()
+        changed = bulk_transition(queryset, to_status, user=request.user, note="Admin bulk action")
+        skipped = selected - len(changed)
+        modeladmin.message_user(
+            request,
+            f"{len(changed)} quotation(s) marked as {OrderStatus(to_status).label}."
+            + (f" {skipped} skipped (transition not allowed)." if skipped else ""),
+            messages.SUCCESS if changed else messages.WARNING,
+        )
+    action.__name__ = f"mark_{OrderStatus(to_status).name.lower()}"
+    action.short_description = description
+    return action
+
+@admin.action(description="Download PDFs of selected quotations (ZIP)")
+def download_pdfs_zip(modeladmin, request, queryset):
+    # Spool to disk past a few MB so large exports don't sit in memory,
+    # then stream the archive back in chunks. Rendered in this process:
+    # forking a pool from a threaded web worker is unsafe, and large
+    # batches belong in `manage.py render_quotations`.
+    archive = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    write_zip(render_many(snapshot_quotations(queryset.order_by('pk')), processes=1), archive)
+    archive.seek(0)
+    return FileResponse(archive, as_attachment=True, filename="quotations.zip")
+
+@admin.action(description="Download selected quotations as one merged PDF")
+def download_merged_pdf(modeladmin, request, queryset):
+    document = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    render_merged_pdf(snapshot_quotations(queryset.order_by('pk')), document)
+    document.seek(0)
+    return FileResponse(document, as_attachment=True, filename="quotations.pdf")
+
 @admin.register(Quotation)
 class QuotationAdmin(admin.ModelAdmin):
-    list_display = ('order_number', 'customer', 'created_at', 'total_amount', 'status')
-    list_filter = ('status', 'created_at')
+    list_display = ('order_number', 'customer', 'created_at', 'total_amount', 'currency', 'status')
+    list_filter = ('status', 'currency', 'created_at')
     search_fields = ('order_number', 'customer__username', 'customer__email')
     change_list_template = "admin/eshop/quotation_change_list.html"  # Custom change list template
+    # Status only changes through the workflow actions so every change is logged.
+    readonly_fields = ('status',)
+    inlines = [QuotationStatusLogInline]
+    actions = [
+        _transition_action(OrderStatus.CONFIRMED, "Mark selected quotations as Confirmed"),
+        _transition_action(OrderStatus.DELIVERED, "Mark selected quotations as Delivered"),
+        _transition_action(OrderStatus.CANCELED, "Mark selected quotations as Canceled"),
+        download_pdfs_zip,
+        download_merged_pdf,
+    ]
 
     def get_urls(self):
         urls = super().get_urls()
@@ -212,6 +313,7 @@ class QuotationAdmin(admin.ModelAdmin):
         status_filter = request.GET.get('status')
         if status_filter:
             orders = orders.filter(status=status_filter)
+        orders = annotate_totals(orders)
         context = dict(
             self.admin_site.each_context(request),
             orders=orders,
@@ -220,4 +322,95 @@ class QuotationAdmin(admin.ModelAdmin):
 
 @admin.register(QuotationLine)
 class QuotationLineAdmin(admin.ModelAdmin):
-    list_display = ('quotation', 'product', 'quantity', 'unit_price', 'discount_percent')
+    list_display = ('quotation', 'product', 'quantity', 'unit_price', 'currency', 'discount_percent')
+
+@admin.register(QuotationStatusLog)
+class QuotationStatusLogAdmin(admin.ModelAdmin):
+    list_display = ('quotation', 'from_status', 'to_status', 'changed_by', 'changed_at')
+    list_filter = ('to_status', 'changed_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('source_currency', 'target_currency', 'rate', 'updated_at')
+    list_editable = ('rate',)
+
+###############################################
+# EMAIL OUTBOX
+###############################################
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'recipients', 'quotation__order_number')
+    readonly_fields = ('created_at', 'sent_at', 'last_error', 'next_attempt_at', 'claimed_by', 'claimed_until')
+    actions = ['requeue']
+
+    @admin.action(description="Requeue selected emails")
+    def requeue(self, request, queryset):
+        count = queryset.exclude(status=EmailStatus.SENT).update(
+            status=EmailStatus.QUEUED, attempts=0, next_attempt_at=None, claimed_by='', claimed_until=None,
+        )
+        self.message_user(request, f"{count} email(s) requeued.", messages.SUCCESS)
+
+###############################################
+# RECOMMENDATIONS (built by `manage.py build_recommendations`)
+###############################################
+
+@admin.register(ProductRecommendation)
+class ProductRecommendationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'recommended', 'score', 'co_quotations')
+    list_select_related = ('product', 'recommended')
+    search_fields = ('product__name', 'product__sku')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+###############################################
+# OFFLINE CATALOG (written by `manage.py export_catalog_snapshot`)
+###############################################
+
+@admin.register(CatalogSnapshot)
+class CatalogSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('version', 'created_at', 'products', 'changed', 'removed', 'size')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+###############################################
+# SCHEDULED JOBS (run by `manage.py run_scheduler`)
+###############################################
+
+@admin.register(JobLock)
+class JobLockAdmin(admin.ModelAdmin):
+    list_display = ('name', 'schedule', 'next_run_at', 'owner', 'locked_until')
+    readonly_fields = ('name', 'schedule', 'owner', 'locked_until')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('job', 'status', 'started_at', 'duration', 'owner', 'result')
+    list_filter = ('status', 'job', 'started_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
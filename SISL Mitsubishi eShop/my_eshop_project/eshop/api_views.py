@@ -1,11 +1,278 @@
-from rest_framework import generics
-from .models import Product
-from .serializers import ProductSerializer
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-class ProductListAPIView(generics.ListAPIView):
-    queryset = Product.objects.all()
-    serializer_class = ProductSerializer
+from .catalog_snapshot import delta_path, latest_snapshot
+from .compat_graph import get_graph
+from .models import CatalogSnapshot, Product, ProductRecommendation, Quotation
+from .offline_quotations import import_quotations
+from .quotation_lines import LineEditError, VersionConflict, apply_line_changes
+from .pagination import apaginate
+from .ratelimit import rate_limit
+from .serializers import (
+    OfflineQuotationImportSerializer, QuotationLineBatchSerializer, QuotationLineSerializer,
+    QuotationTransitionSerializer,
+)
+from .workflow import bulk_transition
 
-class ProductDetailAPIView(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
-    serializer_class = ProductSerializer
+class QuotationBulkTransitionAPIView(APIView):
+    """
+    POST {"status": "C", "ids": [1, 2, 3]} or {"status": "X", "from_status": "P"}.
+    Quotations that cannot legally move to `status` are skipped.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = QuotationTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        queryset = Quotation.objects.all()
+        if data.get('ids'):
+            queryset = queryset.filter(pk__in=data['ids'])
+        if data.get('from_status'):
+            queryset = queryset.filter(status=data['from_status'])
+
+        changed = bulk_transition(queryset, data['status'], user=request.user, note=data['note'])
+        return Response({
+            'status': data['status'],
+            'updated': len(changed),
+            'ids': [pk for pk, _ in changed],
+        })
+
+class QuotationLinesAPIView(APIView):
+    """
+    GET - the quotation's lines, total and version.
+    POST {"version": 3, "add": [{"product": 1, "quantity": 2, "unit_price":
+    "1250.00"}], "update": [{"id": 7, "quantity": 4}], "delete": [8]} applies
+    the batch in one transaction and returns the new version and total with
+    only the created and updated lines. 409 with the current version when
+    the quotation was edited since `version`; 400 when it is no longer
+    pending or a line's currency has no exchange rate.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, pk):
+        quotation = get_object_or_404(Quotation, pk=pk)
+        return Response({
+            'id': quotation.pk,
+            'version': quotation.version,
+            'total_amount': str(quotation.total_amount),
+            'lines': QuotationLineSerializer(quotation.lines.order_by('pk'), many=True).data,
+        })
+
+    def post(self, request, pk):
+        # customer: the new total invalidates the customer's history (eshop.portal).
+        quotation = get_object_or_404(Quotation.objects.only('pk', 'currency', 'customer'), pk=pk)
+        serializer = QuotationLineBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = apply_line_changes(quotation, **serializer.validated_data)
+        except VersionConflict as exc:
+            return Response({'detail': str(exc), 'version': exc.current_version}, status=409)
+        except LineEditError as exc:
+            raise ValidationError({'detail': str(exc)})
+        return Response({
+            **result,
+            'total_amount': str(result['total_amount']),
+            'created': QuotationLineSerializer(result['created'], many=True).data,
+            'updated': QuotationLineSerializer(result['updated'], many=True).data,
+        })
+
+class CatalogSnapshotAPIView(APIView):
+    """
+    GET - the latest offline catalog snapshot, a gzip-compressed SQLite file
+    (see eshop.catalog_snapshot). With ?since=<version> only the changes
+    since that version are sent when it is still kept, otherwise the full
+    snapshot; 204 when the device is already up to date. The version sent
+    is in X-Catalog-Version, the base of a delta in X-Catalog-Base-Version.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        latest = latest_snapshot()
+        if latest is None:
+            raise Http404("No catalog snapshot has been exported yet.")
+        since = request.query_params.get('since', '')
+        if since == str(latest.version):
+            response = HttpResponse(status=204)
+            response['X-Catalog-Version'] = latest.version
+            return response
+
+        base = CatalogSnapshot.objects.filter(version=since).first() if since.isdigit() else None
+        if base is not None and base.version < latest.version:
+            path = delta_path(base, latest)
+            filename = f'catalog-v{base.version}-v{latest.version}.sqlite3.gz'
+        else:
+            path = latest.file.path
+            filename = f'catalog-v{latest.version}.sqlite3.gz'
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename,
+                                content_type='application/gzip')
+        response['X-Catalog-Version'] = latest.version
+        if base is not None and base.version < latest.version:
+            response['X-Catalog-Base-Version'] = base.version
+        return response
+
+class OfflineQuotationImportAPIView(APIView):
+    """
+    POST {"quotations": [{"offline_id": "<uuid>", "catalog_version": 3,
+    "currency": "BDT", "notes": "", "lines": [{"product": 1, "quantity": 2,
+    "unit_price": "1250.00", "discount_percent": "5"}]}]}.
+    Safe to retry: quotations already imported come back as duplicates.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'quotation_import'
+
+    def post(self, request):
+        serializer = OfflineQuotationImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = import_quotations(serializer.validated_data['quotations'], user=request.user)
+        return Response(result, status=201 if result['created'] else 200)
+
+class ProductRecommendationsAPIView(APIView):
+    """
+    GET - the precomputed "customers also quoted" products, best first.
+    Built by `manage.py build_recommendations`.
+    """
+
+    def get(self, request, product_id):
+        rows = ProductRecommendation.objects.filter(product_id=product_id).values(
+            'rank', 'score', 'co_quotations',
+            'recommended_id', 'recommended__name', 'recommended__sku', 'recommended__original_price',
+        )
+        return Response({
+            'product': product_id,
+            'recommendations': [
+                {
+                    'id': row['recommended_id'],
+                    'name': row['recommended__name'],
+                    'sku': row['recommended__sku'],
+                    'original_price': row['recommended__original_price'],
+                    'rank': row['rank'],
+                    'score': round(row['score'], 4),
+                    'co_quotations': row['co_quotations'],
+                }
+                for row in rows
+            ],
+        })
+
+
+CONFIGURATOR_FIELDS = ('id', 'name', 'sku', 'original_price', 'category__name', 'brand__name')
+MAX_CONFIGURATOR_HOPS = 3
+
+
+def _configurator_rows(product_ids):
+    """One query for every product the graph walk reached."""
+    rows = Product.objects.filter(pk__in=product_ids).values(*CONFIGURATOR_FIELDS)
+    return {row['id']: row for row in rows}
+
+
+class ConfiguratorAPIView(APIView):
+    """
+    GET ?hops=2&reverse=1 - every module compatible with the product within
+    `hops` steps of compatible_modules links, nearest first. With reverse=1
+    the links are also followed backwards (the PLCs an HMI works with).
+    """
+
+    def get(self, request, product_id):
+        try:
+            hops = int(request.query_params.get('hops', 1))
+        except ValueError:
+            raise ValidationError({'hops': "Must be an integer."})
+        if not 1 <= hops <= MAX_CONFIGURATOR_HOPS:
+            raise ValidationError({'hops': f"Must be between 1 and {MAX_CONFIGURATOR_HOPS}."})
+        direction = 'both' if request.query_params.get('reverse') in ('1', 'true') else 'out'
+
+        product = get_object_or_404(Product.objects.values(*CONFIGURATOR_FIELDS), pk=product_id)
+        distances = get_graph().compatible_within(product_id, hops, direction=direction)
+        rows = _configurator_rows(distances)
+        compatible = sorted(
+            (dict(rows[pk], hops=depth) for pk, depth in distances.items() if pk in rows),
+            key=lambda row: (row['hops'], row['name']),
+        )
+        return Response({'product': product, 'hops': hops, 'compatible': compatible})
+
+
+class BillOfMaterialsAPIView(APIView):
+    """
+    GET ?ids=1,2 - the selected products plus everything they need through
+    compatible_modules, each with its depth and the product requiring it.
+    """
+
+    def get(self, request):
+        try:
+            ids = [int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()]
+        except ValueError:
+            raise ValidationError({'ids': "Must be a comma-separated list of product ids."})
+        if not ids:
+            raise ValidationError({'ids': "Provide at least one product id."})
+
+        bom = get_graph().bill_of_materials(ids)
+        rows = _configurator_rows([pk for pk, _, _ in bom])
+        missing = [pk for pk in ids if pk not in rows]
+        if missing:
+            raise ValidationError({'ids': f"Unknown products: {', '.join(map(str, missing))}."})
+        return Response({
+            'items': [
+                dict(rows[pk], depth=depth, required_by=parent)
+                for pk, depth, parent in bom if pk in rows
+            ],
+        })
+
+
+# Async catalog endpoints. These are plain Django views because DRF views
+# are sync only; under ASGI they wait on the database without blocking
+# the event loop.
+
+AUTOCOMPLETE_LIMIT = 10
+PRODUCT_API_FIELDS = tuple(
+    field.name for field in Product._meta.concrete_fields if not field.is_relation
+) + ('category__name', 'brand__name')
+
+
+def _card_json(product):
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'sku': product.sku,
+        'brand': product.brand.name,
+        'original_price': product.original_price,
+        'discounted_price': product.discounted_price,
+        'image': product.image.url if product.image else None,
+    }
+
+
+@rate_limit('api')
+async def product_autocomplete_view(request):
+    """GET ?q=FR-D7 - up to ten products whose name or SKU contains `q`."""
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'results': []})
+    rows = (
+        Product.objects.filter(Q(name__icontains=query) | Q(sku__icontains=query))
+        .order_by('name').values('id', 'name', 'sku')[:AUTOCOMPLETE_LIMIT]
+    )
+    return JsonResponse({'results': [row async for row in rows]})
+
+
+@rate_limit('api')
+async def product_list_view(request):
+    """GET ?sort=price&after=<cursor> - one keyset page of product cards."""
+    page = await apaginate(Product.objects.cards(), request.GET.get('sort'), request.GET.get('after'))
+    return JsonResponse({
+        'results': [_card_json(product) for product in page.items],
+        'sort': page.sort,
+        'next': page.next_cursor,
+    })
+
+
+@rate_limit('api')
+async def product_detail_api_view(request, pk):
+    product = await Product.objects.filter(pk=pk).values(*PRODUCT_API_FIELDS).afirst()
+    if product is None:
+        raise Http404("No Product matches the given query.")
+    return JsonResponse(product)
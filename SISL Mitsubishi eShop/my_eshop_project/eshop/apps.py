@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class EshopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'eshop'
+
+    def ready(self):
+        # Connect signal receivers and transition hooks (exchange-rate,
+        # compatibility graph and quotation history cache invalidation,
+        # customer status emails).
+        from . import compat_graph, currency, outbox, portal  # noqa: F401
@@ -0,0 +1,413 @@
+"""
+Storefront benchmarks.
+
+Each Scenario is one request against a storefront view. run_scenario()
+replays it through the Django test client or straight through the WSGI
+handler (closer to what Passenger does: real cookies and CSRF, no test
+client bookkeeping) from one or more threads, or through the ASGI handler
+from as many concurrent connections on one event loop, and reports
+throughput, latency percentiles and queries per request. compare() checks results
+against a saved baseline so a regression fails the run. See
+`manage.py run_benchmarks`, which runs the suite against a throwaway
+database filled by eshop.synthetic.
+"""
+import asyncio
+import io
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.middleware.csrf import _get_new_csrf_string
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .models import Product
+
+DEFAULT_TOLERANCE = 0.2
+
+
+@dataclass
+class BenchmarkContext:
+    """The rows the scenarios point at."""
+    product: Product
+    user: User
+    query: str
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: object  # callable(context) -> URL
+    method: str = 'GET'
+    data: object = None  # callable(context) -> POST data
+    login: bool = False
+    # Upper bound on queries per request; exceeding it is a regression.
+    max_queries: int = None
+
+
+def _discount_data(context):
+    product = context.product
+    return {
+        'subject': '',
+        'notes': 'Benchmark',
+        'currency': 'BDT',
+        'lines-TOTAL_FORMS': '1',
+        'lines-INITIAL_FORMS': '0',
+        'lines-0-product': str(product.pk),
+        'lines-0-quantity': '3',
+        'lines-0-unit_price': str(product.original_price),
+        'lines-0-discount_percent': '5',
+    }
+
+
+SCENARIOS = [
+    Scenario('home', lambda ctx: reverse('home'), max_queries=7),
+    Scenario('product_detail', lambda ctx: reverse('product_detail', args=[ctx.product.sku]), max_queries=2),
+    Scenario('category', lambda ctx: reverse('category_filter', args=[ctx.product.category.name]), max_queries=2),
+    Scenario('search', lambda ctx: f"{reverse('search')}?{urlencode({'q': ctx.query})}", max_queries=1),
+    Scenario('ask_for_discount_form', lambda ctx: reverse('ask_for_discount', args=[ctx.product.sku]),
+             login=True, max_queries=5),
+    Scenario('ask_for_discount_submit', lambda ctx: reverse('ask_for_discount', args=[ctx.product.sku]),
+             method='POST', data=_discount_data, login=True, max_queries=17),
+]
+
+
+def default_context(query=None):
+    """Point the scenarios at a mid-catalog product and the first customer."""
+    products = Product.objects.order_by('pk')
+    product = products[products.count() // 2]
+    user = User.objects.filter(is_staff=False).order_by('pk').first()
+    if user is None:
+        user = User.objects.create_user('benchmark', 'benchmark@example.com', 'benchmark')
+    return BenchmarkContext(product=product, user=user, query=query or product.name[:-2])
+
+
+class ClientDriver:
+    name = 'client'
+
+    def __init__(self, user=None):
+        self.client = Client()
+        if user is not None:
+            self.client.force_login(user)
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            return self.client.post(path, data or {}).status_code
+        return self.client.get(path).status_code
+
+
+def _browser_cookies(user=None):
+    """A CSRF token and the Cookie header of a browser logged in as `user`."""
+    csrf_token = _get_new_csrf_string()
+    cookies = {'csrftoken': csrf_token}
+    if user is not None:
+        client = Client()
+        client.force_login(user)
+        cookies.update({key: morsel.value for key, morsel in client.cookies.items()})
+    return csrf_token, '; '.join(f'{key}={value}' for key, value in cookies.items())
+
+
+class WSGIDriver:
+    """Calls the WSGI application directly with hand-built environs."""
+    name = 'wsgi'
+
+    def __init__(self, user=None):
+        self.application = WSGIHandler()
+        self.csrf_token, self.cookie_header = _browser_cookies(user)
+
+    def request(self, method, path, data=None):
+        url = urlsplit(path)
+        body = urlencode(data or {}).encode() if method == 'POST' else b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': 'testserver',
+            'HTTP_COOKIE': self.cookie_header,
+            'HTTP_X_CSRFTOKEN': self.csrf_token,
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+        response = self.application(environ, lambda status_line, headers, exc_info=None: status.append(status_line))
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        return int(status[0].split(' ', 1)[0])
+
+
+class ASGIDriver:
+    """
+    Calls the ASGI application directly with hand-built scopes, the way
+    uvicorn or daphne would. request() is a coroutine.
+    """
+    name = 'asgi'
+    asynchronous = True
+
+    def __init__(self, user=None):
+        self.application = ASGIHandler()
+        self.csrf_token, self.cookie_header = _browser_cookies(user)
+
+    async def request(self, method, path, data=None):
+        url = urlsplit(path)
+        body = urlencode(data or {}).encode() if method == 'POST' else b''
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': url.path,
+            'raw_path': url.path.encode(),
+            'query_string': url.query.encode(),
+            'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'cookie', self.cookie_header.encode()),
+                (b'x-csrftoken', self.csrf_token.encode()),
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+        finished = asyncio.Event()
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                finished.set()
+
+        await self.application(scope, receive, send)
+        return status[0]
+
+
+DRIVERS = {driver.name: driver for driver in (ClientDriver, WSGIDriver, ASGIDriver)}
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    driver: str
+    requests: int
+    errors: int
+    seconds: float
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    queries: int  # None when they cannot be counted (the ASGI driver)
+    max_queries: int = None
+    statuses: dict = field(default_factory=dict)
+
+    @property
+    def key(self):
+        return f'{self.name}[{self.driver}]'
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _run_async(driver_class, scenario, context, path, data, per_connection, warmup):
+    # Connections are set up before the loop starts: logging in is sync.
+    clients = [driver_class(context.user if scenario.login else None) for _ in per_connection]
+    latencies, statuses = [], {}
+
+    async def connection_worker(client, count):
+        for _ in range(warmup):
+            await client.request(scenario.method, path, data)
+        for _ in range(count):
+            started = time.perf_counter()
+            status = await client.request(scenario.method, path, data)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    async def main():
+        await asyncio.gather(*(
+            connection_worker(client, count) for client, count in zip(clients, per_connection)
+        ))
+
+    asyncio.run(main())
+    return latencies, [], statuses
+
+
+def unreachable_rate_limits():
+    """ESHOP_RATE_LIMITS with the same scopes and keys but limits no benchmark reaches."""
+    return {
+        scope: {**options, 'rate': '1000000/s', 'burst': 1000000}
+        for scope, options in getattr(settings, 'ESHOP_RATE_LIMITS', {}).items()
+    }
+
+
+def run_scenario(scenario, context, driver='client', requests=100, concurrency=1, warmup=10):
+    """
+    Replay `scenario` `requests` times from `concurrency` threads, or
+    `concurrency` concurrent connections for the ASGI driver.
+    """
+    # Every request comes from one address (and user), so the rate limiter
+    # stays in the measured path but with limits it cannot reach.
+    with override_settings(ESHOP_RATE_LIMITS=unreachable_rate_limits()):
+        return _run_scenario(scenario, context, driver, requests, concurrency, warmup)
+
+
+def _run_scenario(scenario, context, driver, requests, concurrency, warmup):
+    driver_class = DRIVERS[driver]
+    path = scenario.path(context)
+    data = scenario.data(context) if scenario.data else None
+    latencies, query_counts, statuses = [], [], {}
+    lock = threading.Lock()
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def worker(count):
+        local_latencies, local_queries, local_statuses = [], [], {}
+        try:
+            client = driver_class(context.user if scenario.login else None)
+            for _ in range(warmup):
+                client.request(scenario.method, path, data)
+            for _ in range(count):
+                counter = _QueryCounter()
+                started = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    status = client.request(scenario.method, path, data)
+                local_latencies.append((time.perf_counter() - started) * 1000)
+                local_queries.append(counter.count)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            query_counts.extend(local_queries)
+            for status, n in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + n
+
+    started = time.perf_counter()
+    if getattr(driver_class, 'asynchronous', False):
+        # Queries run in per-request threads where they cannot be counted.
+        latencies, query_counts, statuses = _run_async(
+            driver_class, scenario, context, path, data, per_thread, warmup
+        )
+    elif concurrency == 1:
+        worker(requests)
+    else:
+        threads = [threading.Thread(target=worker, args=(count,)) for count in per_thread]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return ScenarioResult(
+        name=scenario.name,
+        driver=driver,
+        requests=len(latencies),
+        errors=sum(n for status, n in statuses.items() if status >= 400),
+        seconds=round(elapsed, 3),
+        throughput=round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        p50_ms=round(_percentile(latencies, 0.50), 2),
+        p95_ms=round(_percentile(latencies, 0.95), 2),
+        p99_ms=round(_percentile(latencies, 0.99), 2),
+        mean_ms=round(sum(latencies) / len(latencies), 2),
+        queries=max(query_counts) if query_counts else None,
+        max_queries=scenario.max_queries,
+        statuses={str(status): n for status, n in sorted(statuses.items())},
+    )
+
+
+def run_suite(context, scenarios=SCENARIOS, drivers=('client',), requests=100, concurrency=1, log=None):
+    results = []
+    for driver in drivers:
+        for scenario in scenarios:
+            result = run_scenario(scenario, context, driver, requests, concurrency)
+            if log:
+                log(format_result(result))
+            results.append(result)
+    return results
+
+
+def format_result(result):
+    return (
+        f"{result.key:<36} {result.throughput:>8.1f} req/s  p50 {result.p50_ms:>7.2f}ms  "
+        f"p95 {result.p95_ms:>7.2f}ms  p99 {result.p99_ms:>7.2f}ms  "
+        f"{'-' if result.queries is None else result.queries:>3} queries"
+        + (f"  {result.errors} errors" if result.errors else "")
+    )
+
+
+def save_baseline(results, path, meta=None):
+    with open(path, 'w') as fh:
+        json.dump({'meta': meta or {}, 'results': {r.key: asdict(r) for r in results}}, fh, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as fh:
+        return json.load(fh)['results']
+
+
+def compare(results, baseline=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return a list of regression messages. Latency (p95) and throughput may
+    drift by `tolerance`; query counts, query budgets and errors may not.
+    """
+    problems = []
+    for result in results:
+        if result.errors:
+            problems.append(f"{result.key}: {result.errors} error responses {result.statuses}")
+        if result.queries is not None and result.max_queries is not None and result.queries > result.max_queries:
+            problems.append(f"{result.key}: {result.queries} queries exceeds the budget of {result.max_queries}")
+        previous = (baseline or {}).get(result.key)
+        if not previous:
+            continue
+        if result.queries is not None and previous['queries'] is not None and result.queries > previous['queries']:
+            problems.append(f"{result.key}: queries went from {previous['queries']} to {result.queries}")
+        if result.p95_ms > previous['p95_ms'] * (1 + tolerance):
+            problems.append(f"{result.key}: p95 went from {previous['p95_ms']}ms to {result.p95_ms}ms")
+        if result.throughput < previous['throughput'] * (1 - tolerance):
+            problems.append(
+                f"{result.key}: throughput went from {previous['throughput']} to {result.throughput} req/s"
+            )
+    return problems
@@ -0,0 +1,309 @@
+"""
+Offline catalog snapshots for field sales.
+
+A snapshot is a small SQLite database, gzip-compressed, holding every
+product with its prices, specs and a JPEG thumbnail, ready for a laptop
+or tablet app to query without a connection. Snapshots are numbered; each
+product row carries a hash of its content, so the delta between any two
+kept versions is just the rows whose hash differs, plus the ids removed.
+A device that already has version N downloads only that delta.
+
+Exports stream products with .iterator() straight into the bundle, then
+compare it with the previous version in SQL (ATTACH) and copy over the
+thumbnails of images that did not change, so memory stays flat and a
+nightly export only decodes new or replaced images. An export that
+finds nothing changed returns the latest snapshot instead of writing a
+new version.
+
+A delta is applied by replacing the products and thumbnails rows it
+contains and deleting the ids in `removed`; a changed product whose image
+is unchanged has no thumbnail row and keeps the one the device has.
+
+Bundle schema (format 1):
+    meta(key, value)                 format, kind (full/delta), version,
+                                     base_version, created_at
+    products(id, sku, name, category, brand, original_price,
+             discounted_price, country_of_origin, description,
+             specs JSON, image, hash)
+    thumbnails(product_id, image, data)
+    removed(id)                      deltas only
+"""
+import functools
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CatalogSnapshot, Product
+from .specs import SPEC_FIELDS
+
+FORMAT = 1
+SNAPSHOT_DIR = 'catalog_snapshots'
+ITERATOR_CHUNK_SIZE = 2000
+
+BASE_FIELDS = (
+    'id', 'sku', 'name', 'category__name', 'brand__name', 'original_price', 'discounted_price',
+    'country_of_origin', 'description',
+)
+PRODUCT_COLUMNS = (
+    'id', 'sku', 'name', 'category', 'brand', 'original_price', 'discounted_price',
+    'country_of_origin', 'description', 'specs', 'image', 'hash',
+)
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY, sku TEXT NOT NULL, name TEXT NOT NULL, category TEXT, brand TEXT,
+    original_price TEXT, discounted_price TEXT, country_of_origin TEXT, description TEXT,
+    specs TEXT, image TEXT, hash TEXT NOT NULL
+);
+CREATE INDEX products_sku ON products (sku);
+CREATE TABLE thumbnails (product_id INTEGER PRIMARY KEY, image TEXT NOT NULL, data BLOB NOT NULL);
+CREATE TABLE removed (id INTEGER PRIMARY KEY);
+"""
+
+
+def _snapshot_dir():
+    path = os.path.join(settings.MEDIA_ROOT, SNAPSHOT_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _product_rows():
+    """Bundle rows (PRODUCT_COLUMNS) for every product, in id order."""
+    fields = BASE_FIELDS + SPEC_FIELDS + ('image',)
+    rows = Product.objects.order_by('id').values_list(*fields).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    for values in rows:
+        base = dict(zip(BASE_FIELDS, values))
+        specs = {name: value for name, value in zip(SPEC_FIELDS, values[len(BASE_FIELDS):-1]) if value}
+        row = [
+            base['id'], base['sku'], base['name'], base['category__name'], base['brand__name'],
+            str(base['original_price']),
+            None if base['discounted_price'] is None else str(base['discounted_price']),
+            base['country_of_origin'], base['description'],
+            json.dumps(specs, sort_keys=True, separators=(',', ':')), values[-1] or '',
+        ]
+        digest = hashlib.sha1(json.dumps(row, separators=(',', ':')).encode(), usedforsecurity=False)
+        yield row + [digest.hexdigest()]
+
+
+def make_thumbnail(image_name):
+    """JPEG thumbnail bytes for a product image, or None if it cannot be read."""
+    from PIL import Image, UnidentifiedImageError
+
+    size = tuple(getattr(settings, 'ESHOP_CATALOG_THUMBNAIL_SIZE', (160, 160)))
+    try:
+        with Image.open(os.path.join(settings.MEDIA_ROOT, image_name)) as image:
+            image.thumbnail(size)
+            output = io.BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=70, optimize=True)
+            return output.getvalue()
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+
+
+def _gunzip(source, target):
+    with gzip.open(source, 'rb') as compressed, open(target, 'wb') as plain:
+        shutil.copyfileobj(compressed, plain)
+
+
+@contextmanager
+def open_bundle(path):
+    """A read-only SQLite connection to a stored bundle."""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'catalog.sqlite3')
+        _gunzip(path, db_path)
+        db = sqlite3.connect(db_path)
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+class _BundleWriter:
+    """
+    Builds a bundle in a temporary SQLite file. Other bundles can be
+    attached so rows are copied and compared in SQL rather than in memory.
+    save() compresses it into place; anything unsaved is discarded on exit.
+    """
+
+    def __init__(self, meta):
+        self._workdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._workdir, 'catalog.sqlite3')
+        self.db = sqlite3.connect(self._path)
+        self.db.executescript(SCHEMA)
+        self.db.executemany('INSERT INTO meta VALUES (?, ?)', [(key, str(value)) for key, value in meta.items()])
+
+    def attach(self, path, alias):
+        attached = os.path.join(self._workdir, f'{alias}.sqlite3')
+        _gunzip(path, attached)
+        self.db.execute('ATTACH DATABASE ? AS ' + alias, (attached,))
+
+    def count(self, sql):
+        return self.db.execute(sql).fetchone()[0]
+
+    def save(self, path):
+        self.db.commit()
+        for alias, in self.db.execute("SELECT name FROM pragma_database_list WHERE name NOT IN ('main', 'temp')"):
+            self.db.execute('DETACH DATABASE ' + alias)
+        self.db.execute('VACUUM')
+        self.db.close()
+        # A unique name in the target directory, so concurrent exports never
+        # write into the same partial file and os.replace stays atomic.
+        directory, name = os.path.split(path)
+        fd, partial = tempfile.mkstemp(dir=directory, prefix=name + '.', suffix='.partial')
+        try:
+            with open(self._path, 'rb') as source, os.fdopen(fd, 'wb') as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9) as target:
+                shutil.copyfileobj(source, target)
+            # mkstemp creates the file readable by its owner only.
+            os.chmod(partial, 0o644)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.db.close()
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def latest_snapshot():
+    return CatalogSnapshot.objects.order_by('-version').first()
+
+
+def _insert_batches(db, sql, rows, size=ITERATOR_CHUNK_SIZE):
+    for batch in iter(lambda: list(itertools.islice(rows, size)), []):
+        db.executemany(sql, batch)
+
+
+def _add_thumbnails(writer, has_previous):
+    if has_previous:
+        # Unchanged images keep the previous version's thumbnail.
+        writer.db.execute(
+            'INSERT INTO thumbnails SELECT old_t.* FROM old.thumbnails old_t '
+            'JOIN products ON products.id = old_t.product_id AND products.image = old_t.image'
+        )
+    missing = writer.db.execute(
+        "SELECT id, image FROM products WHERE image != '' "
+        "AND id NOT IN (SELECT product_id FROM thumbnails) ORDER BY id"
+    ).fetchall()
+    # Placeholder images are often shared by many products.
+    thumbnail = functools.lru_cache(maxsize=256)(make_thumbnail)
+    rows = ((pk, image, thumbnail(image)) for pk, image in missing)
+    _insert_batches(writer.db, 'INSERT INTO thumbnails VALUES (?, ?, ?)', (row for row in rows if row[2] is not None))
+
+
+def export_snapshot(keep=None):
+    """
+    Write the next catalog version and prune old ones (ESHOP_CATALOG_SNAPSHOT_KEEP).
+    Returns (snapshot, created); created is False when nothing changed.
+    """
+    previous = latest_snapshot()
+    has_previous = previous is not None and os.path.exists(previous.file.path)
+    version = previous.version + 1 if previous else 1
+    meta = {'format': FORMAT, 'kind': 'full', 'version': version, 'created_at': timezone.now().isoformat()}
+
+    with _BundleWriter(meta) as writer:
+        insert = f"INSERT INTO products VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})"
+        _insert_batches(writer.db, insert, _product_rows())
+        products = writer.count('SELECT count(*) FROM products')
+        changed, removed = products, 0
+        if has_previous:
+            writer.attach(previous.file.path, 'old')
+            changed = writer.count(
+                'SELECT count(*) FROM products LEFT JOIN old.products old_p USING (id) '
+                'WHERE old_p.hash IS NOT products.hash'
+            )
+            removed = writer.count(
+                'SELECT count(*) FROM old.products old_p LEFT JOIN products USING (id) WHERE products.id IS NULL'
+            )
+            if not changed and not removed:
+                return previous, False
+        _add_thumbnails(writer, has_previous)
+
+        name = f'catalog-v{version}.sqlite3.gz'
+        path = os.path.join(_snapshot_dir(), name)
+        writer.save(path)
+
+    snapshot = CatalogSnapshot.objects.create(
+        version=version, file=f'{SNAPSHOT_DIR}/{name}', size=os.path.getsize(path), sha256=_file_digest(path),
+        products=products, changed=changed, removed=removed,
+    )
+    prune_snapshots(keep)
+    return snapshot, True
+
+
+def prune_snapshots(keep=None):
+    """
+    Delete all but the newest `keep` snapshots, and every delta that does
+    not lead from a kept snapshot to the latest one.
+    """
+    keep = keep or getattr(settings, 'ESHOP_CATALOG_SNAPSHOT_KEEP', 10)
+    with transaction.atomic():
+        stale = list(CatalogSnapshot.objects.order_by('-version')[keep:])
+        CatalogSnapshot.objects.filter(pk__in=[snapshot.pk for snapshot in stale]).delete()
+    for snapshot in stale:
+        if os.path.exists(snapshot.file.path):
+            os.unlink(snapshot.file.path)
+    kept = set(CatalogSnapshot.objects.values_list('version', flat=True))
+    latest = max(kept, default=None)
+    for name in os.listdir(_snapshot_dir()):
+        if name.startswith('delta-') and name.endswith('.sqlite3.gz'):
+            base, target = (int(part) for part in name[len('delta-'):-len('.sqlite3.gz')].split('-'))
+            if base not in kept or target != latest:
+                os.unlink(os.path.join(_snapshot_dir(), name))
+
+
+def delta_path(base, target):
+    """
+    Path of the delta bundle taking a device from CatalogSnapshot `base` to
+    `target`, built on first request and then kept next to the snapshots.
+    """
+    path = os.path.join(_snapshot_dir(), f'delta-{base.version}-{target.version}.sqlite3.gz')
+    if os.path.exists(path):
+        return path
+    meta = {
+        'format': FORMAT, 'kind': 'delta', 'version': target.version, 'base_version': base.version,
+        'created_at': timezone.now().isoformat(),
+    }
+    with _BundleWriter(meta) as writer:
+        writer.attach(base.file.path, 'old')
+        writer.attach(target.file.path, 'new')
+        writer.db.executescript("""
+            INSERT INTO products
+                SELECT new_p.* FROM new.products new_p LEFT JOIN old.products old_p USING (id)
+                WHERE old_p.hash IS NOT new_p.hash;
+            INSERT INTO thumbnails
+                SELECT new_t.* FROM new.thumbnails new_t
+                JOIN products ON products.id = new_t.product_id
+                LEFT JOIN old.thumbnails old_t ON old_t.product_id = new_t.product_id
+                WHERE old_t.image IS NOT new_t.image;
+            INSERT INTO removed
+                SELECT old_p.id FROM old.products old_p LEFT JOIN new.products new_p USING (id)
+                WHERE new_p.id IS NULL;
+        """)
+        writer.save(path)
+    return path
@@ -0,0 +1,133 @@
+"""
+Product compatibility graph.
+
+An in-memory adjacency index over the related_products and
+compatible_modules through tables, loaded with two id-only queries and
+cached per process. Edits through the M2M managers and product deletions
+invalidate it at once; bulk inserts and other worker processes' edits are
+picked up after ESHOP_COMPAT_GRAPH_TTL seconds. Graph walks never touch the
+database, so only the final product rows cost a query.
+"""
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from .metrics import CACHE_REQUESTS
+from .models import Product
+
+RELATED = 'related'
+COMPATIBLE = 'compatible'
+
+
+class CompatibilityGraph:
+    def __init__(self, related_edges=(), compatible_edges=()):
+        self._out = {RELATED: {}, COMPATIBLE: {}}
+        self._in = {RELATED: {}, COMPATIBLE: {}}
+        for kind, edges in ((RELATED, related_edges), (COMPATIBLE, compatible_edges)):
+            out, incoming = self._out[kind], self._in[kind]
+            for source, target in edges:
+                out.setdefault(source, []).append(target)
+                incoming.setdefault(target, []).append(source)
+
+    @classmethod
+    def load(cls):
+        related = Product.related_products.through.objects.values_list('from_product_id', 'to_product_id')
+        compatible = Product.compatible_modules.through.objects.values_list('from_product_id', 'to_product_id')
+        return cls(related.iterator(chunk_size=10000), compatible.iterator(chunk_size=10000))
+
+    def neighbours(self, product_id, kind=COMPATIBLE, direction='out'):
+        """
+        Direct neighbours. 'out' follows the field (a PLC's
+        compatible_modules), 'in' the reverse relation (the PLCs an HMI is
+        listed for), 'both' either.
+        """
+        found = []
+        if direction in ('out', 'both'):
+            found.extend(self._out[kind].get(product_id, ()))
+        if direction in ('in', 'both'):
+            found.extend(self._in[kind].get(product_id, ()))
+        return found
+
+    def compatible_within(self, product_id, hops=1, kinds=(COMPATIBLE,), direction='out'):
+        """
+        Breadth-first walk from `product_id`. Returns {product_id: hops}
+        for every product reachable in at most `hops` steps, excluding the
+        start itself.
+        """
+        distances = {product_id: 0}
+        queue = deque([product_id])
+        while queue:
+            current = queue.popleft()
+            depth = distances[current]
+            if depth == hops:
+                continue
+            for kind in kinds:
+                for neighbour in self.neighbours(current, kind, direction):
+                    if neighbour not in distances:
+                        distances[neighbour] = depth + 1
+                        queue.append(neighbour)
+        del distances[product_id]
+        return distances
+
+    def bill_of_materials(self, product_ids):
+        """
+        Everything needed for a complete system built around `product_ids`:
+        the transitive closure over compatible_modules. Returns a list of
+        (product_id, depth, required_by) in breadth-first order, the
+        selected products first with depth 0 and required_by None.
+        """
+        bom = [(product_id, 0, None) for product_id in dict.fromkeys(product_ids)]
+        seen = {product_id for product_id, _, _ in bom}
+        queue = deque(bom)
+        while queue:
+            current, depth, _ = queue.popleft()
+            for module in self._out[COMPATIBLE].get(current, ()):
+                if module not in seen:
+                    seen.add(module)
+                    entry = (module, depth + 1, current)
+                    bom.append(entry)
+                    queue.append(entry)
+        return bom
+
+
+_lock = threading.Lock()
+_cached_graph = None
+_cached_until = 0.0
+
+
+def get_graph():
+    """Return the cached graph, reloading it once invalidated or expired."""
+    global _cached_graph, _cached_until
+    graph = _cached_graph
+    if graph is not None and time.monotonic() < _cached_until:
+        CACHE_REQUESTS.labels(cache='compat_graph', result='hit').inc()
+        return graph
+    with _lock:
+        if _cached_graph is None or time.monotonic() >= _cached_until:
+            CACHE_REQUESTS.labels(cache='compat_graph', result='miss').inc()
+            _cached_graph = CompatibilityGraph.load()
+            _cached_until = time.monotonic() + getattr(settings, 'ESHOP_COMPAT_GRAPH_TTL', 300)
+        return _cached_graph
+
+
+def invalidate_graph():
+    global _cached_graph, _cached_until
+    with _lock:
+        _cached_graph = None
+        _cached_until = 0.0
+
+
+@receiver(m2m_changed, sender=Product.related_products.through)
+@receiver(m2m_changed, sender=Product.compatible_modules.through)
+def _links_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_graph()
+
+
+@receiver(post_delete, sender=Product)
+def _product_deleted(sender, **kwargs):
+    invalidate_graph()
@@ -0,0 +1,195 @@
+"""
+Exchange rates and currency conversion for quotations.
+
+Rates come from the ExchangeRate table (admin entry or `manage.py
+load_exchange_rates`) and, optionally, from a local file named by
+ESHOP_EXCHANGE_RATES_FILE. They are cached per process for
+ESHOP_EXCHANGE_RATE_TTL seconds, so converting a whole report costs at most
+one query for the rate table.
+"""
+import csv
+import json
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import Case, DecimalField, F, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .metrics import CACHE_REQUESTS
+from .models import Currency, ExchangeRate
+
+TWO_PLACES = Decimal('0.01')
+
+
+class ExchangeRateMissing(LookupError):
+    pass
+
+
+class RateTable:
+    """
+    An immutable snapshot of the known rates, keyed by (source, target).
+    Inverse rates are derived when only one direction is stored.
+    """
+
+    def __init__(self, rates):
+        self._rates = {key: Decimal(value) for key, value in rates.items()}
+
+    def has_rate(self, source, target):
+        return (
+            source == target
+            or (source, target) in self._rates
+            or (target, source) in self._rates
+        )
+
+    def rate(self, source, target):
+        if source == target:
+            return Decimal(1)
+        if (source, target) in self._rates:
+            return self._rates[(source, target)]
+        if (target, source) in self._rates:
+            return Decimal(1) / self._rates[(target, source)]
+        raise ExchangeRateMissing(f"No exchange rate from {source} to {target}.")
+
+    def convert(self, amount, source, target):
+        if amount is None:
+            return None
+        converted = Decimal(amount) * self.rate(source, target)
+        return converted.quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+    def convert_rows(self, rows, target, amount_key='total_amount', currency_key='currency'):
+        """
+        Convert a list of dict rows (e.g. from `.values()`) in one pass,
+        adding `<amount_key>_<target>` to each row. Rows whose rate is
+        unknown get None instead of raising.
+        """
+        out_key = f"{amount_key}_{target.lower()}"
+        factors = {}
+        for row in rows:
+            source = row[currency_key]
+            if source not in factors:
+                factors[source] = self.rate(source, target) if self.has_rate(source, target) else None
+            factor = factors[source]
+            amount = row[amount_key]
+            row[out_key] = (
+                None if factor is None or amount is None
+                else (Decimal(amount) * factor).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+            )
+        return rows
+
+
+_lock = threading.Lock()
+_cached_table = None
+_cached_until = 0.0
+
+
+def read_rates_file(path):
+    """
+    Read rates from a CSV (columns: source,target,rate) or a JSON file
+    (a list of {"source": ..., "target": ..., "rate": ...} objects).
+    Returns a dict keyed by (source, target).
+    """
+    path = str(path)
+    with open(path, newline='', encoding='utf-8') as handle:
+        if path.lower().endswith('.json'):
+            rows = json.load(handle)
+        else:
+            rows = list(csv.DictReader(handle))
+
+    valid = set(Currency.values)
+    rates = {}
+    for row in rows:
+        source = row['source'].strip().upper()
+        target = row['target'].strip().upper()
+        if source not in valid or target not in valid:
+            raise ValueError(f"Unsupported currency pair {source}/{target} in {path}.")
+        rates[(source, target)] = Decimal(str(row['rate']).strip())
+    return rates
+
+
+def _load_rates():
+    rates = {}
+    rates_file = getattr(settings, 'ESHOP_EXCHANGE_RATES_FILE', None)
+    if rates_file:
+        rates.update(read_rates_file(rates_file))
+    # Admin-entered rows take precedence over the file.
+    for source, target, rate in ExchangeRate.objects.values_list(
+        'source_currency', 'target_currency', 'rate'
+    ):
+        rates[(source, target)] = rate
+    return RateTable(rates)
+
+
+def get_rates():
+    """Return the cached RateTable, reloading it once the TTL has expired."""
+    global _cached_table, _cached_until
+    now = time.monotonic()
+    table = _cached_table
+    if table is not None and now < _cached_until:
+        CACHE_REQUESTS.labels(cache='exchange_rates', result='hit').inc()
+        return table
+    with _lock:
+        if _cached_table is None or time.monotonic() >= _cached_until:
+            CACHE_REQUESTS.labels(cache='exchange_rates', result='miss').inc()
+            _cached_table = _load_rates()
+            _cached_until = time.monotonic() + getattr(settings, 'ESHOP_EXCHANGE_RATE_TTL', 300)
+        return _cached_table
+
+
+def invalidate_rates():
+    global _cached_table, _cached_until
+    with _lock:
+        _cached_table = None
+        _cached_until = 0.0
+
+
+def convert(amount, source, target):
+    return get_rates().convert(amount, source, target)
+
+
+def total_field_name(currency):
+    return f"total_{currency.lower()}"
+
+
+def annotate_totals(queryset, currencies=None, rates=None):
+    """
+    Annotate `total_bdt`, `total_usd`, ... on a Quotation queryset so that
+    every row is converted inside the same SELECT. Pairs without a known
+    rate are annotated as NULL.
+    """
+    rates = rates or get_rates()
+    currencies = currencies or Currency.values
+    annotations = {}
+    for target in currencies:
+        whens = [
+            When(currency=source, then=F('total_amount') * Value(rates.rate(source, target)))
+            for source in Currency.values
+            if rates.has_rate(source, target)
+        ]
+        annotations[total_field_name(target)] = Case(
+            *whens,
+            default=None,
+            output_field=DecimalField(max_digits=20, decimal_places=2),
+        )
+    return queryset.annotate(**annotations)
+
+
+def quotation_totals(quotation, rates=None):
+    """
+    Return [(currency, total), ...] for a quotation: its own currency first,
+    followed by every other currency we have a rate for.
+    """
+    rates = rates or get_rates()
+    totals = [(quotation.currency, quotation.total_amount)]
+    for currency in Currency.values:
+        if currency != quotation.currency and rates.has_rate(quotation.currency, currency):
+            totals.append((currency, rates.convert(quotation.total_amount, quotation.currency, currency)))
+    return totals
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def _exchange_rate_changed(sender, **kwargs):
+    invalidate_rates()
@@ -3,7 +3,8 @@ from django.core.exceptions import ValidationError
 from django.forms import inlineformset_factory
 from django.forms.models import ModelChoiceIteratorValue
 
-from .models import Brand, Product, Quotation, QuotationLine
+from .currency import get_rates
+from .models import Brand, Currency, Product, Quotation, QuotationLine
 
 ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/gif']
 
@@ -34,15 +35,14 @@ class ProductForm(forms.ModelForm):
 class ProductSelectWidget(forms.Select):
     def create_option(self, name, value, label, selected, index, subindex=None, attrs=None):
         # If value is a ModelChoiceIteratorValue, extract its underlying value.
+        # The iterator already carries the product, so no query per option.
+        product = None
         if isinstance(value, ModelChoiceIteratorValue):
+            product = value.instance
             value = value.value
         option_dict = super().create_option(name, value, label, selected, index, subindex=subindex, attrs=attrs)
-        if value:
-            try:
-                product = self.choices.queryset.get(pk=value)
-                option_dict['attrs']['data-price'] = str(product.original_price)
-            except Product.DoesNotExist:
-                pass
+        if product is not None:
+            option_dict['attrs']['data-price'] = str(product.original_price)
         return option_dict
 
 #
@@ -58,11 +58,19 @@ class QuotationHeaderForm(forms.ModelForm):
 
     class Meta:
         model = Quotation
-        fields = ['subject', 'notes']
+        fields = ['subject', 'notes', 'currency']
         widgets = {
-            'notes': forms.Textarea(attrs={'class': 'form-control', 'rows': 2})
+            'notes': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
+            'currency': forms.Select(attrs={'class': 'form-select'}),
         }
 
+    def clean_currency(self):
+        # Catalog prices are in BDT, so the quotation currency needs a rate from BDT.
+        currency = self.cleaned_data.get('currency')
+        if currency and not get_rates().has_rate(Currency.BDT, currency):
+            raise ValidationError(f"No exchange rate is configured for {currency}.")
+        return currency
+
 class QuotationLineForm(forms.ModelForm):
     product = forms.ModelChoiceField(
         queryset=Product.objects.all(),
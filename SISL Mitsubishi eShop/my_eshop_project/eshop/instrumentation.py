@@ -0,0 +1,219 @@
+"""
+Request-level performance instrumentation.
+
+RequestInstrumentationMiddleware records, per request, the wall time,
+database query count and time (through connection.execute_wrapper), the
+template render time and the response size, tagged by URL name. Slow
+requests are logged to the "eshop.slow_requests" logger together with
+their SQL, rolling p50/p95/p99 per URL name are kept in memory for the
+staff-only performance endpoint, and a Server-Timing header is added.
+Wall and database time also feed the eshop_request_* metrics at /metrics.
+
+Configure with ESHOP_INSTRUMENTATION in settings. When ENABLED is False
+the middleware removes itself at startup, so it costs nothing per request.
+Aggregates are per worker process.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .metrics import REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, REQUEST_SECONDS
+
+slow_logger = logging.getLogger('eshop.slow_requests')
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Requests slower than this are logged with their SQL.
+    'SLOW_REQUEST_MS': 500,
+    # Number of most recent requests per URL name kept for percentiles.
+    'WINDOW': 1000,
+    'SERVER_TIMING': True,
+    # Cap on SQL statements kept per request for the slow log.
+    'MAX_LOGGED_QUERIES': 50,
+}
+
+_current = contextvars.ContextVar('eshop_request_stats', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ESHOP_INSTRUMENTATION', {})}
+
+
+class RequestStats:
+    __slots__ = (
+        'max_queries', 'wall_ms', 'db_count', 'db_ms', 'template_ms',
+        'response_bytes', 'queries', 'template_depth',
+    )
+
+    def __init__(self, max_queries):
+        self.max_queries = max_queries
+        self.wall_ms = 0.0
+        self.db_count = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.response_bytes = None
+        self.queries = []
+        self.template_depth = 0
+
+    def add_query(self, sql, duration_ms):
+        self.db_count += 1
+        self.db_ms += duration_ms
+        if len(self.queries) < self.max_queries:
+            self.queries.append((duration_ms, sql))
+
+
+def current_stats():
+    """Stats of the request being handled in this context, or None."""
+    return _current.get()
+
+
+class _QueryRecorder:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.stats.add_query(sql, (time.perf_counter() - started) * 1000)
+
+
+_template_timer_installed = False
+_install_lock = threading.Lock()
+
+
+def _install_template_timer():
+    """
+    Wrap Template.render once per process. Only the outermost render of a
+    request is timed, so included templates are not counted twice.
+    """
+    global _template_timer_installed
+    from django.template.base import Template
+
+    with _install_lock:
+        if _template_timer_installed:
+            return
+        original_render = Template.render
+
+        def timed_render(self, context):
+            stats = _current.get()
+            if stats is None:
+                return original_render(self, context)
+            stats.template_depth += 1
+            started = time.perf_counter()
+            try:
+                return original_render(self, context)
+            finally:
+                stats.template_depth -= 1
+                if stats.template_depth == 0:
+                    stats.template_ms += (time.perf_counter() - started) * 1000
+
+        Template.render = timed_render
+        _template_timer_installed = True
+
+
+class RollingStats:
+    """Last N requests per URL name, with percentiles computed on demand."""
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, url_name, stats):
+        sample = (stats.wall_ms, stats.db_count, stats.db_ms, stats.template_ms, stats.response_bytes or 0)
+        with self._lock:
+            samples = self._samples.get(url_name)
+            if samples is None:
+                samples = self._samples[url_name] = deque(maxlen=self.window)
+            samples.append(sample)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    @staticmethod
+    def _percentile(sorted_values, fraction):
+        index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def snapshot(self):
+        with self._lock:
+            copies = {name: list(samples) for name, samples in self._samples.items()}
+        report = {}
+        for name, samples in sorted(copies.items()):
+            walls = sorted(sample[0] for sample in samples)
+            count = len(samples)
+            report[name] = {
+                'count': count,
+                'p50_ms': round(self._percentile(walls, 0.50), 2),
+                'p95_ms': round(self._percentile(walls, 0.95), 2),
+                'p99_ms': round(self._percentile(walls, 0.99), 2),
+                'avg_queries': round(sum(sample[1] for sample in samples) / count, 2),
+                'avg_db_ms': round(sum(sample[2] for sample in samples) / count, 2),
+                'avg_template_ms': round(sum(sample[3] for sample in samples) / count, 2),
+                'avg_response_bytes': round(sum(sample[4] for sample in samples) / count),
+            }
+        return report
+
+
+rolling_stats = RollingStats(DEFAULTS['WINDOW'])
+
+
+class RequestInstrumentationMiddleware:
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = config['SLOW_REQUEST_MS']
+        self.server_timing = config['SERVER_TIMING']
+        self.max_queries = config['MAX_LOGGED_QUERIES']
+        rolling_stats.window = config['WINDOW']
+        _install_template_timer()
+
+    def __call__(self, request):
+        stats = RequestStats(self.max_queries)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_QueryRecorder(stats)):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        stats.wall_ms = (time.perf_counter() - started) * 1000
+        if not response.streaming:
+            stats.response_bytes = len(response.content)
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.url_name if match else None) or 'unresolved'
+        rolling_stats.record(url_name, stats)
+        REQUEST_SECONDS.labels(view=url_name).observe(stats.wall_ms / 1000)
+        REQUEST_DB_SECONDS.labels(view=url_name).observe(stats.db_ms / 1000)
+        REQUEST_DB_QUERIES.labels(view=url_name).observe(stats.db_count)
+
+        if stats.wall_ms >= self.slow_ms:
+            self._log_slow_request(request, url_name, stats)
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={stats.db_ms:.1f};desc="{stats.db_count} queries", '
+                f'tpl;dur={stats.template_ms:.1f}, '
+                f'total;dur={stats.wall_ms:.1f}'
+            )
+        return response
+
+    def _log_slow_request(self, request, url_name, stats):
+        slowest = sorted(stats.queries, reverse=True)[:10]
+        sql = "\n".join(f"  {duration:.1f}ms  {statement}" for duration, statement in slowest)
+        slow_logger.warning(
+            "Slow request %s %s (%s): %.1fms total, %d queries in %.1fms, templates %.1fms, %s bytes\n%s",
+            request.method, request.path, url_name, stats.wall_ms, stats.db_count,
+            stats.db_ms, stats.template_ms, stats.response_bytes, sql,
+        )
@@ -0,0 +1,87 @@
+"""
+Maintenance jobs run by the scheduler (see eshop.scheduler and
+ESHOP_SCHEDULED_JOBS). Each returns a dict of counts that ends up in the
+JobRun's result.
+"""
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import EmailStatus, OrderStatus, OutboundEmail, Quotation
+from .workflow import bulk_transition
+
+
+def clean_quotation_files(max_age_days=30):
+    """
+    Delete quotation PDFs under MEDIA_ROOT/quotations older than
+    `max_age_days`. The quotation PDF page renders on demand, so the files
+    only matter as email attachments: those of emails still queued are kept.
+    """
+    directory = os.path.join(settings.MEDIA_ROOT, 'quotations')
+    stats = {'removed': 0, 'freed_bytes': 0, 'kept_for_outbox': 0}
+    if not os.path.isdir(directory):
+        return stats
+    cutoff = time.time() - max_age_days * 86400
+    queued = {
+        os.path.realpath(path)
+        for path in OutboundEmail.objects.filter(status=EmailStatus.QUEUED)
+        .exclude(attachment_path='').values_list('attachment_path', flat=True)
+    }
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.stat().st_mtime >= cutoff:
+                continue
+            if os.path.realpath(entry.path) in queued:
+                stats['kept_for_outbox'] += 1
+                continue
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                # Removed by another process in the meantime.
+                continue
+            stats['removed'] += 1
+            stats['freed_bytes'] += size
+    return stats
+
+
+def expire_stale_quotations(max_age_days=30):
+    """Cancel quotations still pending after `max_age_days`, through the workflow."""
+    cutoff = timezone.now() - timedelta(days=max_age_days)
+    changes = bulk_transition(
+        Quotation.objects.filter(status=OrderStatus.PENDING, created_at__lt=cutoff),
+        OrderStatus.CANCELED,
+        note=f"Expired after {max_age_days} days pending.",
+    )
+    return {'expired': len(changes)}
+
+
+def optimize_database(vacuum=False, using='default'):
+    """
+    Refresh SQLite's query planner statistics (ANALYZE, PRAGMA optimize)
+    and, with `vacuum`, rebuild the file to reclaim free pages. VACUUM
+    locks the database while it runs; schedule it off-hours. Other
+    backends maintain their statistics themselves and are skipped.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return {'skipped': connection.vendor}
+
+    def size(cursor):
+        cursor.execute('PRAGMA page_count')
+        pages = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_size')
+        return pages * cursor.fetchone()[0]
+
+    with connection.cursor() as cursor:
+        stats = {'size_before': size(cursor)}
+        cursor.execute('ANALYZE')
+        cursor.execute('PRAGMA optimize')
+        if vacuum:
+            cursor.execute('VACUUM')
+        stats['size_after'] = size(cursor)
+    return stats
@@ -0,0 +1,104 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+
+from eshop.models import Brand, Category, Product
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _payload_bytes(queryset):
+    """Size of the column values the database sends back for `queryset`."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return sum(len(str(value)) for row in cursor.fetchall() for value in row if value is not None)
+
+
+def _best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare a category listing built from full Product rows with one built "
+        "from Product.objects.cards(): bytes fetched, fetch time and render time "
+        "with a cold and a warm card cache. All benchmark rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                category = self._create_category(options['products'])
+                self._benchmark(category, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _create_category(self, count):
+        category = Category.objects.create(name='__benchmark_cards__')
+        brand = Brand.objects.create(name='__benchmark_cards__')
+        Product.objects.bulk_create(
+            [
+                Product(
+                    category=category, brand=brand,
+                    name=f'__benchmark_cards__ FR-D720S-{i}K', sku=f'__benchmark_cards__{i}',
+                    original_price=Decimal('1250.00'), image='products/placeholder.png',
+                    country_of_origin='Japan',
+                    description='Compact inverter with built-in RS-485 and safety stop. ' * 20,
+                    input_voltage='1-phase 200-240V', output_voltage='3-phase 200-240V',
+                    rated_output_power='0.4 kW', dimensions='68 x 128 x 80.5',
+                )
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
+        return category
+
+    def _benchmark(self, category, repeat):
+        full = Product.objects.filter(category=category)
+        cards = Product.objects.cards().filter(category=category)
+
+        for label, queryset in (('full rows', full), ('cards()', cards)):
+            payload = _payload_bytes(queryset)
+            fetch_ms = _best_of(repeat, lambda: list(queryset.all()))
+
+            # Like a request: fresh instances every time, then the template.
+            def page():
+                render_to_string('category_filter.html', {'cat_name': category.name, 'products': queryset.all()})
+
+            queries = []
+
+            def count_query(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with override_settings(ESHOP_PRODUCT_CARD_CACHE_TTL=0):
+                with connection.execute_wrapper(count_query):
+                    page()
+                uncached_ms = _best_of(repeat, page)
+            caches[getattr(settings, 'ESHOP_PRODUCT_CARD_CACHE', 'default')].clear()
+            cold_ms = _best_of(1, page)
+            warm_ms = _best_of(repeat, page)
+
+            self.stdout.write(
+                f"{label:<10} {payload / 1024:>6.0f} KiB fetched in {fetch_ms:.1f}ms; page with {len(queries)} "
+                f"queries: {uncached_ms:.1f}ms uncached, {cold_ms:.1f}ms cold card cache, {warm_ms:.1f}ms warm"
+            )
@@ -0,0 +1,88 @@
+import io
+import resource
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from eshop.models import Brand, Category, Product, Quotation, QuotationLine
+from eshop.pdf import render_quotation
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Render a synthetic quotation with many lines and report render time, "
+        "pages/second, Python peak allocation and process peak RSS. "
+        "All benchmark rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=50)
+        parser.add_argument('--output', help="Also write the rendered PDF to this path.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                quotation = self._create_quotation(options['lines'], options['products'])
+                self._benchmark(quotation, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _create_quotation(self, line_count, product_count):
+        category = Category.objects.create(name='__benchmark_pdf__')
+        brand = Brand.objects.create(name='__benchmark_pdf__')
+        products = Product.objects.bulk_create([
+            Product(
+                category=category, brand=brand,
+                name=f'__benchmark_pdf__ FR-D720S-{i}K', sku=f'__benchmark_pdf__{i}',
+                original_price=Decimal('1250.00'), image='products/placeholder.png',
+                country_of_origin='Japan',
+            )
+            for i in range(product_count)
+        ])
+        quotation = Quotation.objects.create(notes='PDF benchmark')
+        QuotationLine.objects.bulk_create(
+            [
+                QuotationLine(
+                    quotation=quotation, product=products[i % product_count],
+                    description=f'Line {i}', quantity=1 + i % 7,
+                    unit_price=Decimal('1250.00'), discount_percent=Decimal('5.00'),
+                )
+                for i in range(line_count)
+            ],
+            batch_size=1000,
+        )
+        quotation.compute_total()
+        return quotation
+
+    def _benchmark(self, quotation, options):
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        pages = render_quotation(quotation, buffer)
+        elapsed = time.perf_counter() - started
+        # ru_maxrss is reported in kilobytes on Linux.
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        # tracemalloc slows rendering down, so measure allocations in a second pass.
+        tracemalloc.start()
+        render_quotation(quotation, io.BytesIO())
+        _, peak_alloc = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if options['output']:
+            with open(options['output'], 'wb') as handle:
+                handle.write(buffer.getvalue())
+
+        self.stdout.write(
+            f"{options['lines']} lines -> {pages} pages, {len(buffer.getvalue()) / 1024:.0f} KiB in {elapsed:.2f}s "
+            f"({pages / elapsed:.1f} pages/s)\n"
+            f"Python peak allocation: {peak_alloc / 1024 / 1024:.1f} MiB, process peak RSS: {peak_rss_mb:.1f} MiB"
+        )
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from eshop.ratelimit import check
+
+
+class Command(BaseCommand):
+    help = (
+        "Time one rate-limit check (a token taken from a bucket) against "
+        "the ESHOP_RATE_LIMIT_CACHE backend and the in-process fallback. "
+        "Limits are raised for the run so no check is refused early."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=5000, help="Checks per backend.")
+        parser.add_argument('--clients', type=int, default=100, help="Distinct client addresses to spread them over.")
+        parser.add_argument('--scope', default='search', help="ESHOP_RATE_LIMITS scope to check.")
+
+    def _time(self, scope, checks, clients):
+        started = time.perf_counter()
+        for index in range(checks):
+            check(scope, f'benchmark:{index % clients}')
+        return (time.perf_counter() - started) / checks * 1e6
+
+    def handle(self, *args, **options):
+        scope, checks, clients = options['scope'], options['checks'], options['clients']
+        limits = {scope: {'rate': '1000000/s', 'burst': 1000000}}
+        backends = [
+            (f"cache {getattr(settings, 'ESHOP_RATE_LIMIT_CACHE', 'default')!r}", {}),
+            ("in-process fallback", {'ESHOP_RATE_LIMIT_CACHE': None}),
+        ]
+        for label, overrides in backends:
+            with override_settings(ESHOP_RATE_LIMITS=limits, ESHOP_RATE_LIMIT_ENABLED=True, **overrides):
+                per_check_us = self._time(scope, checks, clients)
+            line = f"  {per_check_us:8.1f}us per check  {label}"
+            self.stdout.write(self.style.SUCCESS(line) if per_check_us < 1000 else self.style.WARNING(line))
@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from eshop.recommendations import DEFAULT_MAX_BASKET, DEFAULT_TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the \"customers also quoted\" recommendations from quotation "
+        "co-occurrence. Run nightly for a full rebuild, or more often with "
+        "--since-days to refresh only recently quoted products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help="Neighbours stored per product.")
+        parser.add_argument('--since-days', type=float, default=None,
+                            help="Only recompute products quoted in the last N days.")
+        parser.add_argument('--max-basket', type=int, default=DEFAULT_MAX_BASKET,
+                            help="Skip quotations with more distinct products than this.")
+        parser.add_argument('--min-count', type=int, default=1,
+                            help="Minimum quotations two products must share to be recommended.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since_days'] is not None:
+            since = timezone.now() - timedelta(days=options['since_days'])
+        started = time.monotonic()
+        stats = build_recommendations(
+            top_k=options['top_k'],
+            since=since,
+            max_basket=options['max_basket'],
+            min_count=options['min_count'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {stats['recommendations']} recommendation(s) for {stats['products']} product(s) "
+            f"from {stats['baskets']} quotation(s) ({stats['skipped_baskets']} oversized skipped) "
+            f"in {time.monotonic() - started:.2f}s."
+        ))
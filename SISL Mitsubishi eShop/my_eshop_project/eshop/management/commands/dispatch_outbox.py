@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from eshop.outbox import DEFAULT_BATCH_SIZE, dispatch
+
+
+class Command(BaseCommand):
+    help = "Send queued outbox emails over a single reused mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=None,
+                            help="Dead-letter a message after this many failures (default: ESHOP_EMAIL_MAX_ATTEMPTS).")
+        parser.add_argument('--rate', type=float, default=None,
+                            help="Maximum messages per second (default: ESHOP_EMAIL_RATE_LIMIT).")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after trying this many messages.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox.")
+        parser.add_argument('--interval', type=float, default=10.0, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            stats = dispatch(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+                rate_limit=options['rate'],
+                limit=options['limit'],
+            )
+            elapsed = time.monotonic() - started
+            if any(stats.values()) or not options['loop']:
+                self.stdout.write(
+                    f"Sent {stats['sent']}, failed {stats['failed']}, dead-lettered {stats['dead']} "
+                    f"in {elapsed:.2f}s"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
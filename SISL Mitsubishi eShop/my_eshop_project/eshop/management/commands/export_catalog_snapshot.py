@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from eshop.catalog_snapshot import export_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the next offline catalog snapshot (products, specs, prices and "
+        "thumbnails) for field sales devices, served at /api/catalog/snapshot/. "
+        "Does nothing when the catalog has not changed since the last version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=None,
+                            help="Versions to keep (default ESHOP_CATALOG_SNAPSHOT_KEEP).")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        snapshot, created = export_snapshot(keep=options['keep'])
+        if not created:
+            self.stdout.write(f"Catalog unchanged; latest snapshot is still v{snapshot.version}.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported catalog v{snapshot.version}: {snapshot.products} product(s), "
+            f"{snapshot.changed} changed and {snapshot.removed} removed since the previous version, "
+            f"{snapshot.size / 1024:.0f} KiB in {time.monotonic() - started:.2f}s."
+        ))
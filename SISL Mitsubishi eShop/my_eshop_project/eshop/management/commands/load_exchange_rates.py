@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from eshop.currency import invalidate_rates, read_rates_file
+from eshop.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    help = "Load exchange rates from a local CSV (source,target,rate) or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to the rates file.")
+
+    def handle(self, *args, **options):
+        try:
+            rates = read_rates_file(options['path'])
+        except (OSError, KeyError, ValueError, ArithmeticError) as exc:
+            raise CommandError(f"Could not read rates: {exc}")
+
+        with transaction.atomic():
+            for (source, target), rate in rates.items():
+                ExchangeRate.objects.update_or_create(
+                    source_currency=source,
+                    target_currency=target,
+                    defaults={'rate': rate},
+                )
+        invalidate_rates()
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(rates)} exchange rate(s)."))
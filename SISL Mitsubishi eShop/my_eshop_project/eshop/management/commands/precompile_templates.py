@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import TemplateSyntaxError, engines
+
+from eshop.startup import template_names
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile every template the template loaders can find and report "
+        "the slowest. Run at deploy time: a syntax error in any template "
+        "fails the deploy instead of a request. Workers keep their compiled "
+        "templates in memory and compile the shop's own templates at startup "
+        "(the 'templates' step of ESHOP_PRELOAD)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', default=None, help="Only compile this app's templates, e.g. eshop.")
+        parser.add_argument('--limit', type=int, default=10, help="Slowest templates to list.")
+
+    def handle(self, *args, **options):
+        engine = engines['django'].engine
+        timings, errors = [], []
+        for name in template_names(options['app']):
+            started = time.perf_counter()
+            try:
+                engine.get_template(name)
+            except TemplateSyntaxError as exc:
+                errors.append((name, exc))
+                continue
+            timings.append(((time.perf_counter() - started) * 1000, name))
+
+        timings.sort(reverse=True)
+        for elapsed_ms, name in timings[:options['limit']]:
+            self.stdout.write(f"  {elapsed_ms:8.2f}ms  {name}")
+        for name, exc in errors:
+            self.stderr.write(f"{name}: {exc}")
+        if errors:
+            raise CommandError(f"{len(errors)} template(s) failed to compile.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled {len(timings)} template(s) in {sum(elapsed for elapsed, _ in timings):.0f}ms."
+        ))
@@ -0,0 +1,55 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from eshop.startup import measure_cold_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Start a fresh interpreter, import the WSGI entry point (preload "
+        "included) and report the cold-start time against "
+        "ESHOP_COLD_START_TARGET_MS, the preload steps and the slowest "
+        "module imports (python -X importtime)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='eshop_project.wsgi',
+                            help="Entry point to import, e.g. passenger_wsgi or eshop_project.asgi.")
+        parser.add_argument('--limit', type=int, default=25, help="Modules and packages to list.")
+        parser.add_argument('--sort', choices=('cumulative', 'self'), default='cumulative',
+                            help="Order modules by time including or excluding their own imports.")
+
+    def handle(self, *args, **options):
+        profile = measure_cold_start(options['module'], importtime=True)
+        limit = options['limit']
+
+        target_ms = getattr(settings, 'ESHOP_COLD_START_TARGET_MS', None)
+        summary = (
+            f"Cold start of {options['module']}: {profile.total_ms:.0f}ms "
+            f"(imports {profile.import_ms:.0f}ms, preload {sum(profile.preload_ms.values()):.0f}ms)"
+        )
+        if target_ms is None:
+            self.stdout.write(summary)
+        elif profile.total_ms <= target_ms:
+            self.stdout.write(self.style.SUCCESS(f"{summary}, target {target_ms}ms."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{summary}, over the {target_ms}ms target."))
+
+        if profile.preload_ms:
+            self.stdout.write("\nPreload:")
+            for step, ms in profile.preload_ms.items():
+                self.stdout.write(f"  {ms:8.1f}ms  {step}")
+
+        column = 2 if options['sort'] == 'cumulative' else 1
+        self.stdout.write(f"\nSlowest imports ({options['sort']}):")
+        for name, self_ms, cumulative_ms in sorted(profile.imports, key=lambda row: -row[column])[:limit]:
+            self.stdout.write(f"  {cumulative_ms:8.1f}ms  {self_ms:8.1f}ms self  {name}")
+
+        packages = Counter()
+        for name, self_ms, _ in profile.imports:
+            packages[name.split('.')[0]] += self_ms
+        self.stdout.write("\nImport time by top-level package (self):")
+        for package, ms in packages.most_common(limit):
+            self.stdout.write(f"  {ms:8.1f}ms  {package}")
@@ -0,0 +1,81 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from eshop.models import Quotation
+from eshop.pdf import render_many, render_merged_pdf, snapshot_quotations, write_zip
+
+
+class Command(BaseCommand):
+    help = (
+        "Render quotation PDFs in a process pool: one file per quotation, "
+        "a single merged PDF (--merge) or a ZIP archive (--zip)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', nargs='+', type=int, help="Quotation ids to render.")
+        parser.add_argument('--days', type=int, default=7,
+                            help="Render quotations created in the last N days (default: 7).")
+        parser.add_argument('--since', help="Render quotations created on or after YYYY-MM-DD.")
+        parser.add_argument('--status', help="Only quotations with this status code (P, C, X, D).")
+        parser.add_argument('--output', default='quotation_pdfs',
+                            help="Output directory, or file name with --merge/--zip.")
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--merge', action='store_true', help="Write all quotations into one PDF.")
+        group.add_argument('--zip', action='store_true', help="Write all PDFs into one ZIP archive.")
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Worker processes (default: CPU count, 1 disables the pool).")
+        parser.add_argument('--benchmark', action='store_true', help="Report documents and pages per second.")
+
+    def handle(self, *args, **options):
+        queryset = Quotation.objects.order_by('pk')
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+        elif options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError("--since must be in YYYY-MM-DD format.")
+            queryset = queryset.filter(created_at__date__gte=since.date())
+        else:
+            queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+        if options['status']:
+            queryset = queryset.filter(status=options['status'])
+
+        started = time.perf_counter()
+        datas = snapshot_quotations(queryset)
+        loaded = time.perf_counter()
+        if not datas:
+            self.stdout.write("No quotations matched.")
+            return
+
+        output = options['output']
+        if options['merge']:
+            path = output if output.endswith('.pdf') else output + '.pdf'
+            pages = render_merged_pdf(datas, path)
+            documents = len(datas)
+        elif options['zip']:
+            path = output if output.endswith('.zip') else output + '.zip'
+            with open(path, 'wb') as handle:
+                documents, pages = write_zip(render_many(datas, options['processes']), handle)
+        else:
+            path = output
+            os.makedirs(path, exist_ok=True)
+            documents = pages = 0
+            for file_name, content, page_count in render_many(datas, options['processes']):
+                with open(os.path.join(path, file_name), 'wb') as handle:
+                    handle.write(content)
+                documents += 1
+                pages += page_count
+        finished = time.perf_counter()
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered {documents} quotation(s), {pages} page(s) to {path}"))
+        if options['benchmark']:
+            render_seconds = finished - loaded
+            self.stdout.write(
+                f"Load: {loaded - started:.3f}s  Render: {render_seconds:.3f}s  "
+                f"{documents / render_seconds:.1f} docs/s  {pages / render_seconds:.1f} pages/s"
+            )
@@ -0,0 +1,78 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from eshop.benchmarks import (
+    DEFAULT_TOLERANCE, DRIVERS, SCENARIOS, compare, default_context, load_baseline, run_suite, save_baseline,
+)
+from eshop.currency import invalidate_rates
+from eshop.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the storefront views against a throwaway database filled with "
+        "synthetic data. Reports throughput, latency percentiles and queries per "
+        "request, and fails when results regress against --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=100)
+        parser.add_argument('--quotations', type=int, default=1000)
+        parser.add_argument('--lines-per-quotation', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help="Client threads, or concurrent ASGI connections, per scenario.")
+        parser.add_argument('--driver', choices=sorted(DRIVERS) + ['all'], default='client')
+        parser.add_argument('--scenario', action='append', choices=[s.name for s in SCENARIOS],
+                            help="Only run this scenario (repeatable).")
+        parser.add_argument('--baseline', help="Compare against this baseline JSON file.")
+        parser.add_argument('--save-baseline', help="Write the results to this baseline JSON file.")
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help="Allowed relative drift of p95 latency and throughput (default: 0.2).")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Keep the benchmark database, and its synthetic data, between runs.")
+
+    def handle(self, *args, **options):
+        baseline = load_baseline(options['baseline']) if options['baseline'] else None
+        scenarios = [s for s in SCENARIOS if not options['scenario'] or s.name in options['scenario']]
+        drivers = sorted(DRIVERS) if options['driver'] == 'all' else [options['driver']]
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        setup_test_environment(debug=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                invalidate_rates()
+                started = time.perf_counter()
+                counts = generate(
+                    products=options['products'], customers=options['customers'],
+                    quotations=options['quotations'], lines_per_quotation=options['lines_per_quotation'],
+                    seed=options['seed'],
+                )
+                self.stdout.write(f"Synthetic data {counts} in {time.perf_counter() - started:.1f}s")
+                results = run_suite(
+                    default_context(), scenarios, drivers,
+                    requests=options['requests'], concurrency=options['concurrency'],
+                    log=self.stdout.write,
+                )
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if options['save_baseline']:
+            meta = {key: options[key] for key in (
+                'products', 'customers', 'quotations', 'lines_per_quotation', 'seed', 'requests', 'concurrency',
+            )}
+            save_baseline(results, options['save_baseline'], meta)
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+
+        problems = compare(results, baseline, options['tolerance'])
+        if problems:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No regressions."))
@@ -0,0 +1,79 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from eshop.models import JobLock, JobRun, JobStatus
+from eshop.scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the maintenance jobs in ESHOP_SCHEDULED_JOBS on their cron "
+        "schedules. Start one per host, or several: each due run happens "
+        "once. SIGTERM/SIGINT stop it after the running job finishes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the jobs that are due, then exit.")
+        parser.add_argument('--run', action='append', default=[], metavar='JOB',
+                            help="Run this job now, whatever its schedule, then exit. Repeatable.")
+        parser.add_argument('--list', action='store_true', help="Show each job's schedule and last run.")
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help="Longest sleep between checks (default: ESHOP_SCHEDULER_POLL_INTERVAL).")
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler()
+        unknown = sorted(set(options['run']) - set(scheduler.jobs))
+        if unknown:
+            raise CommandError(f"Unknown job(s): {', '.join(unknown)}. Jobs: {', '.join(scheduler.jobs)}.")
+        scheduler.sync()
+
+        if options['list']:
+            self.list_jobs(scheduler)
+            return
+        if options['run']:
+            for name in options['run']:
+                run = scheduler.run_now(name)
+                if run is None:
+                    self.stderr.write(f"{name} is running on another scheduler.")
+                else:
+                    self.report(run)
+            return
+        if options['once']:
+            for run in scheduler.run_pending():
+                self.report(run)
+            return
+
+        poll_interval = options['poll_interval'] or getattr(settings, 'ESHOP_SCHEDULER_POLL_INTERVAL', 30)
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stop.set())
+        self.stdout.write(f"Scheduler {scheduler.owner} running {len(scheduler.jobs)} job(s).")
+        while not stop.is_set():
+            # The connection may have been closed by the server while we slept.
+            close_old_connections()
+            for run in scheduler.run_pending():
+                self.report(run)
+                if stop.is_set():
+                    break
+            stop.wait(scheduler.seconds_until_due(poll_interval))
+        self.stdout.write("Scheduler stopped.")
+
+    def report(self, run):
+        line = f"{run.job} {run.get_status_display().lower()} in {run.duration:.2f}s"
+        if run.status == JobStatus.FAILED:
+            self.stderr.write(f"{line}:\n{run.error}")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{line}: {run.result}" if run.result else line))
+
+    def list_jobs(self, scheduler):
+        locks = JobLock.objects.in_bulk(list(scheduler.jobs), field_name='name')
+        for name, job in scheduler.jobs.items():
+            lock = locks[name]
+            last = JobRun.objects.filter(job=name).first()
+            state = f"running on {lock.owner}" if lock.owner else f"next {lock.next_run_at:%Y-%m-%d %H:%M}"
+            history = f", last {last.get_status_display().lower()} at {last.started_at:%Y-%m-%d %H:%M}" if last else ""
+            self.stdout.write(f"{name:<28} {job.schedule.spec:<14} {state}{history}")
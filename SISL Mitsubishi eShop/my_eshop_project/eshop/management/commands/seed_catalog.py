@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from eshop.synthetic import SyntheticConfig, SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a deterministic synthetic catalog: PLC/HMI/VFD/SERVO "
+        "category trees, brands, products with family spec fields, related and "
+        "compatible links, customers and quotations with lines. Re-running with the "
+        "same --seed only adds what is missing."
+    )
+
+    def add_arguments(self, parser):
+        defaults = SyntheticConfig()
+        parser.add_argument('--products', type=int, default=defaults.products)
+        parser.add_argument('--customers', type=int, default=defaults.customers)
+        parser.add_argument('--quotations', type=int, default=defaults.quotations)
+        parser.add_argument('--lines-per-quotation', type=int, default=defaults.lines_per_quotation)
+        parser.add_argument('--related-per-product', type=int, default=defaults.related_per_product)
+        parser.add_argument('--compatible-per-product', type=int, default=defaults.compatible_per_product)
+        parser.add_argument('--days', type=int, default=defaults.days,
+                            help="Spread quotation dates over this many days.")
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--batch-size', type=int, default=defaults.batch_size)
+        parser.add_argument('--fast', action='store_true',
+                            help="SQLite only: skip fsync while seeding (unsafe if the machine crashes).")
+
+    def handle(self, *args, **options):
+        config = SyntheticConfig(**{field: options[field] for field in SyntheticConfig.__dataclass_fields__})
+        if options['fast']:
+            if connection.vendor != 'sqlite':
+                raise CommandError("--fast is only supported on SQLite.")
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+
+        started = time.perf_counter()
+        counts = SyntheticDataGenerator(
+            config, log=lambda message: self.stdout.write(f"  {message}") if options['verbosity'] > 1 else None
+        ).run()
+        elapsed = time.perf_counter() - started
+
+        rows = sum(counts.values())
+        for model_name, count in sorted(counts.items()):
+            self.stdout.write(f"{model_name:<32} {count:>10}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
@@ -0,0 +1,441 @@
+"""
+Prometheus-compatible metrics.
+
+A small registry of counters, gauges and histograms rendered in the
+Prometheus text format at /metrics. Every Passenger worker keeps its own
+values in memory; with ESHOP_METRICS_DIR set, each process also writes them
+to <dir>/<pid>-<token>.json (at most every ESHOP_METRICS_FLUSH_INTERVAL
+seconds, and at exit), and a scrape sums the files of all processes.
+Files of processes that have exited are folded into archive.json so
+counters never go backwards and the directory does not grow without bound.
+Without ESHOP_METRICS_DIR only the scraped process is reported.
+
+Gauges are per-process values and are not archived; values that live in
+the database are computed at scrape time by collectors instead.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+ARCHIVE_FILE = 'archive.json'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return f'{value:.1f}'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Bound:
+    """A metric with its label values filled in."""
+    __slots__ = ('metric', 'key')
+
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount=1):
+        self.metric._inc(self.key, amount)
+
+    def dec(self, amount=1):
+        self.metric._inc(self.key, -amount)
+
+    def set(self, value):
+        self.metric._set(self.key, value)
+
+    def observe(self, value):
+        self.metric._observe(self.key, value)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry if registry is not None else REGISTRY
+        self._values = {}
+        self.registry.register(self)
+
+    def labels(self, **labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return _Bound(self, tuple(str(labels[name]) for name in self.labelnames))
+
+    def _unlabelled(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return _Bound(self, ())
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def _inc(self, key, amount):
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+        self.registry.maybe_flush()
+
+    def _set(self, key, value):
+        with self.registry.lock:
+            self._values[key] = float(value)
+        self.registry.maybe_flush()
+
+    def reset(self):
+        with self.registry.lock:
+            self._values.clear()
+
+    # Values are exchanged with other processes as {label tuple: value}.
+    def dump(self):
+        return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(into, key, value):
+        into[key] = into.get(key, 0.0) + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _inc(self, key, amount):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented.")
+        super()._inc(key, amount)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        buckets = tuple(float(bound) for bound in buckets)
+        if buckets[-1] != math.inf:
+            buckets += (math.inf,)
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+    def _observe(self, key, value):
+        with self.registry.lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket (non-cumulative) followed by the sum.
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-1] += value
+        self.registry.maybe_flush()
+
+    def merge(self, into, key, value):
+        counts = into.get(key)
+        if counts is None:
+            into[key] = list(value)
+        else:
+            into[key] = [a + b for a, b in zip(counts, value)]
+
+    def samples(self, values):
+        for key, counts in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield f'{self.name}_sum', labels, counts[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=None):
+        self.lock = threading.RLock()
+        self._metrics = {}
+        self._collectors = []
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._next_flush = 0.0
+        self._token = uuid.uuid4().hex[:8]
+
+    @property
+    def directory(self):
+        if self._directory is not None:
+            return self._directory
+        return getattr(settings, 'ESHOP_METRICS_DIR', None)
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'ESHOP_METRICS_FLUSH_INTERVAL', 5)
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+
+    def collector(self, func):
+        """
+        Register func() -> iterable of (metric, {label tuple: value}) pairs,
+        called on every scrape. Usable as a decorator.
+        """
+        self._collectors.append(func)
+        return func
+
+    def reset(self):
+        """Forget this process's values and start a new process file."""
+        with self.lock:
+            for metric in self._metrics.values():
+                metric._values.clear()
+            self._token = uuid.uuid4().hex[:8]
+            self._next_flush = 0.0
+
+    # -- multiprocess files ----------------------------------------------
+
+    @property
+    def file_name(self):
+        return f'{os.getpid()}-{self._token}.json'
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        directory = self.directory
+        if not directory:
+            return
+        with self.lock:
+            payload = {
+                name: metric.dump() for name, metric in self._metrics.items() if metric._values
+            }
+            self._next_flush = time.monotonic() + self.flush_interval
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.file_name)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as fh:
+            json.dump(payload, fh)
+        os.replace(temp_path, path)
+
+    def _merge_payload(self, merged, payload, include_gauges=True):
+        for name, samples in payload.items():
+            metric = self._metrics.get(name)
+            if metric is None or (metric.type == 'gauge' and not include_gauges):
+                continue
+            values = merged.setdefault(name, {})
+            for key, value in samples:
+                metric.merge(values, tuple(key), value)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _process_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _archive_dead_processes(self, directory):
+        if fcntl is None:
+            return
+        own = self.file_name
+        dead = []
+        for file_name in os.listdir(directory):
+            if not file_name.endswith('.json') or file_name in (own, ARCHIVE_FILE):
+                continue
+            pid = file_name.split('-', 1)[0]
+            if pid.isdigit() and not self._process_alive(int(pid)):
+                dead.append(os.path.join(directory, file_name))
+        if not dead:
+            return
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        with open(os.path.join(directory, 'archive.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            merged = {}
+            self._merge_payload(merged, self._read(archive_path), include_gauges=False)
+            folded = [path for path in dead if os.path.exists(path)]
+            for path in folded:
+                self._merge_payload(merged, self._read(path), include_gauges=False)
+            temp_path = f'{archive_path}.tmp'
+            with open(temp_path, 'w') as fh:
+                json.dump({
+                    name: [[list(key), value] for key, value in values.items()]
+                    for name, values in merged.items()
+                }, fh)
+            os.replace(temp_path, archive_path)
+            for path in folded:
+                os.remove(path)
+
+    def _aggregate(self):
+        directory = self.directory
+        if not directory:
+            with self.lock:
+                return {
+                    name: {key: (list(value) if isinstance(value, list) else value)
+                           for key, value in metric._values.items()}
+                    for name, metric in self._metrics.items()
+                }
+        self.flush()
+        self._archive_dead_processes(directory)
+        merged = {}
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith('.json'):
+                self._merge_payload(merged, self._read(os.path.join(directory, file_name)))
+        return merged
+
+    # -- exposition ------------------------------------------------------
+
+    def collect(self):
+        """Return {metric name: {label tuple: value}} across all processes."""
+        values = self._aggregate()
+        for func in self._collectors:
+            for metric, samples in func():
+                values[metric.name] = dict(samples)
+        return values
+
+    def exposition(self):
+        values = self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {_escape(metric.documentation)}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for sample_name, labels, value in metric.samples(values.get(name, {})):
+                lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+# A forked worker starts counting from zero under its own file.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=REGISTRY.reset)
+
+
+# ---------------------------------------------------------------------
+# Application metrics
+# ---------------------------------------------------------------------
+
+QUOTATIONS_SUBMITTED = Counter(
+    'eshop_quotations_submitted_total', 'Discount requests submitted by customers.', ['currency'],
+)
+QUOTATIONS_BY_STATUS = Gauge(
+    'eshop_quotations', 'Quotations currently in each status (read from the database at scrape time).', ['status'],
+)
+PDF_RENDER_SECONDS = Histogram(
+    'eshop_pdf_render_seconds', 'Time to render one quotation PDF.', ['kind'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+PDF_RENDER_ERRORS = Counter(
+    'eshop_pdf_render_errors_total', 'Quotation PDF renders that raised an error.', ['kind'],
+)
+EMAILS = Counter(
+    'eshop_emails_total', 'Outbox delivery attempts by outcome (sent, failed, dead).', ['outcome'],
+)
+CACHE_REQUESTS = Counter(
+    'eshop_cache_requests_total', 'In-process cache lookups by cache and result (hit, miss).',
+    ['cache', 'result'],
+)
+RATE_LIMITED = Counter(
+    'eshop_rate_limited_total', 'Requests refused with 429 by the rate limiter, per scope.', ['scope'],
+)
+REQUEST_SECONDS = Histogram(
+    'eshop_request_seconds', 'Request wall time per URL name.', ['view'],
+)
+REQUEST_DB_SECONDS = Histogram(
+    'eshop_request_db_seconds', 'Database time spent per request, per URL name.', ['view'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+REQUEST_DB_QUERIES = Histogram(
+    'eshop_request_db_queries', 'Database queries per request, per URL name.', ['view'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+JOB_RUNS = Counter(
+    'eshop_job_runs_total', 'Scheduled job runs by outcome (succeeded, failed).', ['job', 'outcome'],
+)
+JOB_SECONDS = Histogram(
+    'eshop_job_seconds', 'Run time of scheduled jobs.', ['job'],
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+JOB_LAST_SUCCESS = Gauge(
+    'eshop_job_last_success_timestamp_seconds',
+    'When each scheduled job last succeeded (read from the database at scrape time).', ['job'],
+)
+
+
+@REGISTRY.collector
+def _quotation_status_counts():
+    from django.db.models import Count
+
+    from .models import OrderStatus, Quotation
+
+    counts = dict.fromkeys(OrderStatus.values, 0)
+    counts.update(Quotation.objects.values_list('status').annotate(n=Count('pk')).order_by())
+    yield QUOTATIONS_BY_STATUS, {
+        (OrderStatus(status).name.lower(),): float(n) for status, n in counts.items()
+    }
+
+
+@REGISTRY.collector
+def _job_last_success():
+    from django.db.models import Max
+
+    from .models import JobRun, JobStatus
+
+    finished = JobRun.objects.filter(status=JobStatus.SUCCEEDED).values_list('job').annotate(at=Max('finished_at'))
+    yield JOB_LAST_SUCCESS, {(job,): at.timestamp() for job, at in finished.order_by()}
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eshop', '0009_quotation_order_number_quotation_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quotation',
+            name='currency',
+            field=models.CharField(choices=[('BDT', 'Bangladeshi Taka'), ('USD', 'US Dollar')], default='BDT', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='quotationline',
+            name='currency',
+            field=models.CharField(choices=[('BDT', 'Bangladeshi Taka'), ('USD', 'US Dollar')], default='BDT', max_length=3),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_currency', models.CharField(choices=[('BDT', 'Bangladeshi Taka'), ('USD', 'US Dollar')], max_length=3)),
+                ('target_currency', models.CharField(choices=[('BDT', 'Bangladeshi Taka'), ('USD', 'US Dollar')], max_length=3)),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('source_currency', 'target_currency')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('eshop', '0010_quotation_currency_exchangerate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotationStatusLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('P', 'Pending'), ('C', 'Confirmed'), ('X', 'Canceled'), ('D', 'Delivered')], max_length=1)),
+                ('to_status', models.CharField(choices=[('P', 'Pending'), ('C', 'Confirmed'), ('X', 'Canceled'), ('D', 'Delivered')], max_length=1)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('quotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_log', to='eshop.quotation')),
+            ],
+            options={
+                'ordering': ['changed_at', 'pk'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eshop', '0012_ordernumbercounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('from_email', models.CharField(max_length=254)),
+                ('recipients', models.TextField(help_text='One address per line.')),
+                ('attachment_path', models.CharField(blank=True, max_length=500)),
+                ('status', models.CharField(choices=[('Q', 'Queued'), ('S', 'Sent'), ('D', 'Dead-lettered')], default='Q', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('quotation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emails', to='eshop.quotation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='eshop_outbo_status_a26d49_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eshop', '0016_catalog_snapshot_offline_quotations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quotation',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
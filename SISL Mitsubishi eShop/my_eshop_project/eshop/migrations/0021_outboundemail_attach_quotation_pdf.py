@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-20 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eshop', '0020_outboundemail_next_attempt_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='attach_quotation_pdf',
+            field=models.BooleanField(default=False),
+        ),
+    ]
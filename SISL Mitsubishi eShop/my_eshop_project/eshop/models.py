@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Cast
 from django.contrib.auth.models import User  # used if Quotation links to user
 
 # Order status choices for managing orders
@@ -8,6 +9,11 @@ class OrderStatus(models.TextChoices):
     CANCELED = 'X', 'Canceled'
     DELIVERED = 'D', 'Delivered'
 
+# Currencies we quote in. Catalog prices are kept in BDT.
+class Currency(models.TextChoices):
+    BDT = 'BDT', 'Bangladeshi Taka'
+    USD = 'USD', 'US Dollar'
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     parent = models.ForeignKey(
@@ -36,6 +42,37 @@ class Brand(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    # Columns shown on listing cards, see templates/partials/_product_card.html.
+    CARD_FIELDS = ('name', 'sku', 'image', 'original_price', 'discounted_price', 'brand__name')
+
+    def cards(self):
+        """Just what a product card shows, without the description and spec columns."""
+        return self.select_related('brand').only(*self.CARD_FIELDS)
+
+    def linked_to(self, product_id):
+        """
+        Every product the detail page of `product_id` links to, in one query:
+        `is_related` and `is_compatible` flag its related_products and
+        compatible_modules, `recommendation_rank` its "also quoted" rank.
+        """
+        through = {name: Product._meta.get_field(name).remote_field.through for name in
+                   ('related_products', 'compatible_modules')}
+        links = {
+            name: models.Exists(model.objects.filter(from_product=product_id, to_product=models.OuterRef('pk')))
+            for name, model in through.items()
+        }
+        rank = ProductRecommendation.objects.filter(
+            product=product_id, recommended=models.OuterRef('pk'),
+        ).values('rank')[:1]
+        return self.annotate(
+            is_related=links['related_products'],
+            is_compatible=links['compatible_modules'],
+            recommendation_rank=models.Subquery(rank),
+        ).filter(
+            models.Q(is_related=True) | models.Q(is_compatible=True) | models.Q(recommendation_rank__isnull=False)
+        ).order_by('pk')
+
 class Product(models.Model):
     # Mandatory fields
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
@@ -89,6 +126,9 @@ class Product(models.Model):
     maximum_torque = models.CharField(max_length=50, blank=True, null=True)
     display_color = models.CharField(max_length=50, blank=True, null=True)
 
+    # Part of the cache key of the rendered spec table (see eshop.specs).
+    updated_at = models.DateTimeField(auto_now=True)
+
     # ManyToMany relationships
     related_products = models.ManyToManyField(
         'self', symmetrical=False, blank=True, related_name='linked_products'
@@ -97,6 +137,17 @@ class Product(models.Model):
         'self', symmetrical=False, blank=True, related_name='plc_or_hmi_compatible'
     )
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Sorted listings (eshop.pagination) per category, per brand and overall.
+            models.Index(fields=['category', 'original_price'], name='product_category_price_idx'),
+            models.Index(fields=['category', 'name'], name='product_category_name_idx'),
+            models.Index(fields=['brand', 'original_price'], name='product_brand_price_idx'),
+            models.Index(fields=['original_price'], name='product_price_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -113,12 +164,31 @@ class Quotation(models.Model):
         choices=OrderStatus.choices,
         default=OrderStatus.PENDING
     )
+    currency = models.CharField(
+        max_length=3,
+        choices=Currency.choices,
+        default=Currency.BDT
+    )
+    # Set for quotations written offline against a catalog snapshot and
+    # imported later (see eshop.offline_quotations); makes re-imports no-ops.
+    offline_id = models.UUIDField(unique=True, null=True, blank=True, editable=False)
+    catalog_version = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Bumped by every line edit through eshop.quotation_lines; an edit based
+    # on an older version is refused instead of overwriting someone else's.
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return f"Quotation #{self.pk} for {self.customer or 'Anonymous'}"
 
     def compute_total(self):
-        total = sum(line.line_total() for line in self.lines.all())
+        # Lines may be priced in another currency than the quotation itself:
+        # one aggregate sums the line totals per currency, and each sum is
+        # converted with one snapshot of the rate table.
+        from .currency import get_rates
+
+        rates = get_rates()
+        sums = self.lines.order_by().values_list('currency').annotate(total=models.Sum(QuotationLine.TOTAL))
+        total = sum(rates.convert(amount, currency, self.currency) for currency, amount in sums)
         self.total_amount = total
         self.save(update_fields=['total_amount'])
 
@@ -129,6 +199,23 @@ class QuotationLine(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     discount_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    currency = models.CharField(
+        max_length=3,
+        choices=Currency.choices,
+        default=Currency.BDT
+    )
+
+    # line_total() as a database expression, for aggregates. SQLite stores
+    # whole NUMERIC values as integers, so the division by 100 is done in
+    # floating point; an integer division would give 854 for 1005 at 15%.
+    # The result is read back as a Decimal with 15 significant digits.
+    TOTAL = models.ExpressionWrapper(
+        Cast(
+            models.F('quantity') * models.F('unit_price') * (100 - models.F('discount_percent')),
+            models.FloatField(),
+        ) / 100,
+        output_field=models.DecimalField(max_digits=20, decimal_places=4),
+    )
 
     def line_total(self):
         subtotal = self.quantity * self.unit_price
@@ -137,3 +224,176 @@ class QuotationLine(models.Model):
 
     def __str__(self):
         return f"Line {self.pk} in Quotation #{self.quotation.pk}"
+
+class ProductRecommendation(models.Model):
+    """
+    Precomputed "customers also quoted" neighbours: the top products by
+    cosine similarity of quotation co-occurrence. Rebuilt by
+    `manage.py build_recommendations`, see eshop.recommendations.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    # Quotations containing both products.
+    co_quotations = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('product', 'rank')
+        ordering = ['product', 'rank']
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.score:.3f})"
+
+class QuotationStatusLog(models.Model):
+    """
+    Append-only history of status transitions. Rows are written by
+    eshop.workflow and are never updated or deleted individually.
+    """
+    quotation = models.ForeignKey(Quotation, on_delete=models.CASCADE, related_name='status_log')
+    from_status = models.CharField(max_length=1, choices=OrderStatus.choices)
+    to_status = models.CharField(max_length=1, choices=OrderStatus.choices)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    changed_at = models.DateTimeField(auto_now_add=True)
+    note = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ['changed_at', 'pk']
+
+    def __str__(self):
+        return f"Quotation #{self.quotation_id}: {self.from_status} -> {self.to_status}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Status log entries are append-only.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Status log entries are append-only.")
+
+class OrderNumberCounter(models.Model):
+    """
+    Last order number handed out per prefix (e.g. ORD20250221). Workers
+    reserve numbers from it in blocks, see eshop.order_numbers.
+    """
+    prefix = models.CharField(max_length=20, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefix}: {self.last_value}"
+
+class EmailStatus(models.TextChoices):
+    QUEUED = 'Q', 'Queued'
+    SENT = 'S', 'Sent'
+    DEAD = 'D', 'Dead-lettered'
+
+class OutboundEmail(models.Model):
+    """
+    Transactional email outbox. Rows are written in the same transaction as
+    the data they describe and delivered by `manage.py dispatch_outbox`.
+    """
+    quotation = models.ForeignKey(
+        Quotation, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails'
+    )
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.TextField(help_text="One address per line.")
+    attachment_path = models.CharField(max_length=500, blank=True)
+    # Attach the quotation's PDF, rendered when the email is sent.
+    attach_quotation_pdf = models.BooleanField(default=False)
+    status = models.CharField(max_length=1, choices=EmailStatus.choices, default=EmailStatus.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # After a failure, not retried before this time (exponential backoff).
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    # The dispatcher sending this email, until its lease runs out.
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipients.replace(chr(10), ', ')}"
+
+    def recipient_list(self):
+        return [address for address in self.recipients.splitlines() if address.strip()]
+
+class ExchangeRate(models.Model):
+    """
+    Conversion rate between two currencies: 1 source = rate target.
+    Rows are entered in admin or loaded with `manage.py load_exchange_rates`.
+    """
+    source_currency = models.CharField(max_length=3, choices=Currency.choices)
+    target_currency = models.CharField(max_length=3, choices=Currency.choices)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('source_currency', 'target_currency')
+
+    def __str__(self):
+        return f"1 {self.source_currency} = {self.rate} {self.target_currency}"
+
+class CatalogSnapshot(models.Model):
+    """
+    A numbered, gzip-compressed SQLite copy of the catalog for offline
+    quoting, written by `manage.py export_catalog_snapshot`. See
+    eshop.catalog_snapshot.
+    """
+    version = models.PositiveIntegerField(unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    file = models.FileField(upload_to='catalog_snapshots/')
+    size = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    products = models.PositiveIntegerField(default=0)
+    # Products added, changed and removed since the previous version.
+    changed = models.PositiveIntegerField(default=0)
+    removed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-version']
+
+    def __str__(self):
+        return f"Catalog v{self.version} ({self.products} products)"
+
+class JobStatus(models.TextChoices):
+    RUNNING = 'R', 'Running'
+    SUCCEEDED = 'S', 'Succeeded'
+    FAILED = 'F', 'Failed'
+
+class JobLock(models.Model):
+    """
+    One row per scheduled job: when it is next due and which scheduler
+    holds it until when. Claimed with a conditional UPDATE, see
+    eshop.scheduler.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    schedule = models.CharField(max_length=100)
+    next_run_at = models.DateTimeField()
+    owner = models.CharField(max_length=255, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.schedule}), next at {self.next_run_at:%Y-%m-%d %H:%M}"
+
+class JobRun(models.Model):
+    """One execution of a scheduled job, written by `manage.py run_scheduler`."""
+    job = models.CharField(max_length=100)
+    owner = models.CharField(max_length=255)
+    status = models.CharField(max_length=1, choices=JobStatus.choices, default=JobStatus.RUNNING)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True, help_text="Seconds.")
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [models.Index(fields=['job', 'started_at'])]
+
+    def __str__(self):
+        return f"{self.job} at {self.started_at:%Y-%m-%d %H:%M}: {self.get_status_display()}"
@@ -0,0 +1,149 @@
+"""
+Bulk import of quotations written offline against a catalog snapshot.
+
+Field engineers quote from a catalog snapshot (eshop.catalog_snapshot) and
+upload their quotations once they are back online, possibly more than once
+when a sync is interrupted. Every quotation carries a client-generated
+offline_id, so quotations already imported are reported back instead of
+being duplicated. A batch is reconciled with a fixed number of queries:
+one for known offline ids, one for the products, one order number block
+and one bulk insert each for quotations and lines.
+
+A quotation is rejected as a whole when one of its products has since been
+deleted or a line currency cannot be converted. Unit prices are kept as
+quoted, but lines whose price differs from the current list price are
+reported so staff can review them. PDFs and emails are not produced for
+imported quotations; they appear in order management like any other.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .currency import ExchangeRateMissing, get_rates
+from .metrics import QUOTATIONS_SUBMITTED
+from .models import Product, Quotation, QuotationLine
+from .order_numbers import current_prefix, format_order_number, reserve_block
+from .portal import invalidate_history
+
+IMPORT_RETRIES = 2
+CENTS = Decimal('0.01')
+
+
+def _line_total(line):
+    subtotal = line['quantity'] * line['unit_price']
+    # Decimal(100): an int percentage over 100 would be a float.
+    return subtotal - subtotal * (line['discount_percent'] / Decimal(100))
+
+
+def _reconcile(quotation, prices, rates):
+    """Return (errors, price changes, total in the quotation currency)."""
+    errors, price_changes, total = [], [], Decimal(0)
+    for line in quotation['lines']:
+        product_id = line['product']
+        if product_id not in prices:
+            errors.append(f"Product {product_id} no longer exists.")
+            continue
+        try:
+            total += rates.convert(_line_total(line), line['currency'], quotation['currency'])
+        except ExchangeRateMissing as exc:
+            errors.append(str(exc))
+        current = prices[product_id]
+        if line['unit_price'] != current:
+            price_changes.append({'product': product_id, 'quoted': str(line['unit_price']), 'current': str(current)})
+    return errors, price_changes, total.quantize(CENTS)
+
+
+def _import_once(quotations, user):
+    offline_ids = [quotation['offline_id'] for quotation in quotations]
+    known = {
+        offline_id: (pk, order_number)
+        for offline_id, pk, order_number in Quotation.objects.filter(offline_id__in=offline_ids)
+        .values_list('offline_id', 'pk', 'order_number')
+    }
+    product_ids = {line['product'] for quotation in quotations for line in quotation['lines']}
+    prices = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'original_price'))
+    rates = get_rates()
+
+    result = {'created': [], 'duplicates': [], 'rejected': []}
+    accepted = []
+    for quotation in quotations:
+        offline_id = quotation['offline_id']
+        if offline_id in known:
+            pk, order_number = known[offline_id]
+            result['duplicates'].append({'offline_id': offline_id, 'id': pk, 'order_number': order_number})
+            continue
+        # The same quotation twice in one upload counts once.
+        known[offline_id] = (None, None)
+        errors, price_changes, total = _reconcile(quotation, prices, rates)
+        if errors:
+            result['rejected'].append({'offline_id': offline_id, 'errors': errors})
+        else:
+            accepted.append((quotation, price_changes, total))
+    if not accepted:
+        return result
+
+    today = timezone.now().strftime('%Y-%m-%d')
+    with transaction.atomic():
+        # One block of numbers for the whole batch; it rolls back with it.
+        prefix = current_prefix()
+        first, _ = reserve_block(prefix, len(accepted))
+        headers = []
+        for offset, (quotation, _, total) in enumerate(accepted):
+            order_number = format_order_number(prefix, first + offset)
+            headers.append(Quotation(
+                customer=user,
+                order_number=order_number,
+                subject=f"Offline quotation {order_number} synced on {today}",
+                notes=quotation['notes'],
+                currency=quotation['currency'],
+                total_amount=total,
+                offline_id=quotation['offline_id'],
+                catalog_version=quotation['catalog_version'],
+            ))
+        Quotation.objects.bulk_create(headers)
+        QuotationLine.objects.bulk_create(
+            [
+                QuotationLine(
+                    quotation=header,
+                    product_id=line['product'],
+                    description=line['description'],
+                    quantity=line['quantity'],
+                    unit_price=line['unit_price'],
+                    discount_percent=line['discount_percent'],
+                    currency=line['currency'],
+                )
+                for header, (quotation, _, _) in zip(headers, accepted)
+                for line in quotation['lines']
+            ],
+            batch_size=500,
+        )
+
+    # bulk_create sends no post_save, which would drop the cached history.
+    invalidate_history(getattr(user, 'pk', None))
+    for header, (_, price_changes, _) in zip(headers, accepted):
+        QUOTATIONS_SUBMITTED.labels(currency=header.currency).inc()
+        result['created'].append({
+            'offline_id': header.offline_id,
+            'id': header.pk,
+            'order_number': header.order_number,
+            'total_amount': str(header.total_amount),
+            'price_changes': price_changes,
+        })
+    return result
+
+
+def import_quotations(quotations, user=None):
+    """
+    Import validated offline quotations (see OfflineQuotationSerializer) for
+    `user`. Returns {'created': [...], 'duplicates': [...], 'rejected': [...]},
+    with amounts as strings, ready to serialize.
+    """
+    for attempt in range(IMPORT_RETRIES):
+        try:
+            return _import_once(quotations, user)
+        except IntegrityError:
+            # A concurrent upload of the same batch won the race; on retry
+            # its quotations are reported as duplicates.
+            if attempt == IMPORT_RETRIES - 1:
+                raise
@@ -0,0 +1,46 @@
+"""
+Bounded thread pools for blocking work started from async views.
+
+Under ASGI one worker process serves many connections from a single event
+loop, so a PDF render or another slow, blocking step must not run on the
+loop. offload() runs it in a named pool instead. Each pool has a fixed
+number of threads (ESHOP_OFFLOAD_POOLS), so a burst of requests queues up
+behind them rather than starting unbounded renders or opening unbounded
+database connections. Callers just await the result.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+DEFAULT_POOL_SIZE = 2
+
+_lock = threading.Lock()
+_pools = {}
+
+
+def get_pool(name):
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            size = getattr(settings, 'ESHOP_OFFLOAD_POOLS', {}).get(name, DEFAULT_POOL_SIZE)
+            pool = _pools[name] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f'eshop-{name}')
+        return pool
+
+
+def _run_with_fresh_connection(func, args, kwargs):
+    # Pool threads outlive requests, so treat every job like a request:
+    # drop broken or expired connections before and after it.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def offload(pool, func, *args, **kwargs):
+    """Run blocking `func(*args, **kwargs)` in the named pool and await its result."""
+    run = sync_to_async(_run_with_fresh_connection, thread_sensitive=False, executor=get_pool(pool))
+    return await run(func, args, kwargs)
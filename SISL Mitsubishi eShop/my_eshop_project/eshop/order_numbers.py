@@ -0,0 +1,113 @@
+"""
+Collision-free order numbers.
+
+Numbers look like ORD2025022100042, i.e.
+<ESHOP_ORDER_NUMBER_PREFIX><period><counter>, where the period is the
+current day (ESHOP_ORDER_NUMBER_PERIOD = 'day'), year ('year') or empty
+(None). Each prefix has a row in OrderNumberCounter; a worker reserves
+ESHOP_ORDER_NUMBER_BLOCK_SIZE numbers at a time with one atomic UPDATE and
+hands them out from memory, so concurrent workers never share a number.
+Unused numbers of a block are simply skipped.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OrderNumberCounter, Quotation
+
+PERIOD_FORMATS = {
+    'day': '%Y%m%d',
+    'year': '%Y',
+    None: '',
+}
+RESERVE_RETRIES = 5
+MAX_LENGTH = Quotation._meta.get_field('order_number').max_length
+
+
+def current_prefix(now=None):
+    now = now or timezone.now()
+    period = getattr(settings, 'ESHOP_ORDER_NUMBER_PERIOD', 'day')
+    if period not in PERIOD_FORMATS:
+        raise ValueError(f"Unsupported ESHOP_ORDER_NUMBER_PERIOD: {period!r}")
+    return getattr(settings, 'ESHOP_ORDER_NUMBER_PREFIX', 'ORD') + now.strftime(PERIOD_FORMATS[period])
+
+
+def format_order_number(prefix, value):
+    digits = getattr(settings, 'ESHOP_ORDER_NUMBER_DIGITS', 5)
+    number = f"{prefix}{value:0{digits}d}"
+    if len(number) > MAX_LENGTH:
+        raise ValueError(f"Order number {number} exceeds {MAX_LENGTH} characters.")
+    return number
+
+
+def reserve_block(prefix, size):
+    """
+    Atomically reserve `size` numbers for `prefix`.
+    Returns (first, last) of the reserved range.
+    """
+    for attempt in range(RESERVE_RETRIES):
+        try:
+            with transaction.atomic():
+                updated = OrderNumberCounter.objects.filter(prefix=prefix).update(
+                    last_value=F('last_value') + size
+                )
+                if updated:
+                    last = OrderNumberCounter.objects.filter(prefix=prefix).values_list(
+                        'last_value', flat=True
+                    ).get()
+                else:
+                    OrderNumberCounter.objects.create(prefix=prefix, last_value=size)
+                    last = size
+            return last - size + 1, last
+        except IntegrityError:
+            # Another worker created the counter row first; retry the UPDATE.
+            if attempt == RESERVE_RETRIES - 1:
+                raise
+
+
+class OrderNumberAllocator:
+    """Hands out numbers from a block reserved per process."""
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._prefix = None
+        self._next = 1
+        self._last = 0
+
+    def next(self):
+        prefix = current_prefix()
+        if transaction.get_connection().in_atomic_block:
+            # Inside a caller's transaction a reservation could be rolled
+            # back while we still hold the block, letting another worker
+            # reserve the same numbers. Take exactly one number instead; it
+            # rolls back together with whatever uses it.
+            first, _ = reserve_block(prefix, 1)
+            return format_order_number(prefix, first)
+
+        with self._lock:
+            if prefix != self._prefix or self._next > self._last:
+                size = self.block_size or getattr(settings, 'ESHOP_ORDER_NUMBER_BLOCK_SIZE', 20)
+                self._next, self._last = reserve_block(prefix, size)
+                self._prefix = prefix
+            value = self._next
+            self._next += 1
+        return format_order_number(prefix, value)
+
+
+_allocator = OrderNumberAllocator()
+
+# A forked worker must not reuse the block its parent already reserved.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_allocator.reset)
+
+
+def next_order_number():
+    return _allocator.next()
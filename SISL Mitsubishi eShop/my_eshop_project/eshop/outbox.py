@@ -0,0 +1,263 @@
+"""
+Transactional email outbox.
+
+Views call enqueue_* inside their transaction, so an email exists if and
+only if the data it talks about was committed. Quotation emails carry no
+file: the quotation's PDF is rendered when the email is sent, so the
+transaction does not hold the database's write lock for a render and a
+rolled-back quotation leaves nothing behind. `manage.py dispatch_outbox`
+drains the queue in batches over one reused SMTP connection, paces sends
+to ESHOP_EMAIL_RATE_LIMIT messages per second and dead-letters a message
+after ESHOP_EMAIL_MAX_ATTEMPTS failures. A failed message waits
+ESHOP_EMAIL_RETRY_DELAY seconds before its next attempt, doubling after
+every failure up to ESHOP_EMAIL_RETRY_MAX_DELAY, so a mail server outage
+of a few minutes does not use up its attempts. If the server cannot be
+reached at all, nothing is tried and the next poll tries again. Several
+dispatchers may run at once: each claims a batch for
+ESHOP_EMAIL_CLAIM_LEASE seconds before sending it.
+"""
+import io
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .metrics import EMAILS
+from .models import EmailStatus, OrderStatus, OutboundEmail, Quotation
+from .pdf import render_quotation
+from .workflow import on_transition
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def enqueue(subject, body, recipients, from_email=None, attachment_path='', quotation=None):
+    return OutboundEmail.objects.create(
+        quotation=quotation,
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients="\n".join(recipients),
+        attachment_path=str(attachment_path or ''),
+    )
+
+
+def enqueue_quotation_emails(quotation, product=None):
+    """
+    Queue the staff notification and, if we know their address, the
+    customer copy, both with the quotation's PDF attached when sent.
+    """
+    context = {
+        'quotation': quotation,
+        'product': product,
+        'customer': quotation.customer,
+    }
+    staff_recipients = getattr(settings, 'ESHOP_SALES_EMAILS', None) or [settings.DEFAULT_FROM_EMAIL]
+    emails = [
+        OutboundEmail(
+            quotation=quotation,
+            subject=f"Discount request {quotation.order_number}"
+                    + (f" for {product.name}" if product else ""),
+            body=render_to_string('emails/quotation_staff.txt', context),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipients="\n".join(staff_recipients),
+            attach_quotation_pdf=True,
+        )
+    ]
+    customer_email = getattr(quotation.customer, 'email', '')
+    if customer_email:
+        emails.append(
+            OutboundEmail(
+                quotation=quotation,
+                subject=f"Your discount request {quotation.order_number}",
+                body=render_to_string('emails/quotation_customer.txt', context),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipients=customer_email,
+                attach_quotation_pdf=True,
+            )
+        )
+    return OutboundEmail.objects.bulk_create(emails)
+
+
+@on_transition(OrderStatus.CONFIRMED, OrderStatus.CANCELED, OrderStatus.DELIVERED)
+def enqueue_status_emails(changes, to_status, user):
+    """Tell every customer with an email address that their quotation moved to `to_status`."""
+    quotations = (
+        Quotation.objects.filter(pk__in=[pk for pk, _ in changes])
+        .exclude(customer__isnull=True)
+        .exclude(customer__email='')
+        .select_related('customer')
+    )
+    status = OrderStatus(to_status).label
+    OutboundEmail.objects.bulk_create([
+        OutboundEmail(
+            quotation=quotation,
+            subject=f"Your discount request {quotation.order_number} is {status.lower()}",
+            body=render_to_string('emails/quotation_status.txt', {
+                'quotation': quotation, 'customer': quotation.customer, 'status': status,
+            }),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipients=quotation.customer.email,
+        )
+        for quotation in quotations
+    ], batch_size=DEFAULT_BATCH_SIZE)
+
+
+def _quotation_pdf(quotation):
+    """(file name, PDF bytes) of a quotation, rendered from the database now."""
+    buffer = io.BytesIO()
+    render_quotation(quotation, buffer)
+    return f"quotation_{quotation.order_number or quotation.pk}.pdf", buffer.getvalue()
+
+
+def _build_message(email, connection, pdfs):
+    """`pdfs` caches rendered quotation PDFs by quotation id for one batch."""
+    message = EmailMessage(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.recipient_list(),
+        connection=connection,
+    )
+    if email.attachment_path:
+        if not os.path.exists(email.attachment_path):
+            raise FileNotFoundError(f"Attachment {email.attachment_path} is missing.")
+        message.attach_file(email.attachment_path)
+    if email.attach_quotation_pdf:
+        if email.quotation is None:
+            raise LookupError("The quotation to attach was deleted.")
+        if email.quotation_id not in pdfs:
+            pdfs[email.quotation_id] = _quotation_pdf(email.quotation)
+        file_name, content = pdfs[email.quotation_id]
+        message.attach(file_name, content, 'application/pdf')
+    return message
+
+
+def retry_delay(attempts):
+    """Seconds to wait after a message's `attempts`-th failure."""
+    base = getattr(settings, 'ESHOP_EMAIL_RETRY_DELAY', 60)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'ESHOP_EMAIL_RETRY_MAX_DELAY', 3600))
+
+
+class _RateLimiter:
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self._next_slot:
+            time.sleep(self._next_slot - now)
+            now = self._next_slot
+        self._next_slot = now + self.interval
+
+
+def dispatch(batch_size=DEFAULT_BATCH_SIZE, max_attempts=None, rate_limit=None, limit=None):
+    """
+    Send queued emails until the queue is empty (or `limit` messages were
+    tried). Returns a dict with sent/failed/dead counts.
+
+    Each batch is claimed with a conditional UPDATE before it is sent, so
+    concurrent dispatchers never send the same email twice; a claim left by
+    a dispatcher that died is taken over once its lease runs out.
+    """
+    max_attempts = max_attempts or getattr(settings, 'ESHOP_EMAIL_MAX_ATTEMPTS', 5)
+    if rate_limit is None:
+        rate_limit = getattr(settings, 'ESHOP_EMAIL_RATE_LIMIT', None)
+    limiter = _RateLimiter(rate_limit)
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    lease = timedelta(seconds=getattr(settings, 'ESHOP_EMAIL_CLAIM_LEASE', 600))
+    stats = {'sent': 0, 'failed': 0, 'dead': 0}
+    last_pk = 0
+    tried = 0
+    connection_lost = False
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception:
+        # Leave every message as it is; the next poll tries again.
+        logger.warning("Could not connect to the mail server; the outbox is left for the next run.", exc_info=True)
+        return stats
+    due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now())
+    try:
+        while limit is None or tried < limit:
+            size = batch_size if limit is None else min(batch_size, limit - tried)
+            now = timezone.now()
+            unclaimed = Q(claimed_until__isnull=True) | Q(claimed_until__lte=now)
+            candidates = list(
+                OutboundEmail.objects.filter(due, unclaimed, status=EmailStatus.QUEUED, pk__gt=last_pk)
+                .order_by('pk').values_list('pk', flat=True)[:size]
+            )
+            if not candidates:
+                break
+            last_pk = candidates[-1]
+            # Only the rows still unclaimed are ours; another dispatcher may
+            # have taken the rest since they were selected.
+            OutboundEmail.objects.filter(unclaimed, status=EmailStatus.QUEUED, pk__in=candidates).update(
+                claimed_by=owner, claimed_until=now + lease,
+            )
+            batch = list(
+                OutboundEmail.objects.filter(claimed_by=owner, pk__in=candidates)
+                .select_related('quotation__customer').order_by('pk')
+            )
+            tried += len(batch)
+
+            sent_ids, failed, pdfs = [], [], {}
+            for email in batch:
+                limiter.wait()
+                try:
+                    connection.send_messages([_build_message(email, connection, pdfs)])
+                except Exception as exc:
+                    email.attempts += 1
+                    email.claimed_by, email.claimed_until = '', None
+                    email.last_error = f"{type(exc).__name__}: {exc}"
+                    if email.attempts >= max_attempts:
+                        email.status = EmailStatus.DEAD
+                        stats['dead'] += 1
+                        EMAILS.labels(outcome='dead').inc()
+                        logger.error("Dead-lettered email %s after %d attempts: %s", email.pk, email.attempts, exc)
+                    else:
+                        email.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(email.attempts))
+                        stats['failed'] += 1
+                        EMAILS.labels(outcome='failed').inc()
+                    failed.append(email)
+                    # The SMTP session may be unusable after an error; start a fresh one.
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        logger.exception("Could not reconnect to the mail server")
+                        connection_lost = True
+                        break
+                else:
+                    sent_ids.append(email.pk)
+
+            if sent_ids:
+                OutboundEmail.objects.filter(pk__in=sent_ids).update(
+                    status=EmailStatus.SENT, sent_at=timezone.now(), last_error='', claimed_by='', claimed_until=None,
+                )
+                stats['sent'] += len(sent_ids)
+                EMAILS.labels(outcome='sent').inc(len(sent_ids))
+            if failed:
+                OutboundEmail.objects.bulk_update(
+                    failed, ['attempts', 'last_error', 'status', 'next_attempt_at', 'claimed_by', 'claimed_until']
+                )
+            if connection_lost:
+                break
+    finally:
+        connection.close()
+        # Hand back what was claimed but not tried, e.g. after losing the server.
+        OutboundEmail.objects.filter(claimed_by=owner).update(claimed_by='', claimed_until=None)
+    return stats
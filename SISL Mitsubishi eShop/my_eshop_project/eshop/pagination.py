@@ -0,0 +1,122 @@
+"""
+Keyset pagination for product listings.
+
+OFFSET pagination makes the database walk past every earlier row, so deep
+pages of a large category get slower and slower. Here a page is instead
+"the next N rows after this sort key": the cursor carries the sort values
+of the last row shown and the next page is a plain indexed range scan,
+whatever its depth. Every ordering ends in the primary key, so the key is
+unique and no row is skipped or repeated between pages.
+"""
+import base64
+import json
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Sort name -> (label, ordering). Each ordering is covered by an index on
+# Product (see Product.Meta.indexes) when filtered by category or brand.
+SORTS = {
+    'newest': ("Newest", ('-id',)),
+    'price': ("Price: low to high", ('original_price', 'id')),
+    'price_desc': ("Price: high to low", ('-original_price', '-id')),
+    'name': ("Name", ('name', 'id')),
+}
+DEFAULT_SORT = 'newest'
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    sort: str
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _field_values(ordering, obj):
+    return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) if isinstance(value, Decimal) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering, model):
+    """
+    Sort values from a cursor, converted back to their field types. A
+    malformed or tampered cursor returns None, which restarts the listing.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        return [
+            model._meta.get_field(field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _after(ordering, values):
+    """
+    Rows strictly after `values` in `ordering`: for (a, id) that is
+    a > x OR (a = x AND id > y), with < for descending fields.
+    """
+    condition = Q()
+    for index, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        branch = Q(**{f'{name}__{lookup}': values[index]})
+        for earlier, value in zip(ordering[:index], values):
+            branch &= Q(**{earlier.lstrip('-'): value})
+        condition |= branch
+    return condition
+
+
+def _page_query(queryset, sort, cursor, per_page):
+    ordering = SORTS[sort][1]
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, ordering, queryset.model)
+        if values is not None:
+            queryset = queryset.filter(_after(ordering, values))
+    # One extra row tells whether a next page exists.
+    return queryset[:per_page + 1]
+
+
+def _page(rows, sort, per_page):
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(_field_values(SORTS[sort][1], items[-1]))
+    return KeysetPage(items=items, sort=sort, next_cursor=next_cursor)
+
+
+def _arguments(sort, per_page):
+    if sort not in SORTS:
+        sort = DEFAULT_SORT
+    return sort, per_page or getattr(settings, 'ESHOP_PAGE_SIZE', 24)
+
+
+def paginate(queryset, sort=None, cursor=None, per_page=None):
+    """
+    One page of `queryset` in `sort` order, starting after `cursor`, in a
+    single query.
+    """
+    sort, per_page = _arguments(sort, per_page)
+    return _page(list(_page_query(queryset, sort, cursor, per_page)), sort, per_page)
+
+
+async def apaginate(queryset, sort=None, cursor=None, per_page=None):
+    """paginate() for async views."""
+    sort, per_page = _arguments(sort, per_page)
+    return _page([row async for row in _page_query(queryset, sort, cursor, per_page)], sort, per_page)
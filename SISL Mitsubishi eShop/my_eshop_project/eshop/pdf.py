@@ -0,0 +1,333 @@
+"""
+Quotation PDF rendering.
+
+Rendering works on plain snapshots of a quotation (see quotation_data) so
+batches can be rendered in a process pool without the workers touching the
+database. Large quotations are streamed instead: lines are read with
+.iterator() and emitted as page-sized table chunks with a repeated header
+and a running subtotal, and ReportLab is fed the story lazily, so memory
+stays bounded by a few chunks regardless of the number of lines.
+ReportLab is only imported on the first render; stylesheet and table
+styles are then built once per process and shared by every document.
+"""
+import functools
+import io
+import os
+import tempfile
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from .metrics import PDF_RENDER_ERRORS, PDF_RENDER_SECONDS
+
+PdfStyles = namedtuple('PdfStyles', 'sheet header_table items_table subtotal_row')
+
+
+@functools.lru_cache(maxsize=None)
+def _styles():
+    """
+    The stylesheet and table styles, built on first render and shared by
+    every later document. ReportLab is imported here rather than at module
+    level so that importing this module (views, admin) stays cheap.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import TableStyle
+
+    header = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ])
+    items = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (2, 1), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+    ])
+    # Extra commands for the running subtotal row closing each chunk.
+    subtotal = TableStyle(items.getCommands() + [
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.beige),
+    ])
+    return PdfStyles(sheet=getSampleStyleSheet(), header_table=header, items_table=items, subtotal_row=subtotal)
+
+
+# Rows per table chunk. Each chunk, with its header and subtotal row, fills
+# one letter page; the first page also carries the title and header table.
+ROWS_FIRST_PAGE = 20
+ROWS_PER_CHUNK = 30
+ITERATOR_CHUNK_SIZE = 2000
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+HEADER_COL_WIDTHS = [120, 380]
+ITEMS_COL_WIDTHS = [100, 200, 60, 80, 80, 80]
+ITEMS_HEADER = ["Product", "Description", "Quantity", "Unit Price", "Discount (%)", "Line Total"]
+
+
+def prefetch_quotations(queryset):
+    """Load quotations with their customer, lines and line products (lines+products in one query)."""
+    from django.db.models import Prefetch
+
+    from .models import QuotationLine
+
+    return queryset.select_related('customer').prefetch_related(
+        Prefetch('lines', queryset=QuotationLine.objects.select_related('product').order_by('pk'))
+    )
+
+
+def _line_row(name, description, quantity, unit_price, discount_percent, currency, quotation_currency, rates):
+    """Return (cells, line total converted to the quotation currency)."""
+    subtotal = quantity * unit_price
+    line_total = subtotal - subtotal * (discount_percent / 100)
+    cells = [
+        name,
+        description or "",
+        str(quantity),
+        f"{currency} {unit_price:.2f}",
+        f"{discount_percent:.2f}",
+        f"{currency} {line_total:.2f}",
+    ]
+    return cells, rates.convert(line_total, currency, quotation_currency)
+
+
+def iter_line_rows(quotation, rates):
+    """Stream a quotation's lines straight from the database as plain values."""
+    from .models import QuotationLine
+
+    rows = (
+        QuotationLine.objects.filter(quotation_id=quotation.pk)
+        .order_by('pk')
+        .values_list('product__name', 'description', 'quantity', 'unit_price', 'discount_percent', 'currency')
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+    for row in rows:
+        yield _line_row(*row, quotation.currency, rates)
+
+
+def quotation_data(quotation, rates=None, stream_lines=False):
+    """
+    Snapshot everything the PDF needs as plain Python values. With
+    stream_lines=True the lines are a lazy iterator over the database
+    instead of a list (not picklable, but memory-bounded).
+    """
+    from .currency import get_rates, quotation_totals
+
+    rates = rates or get_rates()
+    if stream_lines:
+        lines = iter_line_rows(quotation, rates)
+    elif 'lines' in getattr(quotation, '_prefetched_objects_cache', {}):
+        lines = [
+            _line_row(line.product.name, line.description, line.quantity, line.unit_price,
+                      line.discount_percent, line.currency, quotation.currency, rates)
+            for line in quotation.lines.all()
+        ]
+    else:
+        lines = list(iter_line_rows(quotation, rates))
+    return {
+        'pk': quotation.pk,
+        'order_number': quotation.order_number or '',
+        'customer': str(quotation.customer),
+        'currency': quotation.currency,
+        'notes': quotation.notes or "N/A",
+        'lines': lines,
+        'totals': [(currency, f"{amount:.2f}") for currency, amount in quotation_totals(quotation, rates)],
+    }
+
+
+def snapshot_quotations(queryset):
+    """Snapshot a queryset of quotations with one rate table and three queries in total."""
+    from .currency import get_rates
+
+    rates = get_rates()
+    return [quotation_data(quotation, rates) for quotation in prefetch_quotations(queryset)]
+
+
+def _items_table(rows, style):
+    from reportlab.platypus import Table
+
+    table = Table([ITEMS_HEADER] + rows, colWidths=ITEMS_COL_WIDTHS, repeatRows=1)
+    table.setStyle(style)
+    return table
+
+
+def iter_story(data):
+    """Yield the flowables of one quotation, line items in page-sized chunks."""
+    from reportlab.platypus import PageBreak, Paragraph, Spacer, Table
+
+    styles = _styles()
+    yield Paragraph("Professional Quotation Details", styles.sheet['Title'])
+    yield Spacer(1, 12)
+
+    header_data = [
+        ["Field", "Value"],
+        ["Quotation ID", str(data['pk'])],
+        ["Customer", data['customer']],
+        ["Currency", data['currency']],
+        ["Notes", data['notes']],
+    ]
+    header_table = Table(header_data, colWidths=HEADER_COL_WIDTHS)
+    header_table.setStyle(styles.header_table)
+    yield header_table
+    yield Spacer(1, 24)
+
+    running_total = Decimal(0)
+    chunk = []
+    chunk_size = ROWS_FIRST_PAGE
+    for cells, amount in data['lines']:
+        if len(chunk) == chunk_size:
+            chunk.append(["", "", "", "", "Subtotal c/f", f"{data['currency']} {running_total:.2f}"])
+            yield _items_table(chunk, styles.subtotal_row)
+            yield PageBreak()
+            chunk = []
+            chunk_size = ROWS_PER_CHUNK
+        chunk.append(cells)
+        running_total += amount
+
+    # Total rows: the quotation currency first, then its converted equivalents
+    for currency, amount in data['totals']:
+        chunk.append(["", "", "", "", f"Total ({currency})", amount])
+    yield _items_table(chunk, styles.items_table)
+    yield Spacer(1, 12)
+
+
+def build_story(data):
+    return list(iter_story(data))
+
+
+class LazyStory(list):
+    """
+    A flowable list that tops itself up from a generator as ReportLab's
+    build loop consumes it, so only a few flowables exist at any time.
+    """
+
+    def __init__(self, flowables, lookahead=4):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+
+def _build(output, story):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
+
+    doc = SimpleDocTemplate(output, pagesize=letter, pageCompression=1)
+    doc.build(LazyStory(story))
+    return doc.page
+
+
+def _timed_build(kind, output, story):
+    try:
+        with PDF_RENDER_SECONDS.labels(kind=kind).time():
+            return _build(output, story)
+    except Exception:
+        PDF_RENDER_ERRORS.labels(kind=kind).inc()
+        raise
+
+
+def render_pdf(data, output):
+    """Render one quotation to a path or binary file object. Returns the page count."""
+    return _timed_build('single', output, iter_story(data))
+
+
+def _iter_merged_story(datas):
+    from reportlab.platypus import PageBreak
+
+    for index, data in enumerate(datas):
+        if index:
+            yield PageBreak()
+        yield from iter_story(data)
+
+
+def render_merged_pdf(datas, output):
+    """Render several quotations into one document, one quotation per page group."""
+    return _timed_build('merged', output, _iter_merged_story(datas))
+
+
+def render_quotation(quotation, output):
+    """Stream one quotation from the database into `output`. Returns the page count."""
+    return render_pdf(quotation_data(quotation, stream_lines=True), output)
+
+
+def spooled_quotation_pdf(quotation):
+    """
+    Render into a temporary file that stays in memory for small documents
+    and spills to disk for large ones. Returned rewound, ready to stream.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    render_quotation(quotation, spool)
+    spool.seek(0)
+    return spool
+
+
+def batch_file_name(data):
+    return f"quotation_{data['order_number'] or data['pk']}.pdf"
+
+
+def _render_to_bytes(data):
+    # Runs in pool workers, which exit without flushing metrics, so the
+    # timing is returned and recorded by the parent instead.
+    buffer = io.BytesIO()
+    started = time.perf_counter()
+    pages = _build(buffer, iter_story(data))
+    return batch_file_name(data), buffer.getvalue(), pages, time.perf_counter() - started
+
+
+def _record_batch(results):
+    try:
+        for file_name, content, pages, elapsed in results:
+            PDF_RENDER_SECONDS.labels(kind='batch').observe(elapsed)
+            yield file_name, content, pages
+    except Exception:
+        PDF_RENDER_ERRORS.labels(kind='batch').inc()
+        raise
+
+
+def render_many(datas, processes=None):
+    """
+    Render quotation snapshots, in a process pool when `processes` is not 1.
+    Yields (file_name, pdf_bytes, page_count) in input order.
+    """
+    if processes == 1 or len(datas) < 2:
+        yield from _record_batch(map(_render_to_bytes, datas))
+        return
+    chunksize = max(1, len(datas) // ((processes or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        yield from _record_batch(pool.map(_render_to_bytes, datas, chunksize=chunksize))
+
+
+def write_zip(rendered, fileobj):
+    """Write rendered PDFs into a ZIP archive. Returns (document_count, page_count)."""
+    documents = pages = 0
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_name, content, page_count in rendered:
+            archive.writestr(file_name, content)
+            documents += 1
+            pages += page_count
+    return documents, pages
+
@@ -0,0 +1,132 @@
+"""
+Customer portal: quotation history and re-quotes.
+
+A customer's history is a keyset-paginated list of their quotations (see
+eshop.pagination), each annotated with its line count and its total in
+every currency in the same query. The summary above it (how many
+quotations per status, their value in the catalog currency, the latest
+date) is one aggregate, cached per user until one of their quotations
+changes: saves and deletes through the ORM, workflow transitions and
+offline imports all invalidate it. The cache (ESHOP_QUOTATION_HISTORY_CACHE)
+is shared by all workers, so the worker that made the change also clears
+the summary for every other worker.
+
+requote() turns a past quotation into a new discount request: the lines
+are copied at today's list prices in one bulk insert, and the new
+quotation goes through the same PDF and email steps as one submitted
+from the product page.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .currency import annotate_totals, get_rates, total_field_name
+from .metrics import QUOTATIONS_SUBMITTED
+from .models import Currency, OrderStatus, Quotation, QuotationLine
+from .order_numbers import next_order_number
+from .outbox import enqueue_quotation_emails
+from .pagination import paginate
+from .workflow import on_transition
+
+# Catalog prices, and so re-quoted lines, are in this currency.
+CATALOG_CURRENCY = Currency.BDT
+
+
+def _history_key(user_id):
+    return f'eshop:quotation_history:{user_id}'
+
+
+def _cache():
+    return caches[getattr(settings, 'ESHOP_QUOTATION_HISTORY_CACHE', 'default')]
+
+
+def invalidate_history(*user_ids):
+    _cache().delete_many([_history_key(user_id) for user_id in user_ids if user_id is not None])
+
+
+def history_summary(user):
+    """
+    {'quotations', 'by_status': {label: count}, 'total', 'currency',
+    'last_quoted_at'} for `user`, from cache or one aggregate query.
+    """
+    cache = _cache()
+    key = _history_key(user.pk)
+    summary = cache.get(key)
+    if summary is not None:
+        return summary
+    total_field = total_field_name(CATALOG_CURRENCY)
+    quotations = annotate_totals(Quotation.objects.filter(customer=user), currencies=[CATALOG_CURRENCY])
+    row = quotations.aggregate(
+        quotations=Count('pk'),
+        total=Sum(total_field),
+        last_quoted_at=Max('created_at'),
+        **{status: Count('pk', filter=Q(status=status)) for status in OrderStatus.values},
+    )
+    summary = {
+        'quotations': row['quotations'],
+        'by_status': {OrderStatus(status).label: row[status] for status in OrderStatus.values if row[status]},
+        'total': row['total'] or 0,
+        'currency': CATALOG_CURRENCY,
+        'last_quoted_at': row['last_quoted_at'],
+    }
+    cache.set(key, summary, getattr(settings, 'ESHOP_QUOTATION_HISTORY_CACHE_TTL', 3600))
+    return summary
+
+
+def history_page(user, cursor=None):
+    """One page of `user`'s quotations, newest first, in a single query."""
+    quotations = annotate_totals(
+        Quotation.objects.filter(customer=user).annotate(line_count=Count('lines')),
+        rates=get_rates(),
+    )
+    return paginate(quotations, 'newest', cursor)
+
+
+def requote(quotation, user):
+    """
+    A new discount request from `user` with the lines of `quotation` at
+    current list prices and no discount. Returns the new Quotation.
+    """
+    lines = list(quotation.lines.select_related('product').order_by('pk'))
+    with transaction.atomic():
+        order_number = next_order_number()
+        new_quote = Quotation.objects.create(
+            customer=user,
+            order_number=order_number,
+            subject=f"Re-quote of {quotation.order_number or quotation.pk} as order no: {order_number} "
+                    f"on {timezone.now().strftime('%Y-%m-%d')}",
+            notes=quotation.notes,
+            currency=quotation.currency,
+        )
+        QuotationLine.objects.bulk_create([
+            QuotationLine(
+                quotation=new_quote,
+                product=line.product,
+                description=line.description,
+                quantity=line.quantity,
+                unit_price=line.product.original_price,
+                currency=CATALOG_CURRENCY,
+            )
+            for line in lines
+        ])
+        new_quote.compute_total()
+        enqueue_quotation_emails(new_quote)
+    QUOTATIONS_SUBMITTED.labels(currency=new_quote.currency).inc()
+    return new_quote
+
+
+@receiver(post_save, sender=Quotation)
+@receiver(post_delete, sender=Quotation)
+def _quotation_changed(sender, instance, **kwargs):
+    invalidate_history(instance.customer_id)
+
+
+@on_transition(*OrderStatus.values)
+def _quotations_transitioned(changes, to_status, user):
+    # Transitions update rows in bulk, without post_save.
+    customers = Quotation.objects.filter(pk__in=[pk for pk, _ in changes]).values_list('customer_id', flat=True)
+    invalidate_history(*set(customers))
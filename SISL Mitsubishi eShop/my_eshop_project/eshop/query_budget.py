@@ -0,0 +1,174 @@
+"""
+Query budgets: a ceiling on the SQL queries a view may run.
+
+Every URL name in eshop/urls.py has a budget in ESHOP_QUERY_BUDGETS. The
+budgets do not grow with the data, so a template change that brings back
+an N+1 pattern ({{ line.product.name }} over unprefetched lines, say)
+breaks the budget as soon as the page shows more than a few rows.
+
+Budgets are enforced in two places:
+
+* QueryBudgetMiddleware, in development (ESHOP_QUERY_BUDGET['ENABLED']
+  follows DEBUG): a request over its budget is logged to the
+  "eshop.query_budget" logger, or raises QueryBudgetExceeded so the debug
+  page shows it when RAISE is set.
+* The test suite, which requests every route through query_budget().
+
+query_budget() also works on its own, as a context manager or decorator:
+
+    with query_budget(3):
+        render_quotation(quotation)
+
+The failure report lists the queries run more than once, each with the
+template tags ({% for %} / {{ variable }}, with line numbers) and the
+project code that were running when it was first executed.
+"""
+import logging
+import os
+import sys
+import traceback
+from collections import Counter
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Node, TokenType
+
+logger = logging.getLogger('eshop.query_budget')
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Raise QueryBudgetExceeded instead of logging a warning.
+    'RAISE': False,
+    # Budget of URL names missing from ESHOP_QUERY_BUDGETS; None leaves them unchecked.
+    'DEFAULT': None,
+}
+# Queries listed in a failure report.
+REPORT_LIMIT = 10
+
+_RENDER_CODE = Node.render_annotated.__code__
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ESHOP_QUERY_BUDGET', {})}
+
+
+def budget_for(url_name):
+    """The query budget of a URL name, or the configured default."""
+    return getattr(settings, 'ESHOP_QUERY_BUDGETS', {}).get(url_name, get_config()['DEFAULT'])
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def template_stack():
+    """The template nodes being rendered, outermost first, as 'name:line {% tag %}'."""
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code is _RENDER_CODE:
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            if token is not None:
+                origin = getattr(node, 'origin', None)
+                name = getattr(origin, 'template_name', None) or getattr(origin, 'name', '?')
+                tag = f"{{{{ {token.contents} }}}}" if token.token_type == TokenType.VAR else f"{{% {token.contents} %}}"
+                frames.append(f"{name}:{token.lineno} {tag}")
+        frame = frame.f_back
+    return frames[::-1]
+
+
+def _project_stack():
+    """Frames of project code (not Django or other installed packages), outermost first."""
+    root = str(settings.BASE_DIR)
+    return [
+        f"{os.path.relpath(entry.filename, root)}:{entry.lineno} in {entry.name}"
+        for entry in traceback.extract_stack()
+        if entry.filename.startswith(root) and entry.filename != __file__ and 'site-packages' not in entry.filename
+    ]
+
+
+class QueryLog:
+    """
+    execute_wrapper that keeps every SQL statement with where it came from.
+    SQL is kept with its placeholders, so the same query with different
+    parameters counts as a repeat.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        if sql not in self._origins:
+            self._origins[sql] = (template_stack(), _project_stack())
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def duplicates(self):
+        """[(sql, times run)] for queries run more than once, most repeated first."""
+        return [(sql, count) for sql, count in Counter(self.queries).most_common() if count > 1]
+
+    def report(self, budget, label=None):
+        lines = [f"{label or 'Block'} ran {len(self.queries)} queries, over its budget of {budget}."]
+        duplicates = self.duplicates()
+        if duplicates:
+            lines.append("Repeated queries (likely N+1):")
+        for sql, count in duplicates[:REPORT_LIMIT]:
+            templates, code = self._origins[sql]
+            lines.append(f"  {count} x {sql}")
+            lines.extend(f"      template {frame}" for frame in templates)
+            lines.extend(f"      at {frame}" for frame in code[-3:])
+        if not duplicates:
+            lines.append("Queries:")
+            lines.extend(f"  {sql}" for sql in self.queries[:REPORT_LIMIT])
+        return '\n'.join(lines)
+
+
+class query_budget(ContextDecorator):
+    """Fail with QueryBudgetExceeded when the block runs more than `budget` queries."""
+
+    def __init__(self, budget, label=None, using='default'):
+        self.budget = budget
+        self.label = label
+        self.using = using
+
+    def __enter__(self):
+        self.log = QueryLog()
+        self._wrapper = connections[self.using].execute_wrapper(self.log)
+        self._wrapper.__enter__()
+        return self.log
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._wrapper.__exit__(exc_type, exc_value, tb)
+        if exc_type is None and self.budget is not None and len(self.log) > self.budget:
+            raise QueryBudgetExceeded(self.log.report(self.budget, self.label))
+        return False
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.raise_errors = config['RAISE']
+
+    def __call__(self, request):
+        log = QueryLog()
+        with connections['default'].execute_wrapper(log):
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        budget = budget_for(url_name) if url_name else None
+        if budget is not None and len(log) > budget:
+            report = log.report(budget, f"{request.method} {request.path} ({url_name})")
+            if self.raise_errors:
+                raise QueryBudgetExceeded(report)
+            logger.warning(report)
+        return response
@@ -0,0 +1,113 @@
+"""
+Batch editing of quotation lines with optimistic concurrency.
+
+A batch of add/update/delete operations is applied in one transaction
+with a fixed number of queries, however many lines it touches: the
+version check, one read of the lines being changed, one product lookup,
+one DELETE, one bulk UPDATE, one bulk INSERT and the total (a single
+aggregate plus its UPDATE).
+
+Every edit names the Quotation.version it was based on. The version is
+checked and bumped by one conditional UPDATE, so of two staff members
+editing the same quotation the second is told about the conflict
+(VersionConflict) instead of silently overwriting the first. Only
+pending quotations can be edited; a confirmed, delivered or canceled one
+keeps the lines it was decided on.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .currency import ExchangeRateMissing
+from .models import OrderStatus, Product, Quotation, QuotationLine
+
+
+class VersionConflict(Exception):
+    """The quotation changed since the version the edit was based on."""
+
+    def __init__(self, quotation_id, current_version):
+        super().__init__(f"Quotation #{quotation_id} is at version {current_version}; reload and retry.")
+        self.current_version = current_version
+
+
+class LineEditError(Exception):
+    """
+    The batch cannot be applied: the quotation is no longer pending, or
+    the batch names lines or products that do not exist or a currency
+    without an exchange rate.
+    """
+
+
+def _set(line, changes):
+    for name, value in changes.items():
+        setattr(line, 'product_id' if name == 'product' else name, value)
+
+
+def apply_line_changes(quotation, version, add=(), update=(), delete=()):
+    """
+    Apply a batch to `quotation` (see QuotationLineBatchSerializer): `add`
+    and `update` are lists of field dicts, updates carrying the line `id`;
+    `delete` is a list of line ids. Raises VersionConflict or LineEditError,
+    leaving the quotation untouched. Returns the new version and total and
+    only the lines that were created or updated.
+    """
+    update_ids = [change['id'] for change in update]
+    with transaction.atomic():
+        bumped = Quotation.objects.filter(
+            pk=quotation.pk, version=version, status=OrderStatus.PENDING,
+        ).update(version=F('version') + 1)
+        if not bumped:
+            current, status = Quotation.objects.filter(pk=quotation.pk).values_list('version', 'status').first()
+            if status != OrderStatus.PENDING:
+                raise LineEditError(
+                    f"Quotation #{quotation.pk} is {OrderStatus(status).label.lower()}; "
+                    "only pending quotations can be edited."
+                )
+            raise VersionConflict(quotation.pk, current)
+
+        lines = {}
+        if update_ids or delete:
+            lines = QuotationLine.objects.filter(quotation=quotation).in_bulk(update_ids + list(delete))
+        missing = sorted((set(update_ids) | set(delete)) - set(lines))
+        if missing:
+            raise LineEditError(f"Quotation #{quotation.pk} has no line(s) {', '.join(map(str, missing))}.")
+
+        product_ids = {change['product'] for change in [*add, *update] if 'product' in change}
+        if product_ids:
+            unknown = product_ids - set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+            if unknown:
+                raise LineEditError(f"No product(s) {', '.join(map(str, sorted(unknown)))}.")
+
+        if delete:
+            QuotationLine.objects.filter(pk__in=delete).delete()
+
+        updated, fields = [], set()
+        for change in update:
+            line = lines[change['id']]
+            changes = {name: value for name, value in change.items() if name != 'id'}
+            _set(line, changes)
+            fields.update(changes)
+            updated.append(line)
+        if fields:
+            QuotationLine.objects.bulk_update(updated, sorted(fields))
+
+        created = []
+        for change in add:
+            line = QuotationLine(quotation=quotation)
+            _set(line, change)
+            created.append(line)
+        QuotationLine.objects.bulk_create(created)
+
+        try:
+            quotation.compute_total()
+        except ExchangeRateMissing as exc:
+            # Raised inside the transaction, so the whole batch is undone.
+            raise LineEditError(str(exc)) from None
+        quotation.version = version + 1
+    return {
+        'id': quotation.pk,
+        'version': quotation.version,
+        'total_amount': quotation.total_amount,
+        'created': created,
+        'updated': updated,
+        'deleted': sorted(delete),
+    }
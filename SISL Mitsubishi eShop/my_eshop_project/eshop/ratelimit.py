@@ -0,0 +1,225 @@
+"""
+Token-bucket rate limiting for search, the product API and quotations.
+
+Each scope in ESHOP_RATE_LIMITS has a refill rate ("30/m": thirty tokens a
+minute), a burst size (the bucket capacity, by default the rate's count)
+and a key: 'ip' gives every client address its own bucket, 'user' every
+signed-in user (anonymous requests fall back to their address). A request
+takes one token; an empty bucket answers 429 Too Many Requests with a
+Retry-After header saying when the next token is due.
+
+Buckets live in the ESHOP_RATE_LIMIT_CACHE cache. With a backend the
+workers share (memcached, Redis), the configured rates are site-wide. The
+default LocMemCache, like ESHOP_RATE_LIMIT_CACHE = None, keeps buckets per
+process. A client spread over N workers would then get N times the rate,
+so each process refills its buckets at rate / ESHOP_RATE_LIMIT_PROCESSES
+and keeps the full burst. A client always gets its configured burst, and
+over time at most the configured rate site-wide; only a client spread
+over several workers can burst more than once, up to one burst per
+worker. The file and database caches are not suitable: every write scans
+the directory or counts the table.
+
+A bucket is one get and one set; the two are not atomic, so concurrent
+requests on one key may occasionally both take the last token, which is
+fine for abuse protection. If the cache backend fails, buckets fall back
+to this process, so a cache outage loosens the limits instead of failing
+requests.
+
+Function views use the @rate_limit(scope) decorator (sync or async);
+DRF views get ScopedRateThrottle-style integration through
+TokenBucketThrottle. Checks are timed by `manage.py benchmark_ratelimit`.
+"""
+import functools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LOCAL_MAX_BUCKETS = 10000
+
+
+def parse_rate(rate):
+    """'30/m' -> tokens per second (0.5)."""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period[0]]
+
+
+class Limit:
+    __slots__ = ('scope', 'per_second', 'burst', 'key')
+
+    def __init__(self, scope, rate, burst=None, key='ip', processes=1):
+        # `processes`: workers that each hold their own bucket for a client.
+        # They share the refill rate; each keeps the whole burst.
+        self.scope = scope
+        self.per_second = parse_rate(rate) / processes
+        self.burst = burst or int(rate.split('/')[0])
+        self.key = key
+
+
+def take(state, limit, now):
+    """
+    One token from a bucket. `state` is (tokens, updated_at) or None for a
+    full bucket. Returns (allowed, new state, seconds until the next token).
+    """
+    tokens, updated_at = state or (limit.burst, now)
+    tokens = min(limit.burst, tokens + (now - updated_at) * limit.per_second)
+    if tokens >= 1:
+        return True, (tokens - 1, now), 0
+    return False, (tokens, now), (1 - tokens) / limit.per_second
+
+
+class LocalBuckets:
+    """In-process buckets: the fallback when the cache backend is down."""
+
+    def __init__(self, max_buckets=LOCAL_MAX_BUCKETS):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.max_buckets = max_buckets
+
+    def take(self, key, limit, now):
+        with self._lock:
+            allowed, state, retry_after = take(self._buckets.pop(key, None), limit, now)
+            self._buckets[key] = state
+            if len(self._buckets) > self.max_buckets:
+                # Forget the least recently used bucket; it was full by now
+                # or belongs to a client that went away.
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+local_buckets = LocalBuckets()
+_limits = {}
+_limits_source = None
+
+
+def bucket_processes():
+    """How many processes hold separate buckets: 1 when the cache is shared."""
+    alias = getattr(settings, 'ESHOP_RATE_LIMIT_CACHE', 'default')
+    try:
+        shared = alias is not None and not isinstance(caches[alias], LocMemCache)
+    except Exception:
+        # A broken alias falls back to in-process buckets, see _take().
+        shared = False
+    return 1 if shared else max(1, getattr(settings, 'ESHOP_RATE_LIMIT_PROCESSES', 1))
+
+
+def get_limit(scope):
+    """The Limit for `scope`, or None when the scope is not limited."""
+    global _limits, _limits_source
+    source = (getattr(settings, 'ESHOP_RATE_LIMITS', {}), bucket_processes())
+    if _limits_source is None or source[0] is not _limits_source[0] or source[1] != _limits_source[1]:
+        configured, processes = source
+        _limits = {name: Limit(name, processes=processes, **options) for name, options in configured.items()}
+        _limits_source = source
+    return _limits.get(scope)
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def _take(key, limit):
+    now = time.time()
+    alias = getattr(settings, 'ESHOP_RATE_LIMIT_CACHE', 'default')
+    if alias is None:
+        return local_buckets.take(key, limit, now)
+    try:
+        cache = caches[alias]
+        allowed, state, retry_after = take(cache.get(key), limit, now)
+        # Once the bucket has refilled completely it is the same as no entry.
+        cache.set(key, state, timeout=math.ceil(limit.burst / limit.per_second) + 1)
+    except Exception:
+        logger.warning("Rate limit cache %r unavailable; using in-process buckets.", alias, exc_info=True)
+        return local_buckets.take(key, limit, now)
+    return allowed, retry_after
+
+
+def check(scope, ident):
+    """
+    Take a token for `ident` (an address or user key) in `scope`. Returns
+    (allowed, seconds to wait before retrying).
+    """
+    limit = get_limit(scope)
+    if limit is None or not getattr(settings, 'ESHOP_RATE_LIMIT_ENABLED', True):
+        return True, 0
+    allowed, retry_after = _take(f'eshop:ratelimit:{scope}:{ident}', limit)
+    if not allowed:
+        RATE_LIMITED.labels(scope=scope).inc()
+    return allowed, retry_after
+
+
+def _ident(limit, user):
+    if limit is not None and limit.key == 'user' and user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return None
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse("Too many requests. Please try again shortly.\n", status=429, content_type='text/plain')
+    response['Retry-After'] = max(1, math.ceil(retry_after))
+    return response
+
+
+def rate_limit(scope, methods=None):
+    """
+    Limit a function view (sync or async) with the `scope` bucket. With
+    `methods`, only those HTTP methods take a token, e.g. ('POST',).
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if methods is None or request.method in methods:
+                    limit = get_limit(scope)
+                    # request.user would query the database on the event loop.
+                    user = await sync_to_async(get_user)(request) if limit and limit.key == 'user' else None
+                    allowed, retry_after = check(scope, _ident(limit, user) or client_ip(request))
+                    if not allowed:
+                        return too_many_requests(retry_after)
+                return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if methods is None or request.method in methods:
+                    limit = get_limit(scope)
+                    user = getattr(request, 'user', None) if limit and limit.key == 'user' else None
+                    allowed, retry_after = check(scope, _ident(limit, user) or client_ip(request))
+                    if not allowed:
+                        return too_many_requests(retry_after)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle backed by the same buckets. Views pick a scope with
+    `throttle_scope`; views without one use the 'api' scope. DRF turns a
+    refusal into 429 with Retry-After.
+    """
+
+    default_scope = 'api'
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None) or self.default_scope
+        limit = get_limit(scope)
+        # REMOTE_ADDR like the function views, rather than a spoofable X-Forwarded-For.
+        allowed, self._retry_after = check(scope, _ident(limit, request.user) or client_ip(request))
+        return allowed
+
+    def wait(self):
+        return self._retry_after
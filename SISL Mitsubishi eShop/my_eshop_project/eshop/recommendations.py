@@ -0,0 +1,136 @@
+"""
+"Customers also quoted" recommendations.
+
+Every quotation is a basket of products. build_recommendations() streams
+quotation lines ordered by quotation, accumulates a sparse item-item
+co-occurrence matrix, scores each pair by cosine similarity
+
+    score(a, b) = co_quotations(a, b) / sqrt(quotations(a) * quotations(b))
+
+and stores the top K neighbours per product in ProductRecommendation, so
+pages and the API read them back with one indexed query.
+
+With `since`, only products quoted since then are recomputed (from every
+quotation they appear in); a periodic full rebuild also refreshes products
+whose neighbours' popularity changed.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import groupby, islice
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import OrderStatus, ProductRecommendation, QuotationLine
+
+DEFAULT_TOP_K = 10
+# Baskets with more distinct products than this (price-list requests,
+# catalog dumps) add noise and O(n^2) pairs, so they are skipped.
+DEFAULT_MAX_BASKET = 100
+EXCLUDED_STATUSES = (OrderStatus.CANCELED,)
+
+
+class CooccurrenceMatrix:
+    """
+    Sparse symmetric product x product counts in dictionary-of-keys form:
+    rows[a][b] is the number of baskets holding both a and b. Only rows for
+    `products` are kept when given.
+    """
+
+    def __init__(self, products=None):
+        self.products = products
+        self.rows = defaultdict(Counter)
+
+    def add_basket(self, items):
+        for a in items:
+            if self.products is not None and a not in self.products:
+                continue
+            row = self.rows[a]
+            for b in items:
+                if b != a:
+                    row[b] += 1
+
+    def top_k(self, product_id, frequencies, k=DEFAULT_TOP_K, min_count=1):
+        """The `k` best (recommended_id, score, count) for one product."""
+        n_a = frequencies.get(product_id)
+        if not n_a:
+            return []
+        candidates = (
+            (b, count / math.sqrt(n_a * frequencies[b]), count)
+            for b, count in self.rows.get(product_id, {}).items()
+            if count >= min_count and frequencies.get(b)
+        )
+        # Ties go to the pair quoted together more often, then the older product.
+        return heapq.nlargest(k, candidates, key=lambda entry: (entry[1], entry[2], -entry[0]))
+
+
+def _baskets(lines, max_basket, skipped):
+    rows = lines.order_by('quotation_id').values_list('quotation_id', 'product_id').iterator(chunk_size=10000)
+    for _, group in groupby(rows, key=lambda row: row[0]):
+        items = {product_id for _, product_id in group}
+        if len(items) > max_basket:
+            skipped.append(len(items))
+            continue
+        if len(items) > 1:
+            yield items
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def build_recommendations(top_k=DEFAULT_TOP_K, since=None, max_basket=DEFAULT_MAX_BASKET, min_count=1,
+                          batch_size=5000):
+    """
+    Recompute the stored neighbours, for every product or, with `since`
+    (a datetime), only for products on quotations created since then.
+    Returns counts of what was done.
+    """
+    lines = QuotationLine.objects.exclude(quotation__status__in=EXCLUDED_STATUSES)
+    products = None
+    if since is not None:
+        recent = lines.filter(quotation__created_at__gte=since)
+        products = set(recent.values_list('product_id', flat=True).distinct())
+        lines = lines.filter(quotation_id__in=lines.filter(product_id__in=recent.values('product_id'))
+                             .values('quotation_id'))
+
+    # Quotations per product over the whole history, for the cosine norm.
+    frequencies = dict(
+        QuotationLine.objects.exclude(quotation__status__in=EXCLUDED_STATUSES)
+        .values_list('product_id').annotate(n=Count('quotation_id', distinct=True)).order_by()
+    )
+
+    matrix = CooccurrenceMatrix(products)
+    skipped = []
+    baskets = 0
+    for items in _baskets(lines, max_basket, skipped):
+        matrix.add_basket(items)
+        baskets += 1
+
+    recommendations = (
+        ProductRecommendation(product_id=product_id, recommended_id=recommended_id, rank=rank,
+                              score=score, co_quotations=count)
+        for product_id in sorted(matrix.rows)
+        for rank, (recommended_id, score, count) in enumerate(
+            matrix.top_k(product_id, frequencies, top_k, min_count), start=1
+        )
+    )
+    created = 0
+    with transaction.atomic():
+        if products is None:
+            ProductRecommendation.objects.all().delete()
+        else:
+            for batch in _batches(products, batch_size):
+                ProductRecommendation.objects.filter(product_id__in=batch).delete()
+        for batch in _batches(recommendations, batch_size):
+            ProductRecommendation.objects.bulk_create(batch)
+            created += len(batch)
+    return {
+        'baskets': baskets,
+        'skipped_baskets': len(skipped),
+        'products': len(matrix.rows),
+        'recommendations': created,
+    }
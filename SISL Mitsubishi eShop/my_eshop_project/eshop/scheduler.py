@@ -0,0 +1,239 @@
+"""
+Periodic maintenance jobs.
+
+`manage.py run_scheduler` is a long-running process that runs the jobs in
+ESHOP_SCHEDULED_JOBS. Each job names a function by dotted path, its
+keyword arguments and a cron schedule: five fields (minute, hour, day of
+month, month, day of week; *, lists, ranges and /steps) in the
+TIME_ZONE setting, or one of @hourly, @daily, @weekly and @monthly:
+
+    'clean_quotation_files': {
+        'schedule': '30 2 * * *',
+        'function': 'eshop.maintenance.clean_quotation_files',
+        'kwargs': {'max_age_days': 30},
+    },
+
+Any number of schedulers may run, on one machine or on several sharing
+the database, and each due run still happens once. A job's JobLock row
+holds when it is next due; a scheduler claims the run with one
+conditional UPDATE that only matches a due, unleased row, and leases it
+for the job's 'lease' seconds (ESHOP_SCHEDULER_LEASE by default). If a
+scheduler dies mid-run, the lease runs out and the next scheduler to poll
+runs the job again. The next run is counted from when a run finished, so a
+scheduler that was down does not replay the runs it missed.
+
+Every run is recorded as a JobRun (outcome, duration, result or
+traceback), counted in eshop_job_runs_total and timed in
+eshop_job_seconds; /metrics also reports each job's last success from the
+JobRun table.
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .metrics import JOB_RUNS, JOB_SECONDS, REGISTRY
+from .models import JobLock, JobRun, JobStatus
+
+logger = logging.getLogger(__name__)
+
+ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+}
+# Bounds of minute, hour, day of month, month and day of week (0 and 7 are Sunday).
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+# next_after() gives up on schedules that never match, e.g. '0 0 31 2 *'.
+SEARCH_DAYS = 5 * 366
+RESULT_MAX_LENGTH = 2000
+
+
+def _parse_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        body, _, step = part.partition('/')
+        try:
+            if body == '*':
+                start, end = low, high
+            elif '-' in body:
+                start, end = (int(value) for value in body.split('-', 1))
+            else:
+                # As in cron, 'a/n' means 'a-<max>/n'.
+                start = int(body)
+                end = high if step else start
+            step = int(step) if step else 1
+        except ValueError:
+            raise ValueError(f"Invalid cron field {field!r}.") from None
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Invalid cron field {field!r}: values must be within {low}-{high}.")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """A cron expression; next_after() is the first matching minute after a time."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        fields = ALIASES.get(spec.strip(), spec).split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression {spec!r}: expected 5 fields, got {len(fields)}.")
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(field, low, high) for field, (low, high) in zip(fields, FIELD_RANGES)
+        )
+        # cron counts weekdays from Sunday, datetime.weekday() from Monday.
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        # As in cron, when both day fields are restricted either may match.
+        self.either_day = not fields[2].startswith('*') and not fields[4].startswith('*')
+
+    def __repr__(self):
+        return f"CronSchedule({self.spec!r})"
+
+    def _day_matches(self, moment):
+        in_month, in_week = moment.day in self.days, moment.weekday() in self.weekdays
+        return in_month or in_week if self.either_day else in_month and in_week
+
+    def next_after(self, moment):
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=SEARCH_DAYS)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression {self.spec!r} never matches.")
+
+
+class Job:
+    __slots__ = ('name', 'schedule', 'function', 'kwargs', 'lease')
+
+    def __init__(self, name, schedule, function, kwargs=None, lease=None, enabled=True):
+        self.name = name
+        self.schedule = CronSchedule(schedule)
+        self.function = import_string(function) if isinstance(function, str) else function
+        self.kwargs = kwargs or {}
+        self.lease = lease or getattr(settings, 'ESHOP_SCHEDULER_LEASE', 3600)
+
+
+def get_jobs():
+    """{name: Job} for the enabled jobs in ESHOP_SCHEDULED_JOBS."""
+    return {
+        name: Job(name, **options)
+        for name, options in getattr(settings, 'ESHOP_SCHEDULED_JOBS', {}).items()
+        if options.get('enabled', True)
+    }
+
+
+def _format_result(result):
+    if result is None:
+        return ''
+    if isinstance(result, dict):
+        result = ', '.join(f"{key}={value}" for key, value in result.items())
+    return str(result)[:RESULT_MAX_LENGTH]
+
+
+def prune_job_runs(keep_days=90):
+    """Delete finished JobRuns older than `keep_days`."""
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    deleted, _ = JobRun.objects.filter(started_at__lt=cutoff).exclude(status=JobStatus.RUNNING).delete()
+    return {'deleted': deleted}
+
+
+class Scheduler:
+    """
+    Claims and runs due jobs. `owner` identifies this scheduler in JobLock
+    and JobRun rows (host:pid:random by default); `clock` is for tests.
+    """
+
+    def __init__(self, jobs=None, owner=None, clock=timezone.now):
+        self.jobs = get_jobs() if jobs is None else jobs
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.clock = clock
+
+    def sync(self):
+        """Add a JobLock for new jobs and reschedule jobs whose schedule changed."""
+        now = self.clock()
+        locks = {lock.name: lock for lock in JobLock.objects.filter(name__in=self.jobs)}
+        for job in self.jobs.values():
+            lock = locks.get(job.name)
+            if lock is None:
+                JobLock.objects.get_or_create(name=job.name, defaults={
+                    'schedule': job.schedule.spec, 'next_run_at': job.schedule.next_after(now),
+                })
+            elif lock.schedule != job.schedule.spec:
+                JobLock.objects.filter(pk=lock.pk, schedule=lock.schedule).update(
+                    schedule=job.schedule.spec, next_run_at=job.schedule.next_after(now),
+                )
+
+    def claim(self, job, force=False):
+        """Lease `job` if it is due (or `force`) and no other scheduler holds it."""
+        now = self.clock()
+        due = Q() if force else Q(next_run_at__lte=now)
+        unleased = Q(locked_until__isnull=True) | Q(locked_until__lte=now)
+        claimed = JobLock.objects.filter(due, unleased, name=job.name).update(
+            owner=self.owner, locked_until=now + timedelta(seconds=job.lease),
+        )
+        return claimed == 1
+
+    def run(self, job):
+        """Run a claimed job, record it and release the lock. Returns the JobRun."""
+        # A run still marked running belongs to a scheduler whose lease ran out.
+        JobRun.objects.filter(job=job.name, status=JobStatus.RUNNING).update(
+            status=JobStatus.FAILED, error="Abandoned: the scheduler's lease ran out before the run finished.",
+        )
+        run = JobRun.objects.create(job=job.name, owner=self.owner, started_at=self.clock())
+        started = time.perf_counter()
+        try:
+            result = job.function(**job.kwargs)
+        except Exception:
+            logger.exception("Scheduled job %s failed", job.name)
+            run.status, run.error = JobStatus.FAILED, traceback.format_exc()
+        else:
+            run.status, run.result = JobStatus.SUCCEEDED, _format_result(result)
+        run.duration = time.perf_counter() - started
+        run.finished_at = self.clock()
+        run.save(update_fields=['status', 'result', 'error', 'duration', 'finished_at'])
+
+        JOB_RUNS.labels(job=job.name, outcome=JobStatus(run.status).name.lower()).inc()
+        JOB_SECONDS.labels(job=job.name).observe(run.duration)
+        # The scheduler may sleep for hours; publish the run to /metrics now.
+        REGISTRY.flush()
+        JobLock.objects.filter(name=job.name, owner=self.owner).update(
+            next_run_at=job.schedule.next_after(run.finished_at), owner='', locked_until=None,
+        )
+        return run
+
+    def run_pending(self):
+        """Run every due job this scheduler can claim, in configuration order."""
+        return [self.run(job) for job in self.jobs.values() if self.claim(job)]
+
+    def run_now(self, name):
+        """Run a job regardless of its schedule; None if another scheduler holds it."""
+        job = self.jobs[name]
+        return self.run(job) if self.claim(job, force=True) else None
+
+    def seconds_until_due(self, poll_interval):
+        """How long to sleep: until the next job is due, at most `poll_interval`."""
+        # Jobs leased by another scheduler are picked up at the next poll at the latest.
+        released = JobLock.objects.filter(name__in=self.jobs, owner='')
+        next_run = released.aggregate(at=Min('next_run_at'))['at']
+        if next_run is None:
+            return poll_interval
+        return min(poll_interval, max(1.0, (next_run - self.clock()).total_seconds()))
@@ -1,5 +1,8 @@
+from decimal import Decimal
+
+from django.conf import settings
 from rest_framework import serializers
-from .models import Brand, Product
+from .models import Brand, Currency, OrderStatus, Product, QuotationLine
 
 class BrandSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,3 +15,83 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+
+class QuotationTransitionSerializer(serializers.Serializer):
+    """
+    Bulk status change: either an explicit list of quotation ids, or every
+    quotation currently in `from_status`.
+    """
+    status = serializers.ChoiceField(choices=OrderStatus.choices)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    from_status = serializers.ChoiceField(choices=OrderStatus.choices, required=False)
+    note = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+    def validate(self, attrs):
+        if not attrs.get('ids') and not attrs.get('from_status'):
+            raise serializers.ValidationError("Provide either 'ids' or 'from_status'.")
+        return attrs
+
+class OfflineQuotationLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    discount_percent = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, default=Decimal(0),
+    )
+    currency = serializers.ChoiceField(choices=Currency.choices, default=Currency.BDT)
+    description = serializers.CharField(max_length=255, allow_blank=True, default='')
+
+class OfflineQuotationSerializer(serializers.Serializer):
+    """A quotation written offline; offline_id is generated by the device."""
+    offline_id = serializers.UUIDField()
+    catalog_version = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
+    currency = serializers.ChoiceField(choices=Currency.choices, default=Currency.BDT)
+    notes = serializers.CharField(allow_blank=True, default='')
+    lines = OfflineQuotationLineSerializer(many=True, allow_empty=False)
+
+class OfflineQuotationImportSerializer(serializers.Serializer):
+    quotations = OfflineQuotationSerializer(many=True, allow_empty=False)
+
+    def validate_quotations(self, value):
+        limit = getattr(settings, 'ESHOP_OFFLINE_IMPORT_MAX_QUOTATIONS', 200)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"Upload at most {limit} quotations at a time.")
+        return value
+
+class QuotationLineSerializer(serializers.ModelSerializer):
+    product = serializers.IntegerField(source='product_id')
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        model = QuotationLine
+        fields = ['id', 'product', 'description', 'quantity', 'unit_price', 'discount_percent', 'currency', 'line_total']
+
+class QuotationLineUpdateSerializer(serializers.Serializer):
+    """Changes to one existing line; fields left out keep their value."""
+    id = serializers.IntegerField(min_value=1)
+    product = serializers.IntegerField(min_value=1, required=False)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    discount_percent = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False)
+    currency = serializers.ChoiceField(choices=Currency.choices, required=False)
+    description = serializers.CharField(max_length=255, allow_blank=True, required=False)
+
+class QuotationLineBatchSerializer(serializers.Serializer):
+    """
+    One batch of line edits based on quotation `version`: lines to add
+    (same fields as an offline quotation line), changes to existing lines
+    and ids of lines to delete.
+    """
+    version = serializers.IntegerField(min_value=1)
+    add = OfflineQuotationLineSerializer(many=True, required=False, default=list)
+    update = QuotationLineUpdateSerializer(many=True, required=False, default=list)
+    delete = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+
+    def validate(self, attrs):
+        ids = [change['id'] for change in attrs['update']] + attrs['delete']
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each line can be updated or deleted once per batch.")
+        limit = getattr(settings, 'ESHOP_QUOTATION_LINE_BATCH_MAX', 500)
+        if len(ids) + len(attrs['add']) > limit:
+            raise serializers.ValidationError(f"Send at most {limit} line operations at a time.")
+        return attrs
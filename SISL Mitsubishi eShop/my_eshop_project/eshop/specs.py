@@ -0,0 +1,89 @@
+"""
+Technical specification rows for the product detail page.
+
+Product has a few dozen optional spec columns, of which any one product
+fills a handful: those of its family (VFD, PLC, HMI or SERVO, the groups
+of the ProductAdmin fieldsets). spec_rows() lists a product's non-empty
+specs as (label, value) pairs, its family's fields first in fieldset
+order, then any other filled field in model order. The field order per
+family is computed once per process.
+
+The rendered table is cached by the {% product_specs %} tag under the
+product's updated_at, so a saved product is re-rendered and nothing needs
+invalidating.
+"""
+import functools
+import hashlib
+
+from .models import Product
+
+# Same groups and order as the ProductAdmin fieldsets.
+FAMILY_SPECS = {
+    'VFD': (
+        'rated_output_power', 'rated_output_current', 'input_voltage', 'input_frequency', 'output_voltage',
+        'output_frequency_range',
+    ),
+    'PLC': ('plc_input', 'plc_output', 'supply_voltage', 'output_type'),
+    'HMI': (
+        'display_device', 'screen_size', 'external_dimensions', 'resolution', 'display_size', 'display_color',
+        'built_in_interface', 'compatible_software_package', 'weight',
+    ),
+    'SERVO': (
+        'rated_output', 'rated_torque', 'maximum_torque', 'rated_speed', 'maximum_speed', 'power_supply_capacity',
+        'power_supply_input', 'rated_voltage', 'rated_current', 'maximum_current', 'control_method',
+        'dynamic_brake', 'encoder_type', 'communication', 'encoder_resolution', 'servo_motor', 'servo_amplifier',
+        'dimensions',
+    ),
+}
+# Every optional spec column, in model order.
+SPEC_FIELDS = tuple(
+    field.name for field in Product._meta.concrete_fields
+    if field.name not in {
+        'id', 'category', 'brand', 'name', 'original_price', 'sku', 'image', 'country_of_origin',
+        'description', 'discounted_price', 'updated_at',
+    }
+)
+LABELS = {
+    'plc_input': 'PLC Input',
+    'plc_output': 'PLC Output',
+    'built_in_interface': 'Built-in Interface',
+    'dimensions': 'Dimensions (W x H x D in mm)',
+}
+# Shown last for every family.
+TRAILING_FIELDS = ('country_of_origin',)
+
+# Changes whenever the layout above does, so cached tables from an older
+# deploy are not reused.
+LAYOUT_VERSION = hashlib.md5(
+    repr((FAMILY_SPECS, SPEC_FIELDS, LABELS, TRAILING_FIELDS)).encode(), usedforsecurity=False
+).hexdigest()[:8]
+
+
+def label(field_name):
+    return LABELS.get(field_name) or field_name.replace('_', ' ').title()
+
+
+def family(category):
+    """The spec family of a category or of its parent, or None."""
+    for candidate in (category, getattr(category, 'parent', None)):
+        if candidate is not None and candidate.name.upper() in FAMILY_SPECS:
+            return candidate.name.upper()
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def spec_fields(family_name):
+    """[(field name, label)] in display order for a family (None: model order)."""
+    first = FAMILY_SPECS.get(family_name, ())
+    names = first + tuple(name for name in SPEC_FIELDS if name not in first) + TRAILING_FIELDS
+    return tuple((name, label(name)) for name in names)
+
+
+def spec_rows(product):
+    """[(label, value)] for the product's non-empty specs, family fields first."""
+    rows = []
+    for name, field_label in spec_fields(family(product.category)):
+        value = getattr(product, name)
+        if value:
+            rows.append((field_label, value))
+    return rows
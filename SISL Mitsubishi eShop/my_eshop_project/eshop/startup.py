@@ -0,0 +1,207 @@
+"""
+Worker startup: preloading and cold-start measurement.
+
+A fresh worker otherwise pays for URL resolver population, template
+compilation and the first exchange-rate and compatibility-graph loads on
+its first requests. preload() does that work up front, from the WSGI and
+ASGI entry points, before the server hands the worker any traffic. Steps
+are chosen with ESHOP_PRELOAD; a database that is missing or not yet
+migrated is logged and skipped rather than stopping the worker.
+
+uvicorn imports the ASGI application from inside its running event loop,
+where Django refuses synchronous ORM queries (SynchronousOnlyOperation).
+preload() then runs its steps in a short-lived thread and waits for it,
+so the worker is still warm before it takes traffic.
+
+measure_cold_start() times a fresh interpreter importing an entry point,
+optionally with a per-module import profile (python -X importtime); it
+backs "manage.py profile_startup" and the ESHOP_COLD_START_TARGET_MS test.
+"""
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template import engines
+from django.template.loader import get_template
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEPS = ('urls', 'templates', 'caches')
+TEMPLATE_SUFFIXES = ('.html', '.txt')
+
+# Timings of the last preload() in this process, step name -> milliseconds.
+last_run = {}
+
+
+def _populate(resolver):
+    # Reading reverse_dict builds the resolver's lookup tables; included
+    # URLconfs (admin, api) have their own and are built on first use.
+    resolver.reverse_dict
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            _populate(pattern)
+
+
+def _warm_urls():
+    _populate(get_resolver())
+
+
+def template_names(app_label=None):
+    """
+    Every template name the Django engine's loaders can find, in loader
+    order, each listed once. With app_label, only that app's templates.
+    """
+    engine = engines['django'].engine
+    roots = [Path(directory) for loader in engine.template_loaders for directory in loader.get_dirs()]
+    if app_label:
+        app_root = Path(apps.get_app_config(app_label).path)
+        roots = [root for root in roots if app_root in root.parents]
+    names = {}
+    for root in roots:
+        if root.is_dir():
+            for path in sorted(root.rglob('*')):
+                if path.is_file() and path.suffix in TEMPLATE_SUFFIXES:
+                    names.setdefault(path.relative_to(root).as_posix(), None)
+    return list(names)
+
+
+def _warm_templates():
+    # get_template() compiles into the cached loader, so later renders of
+    # the same template skip parsing.
+    for name in template_names('eshop'):
+        get_template(name)
+
+
+def _warm_caches():
+    from .compat_graph import get_graph
+    from .currency import get_rates
+
+    get_rates()
+    get_graph()
+
+
+def _warm_pdf():
+    # Imports ReportLab, which is otherwise loaded on the first PDF render.
+    from .pdf import _styles
+
+    _styles()
+
+
+STEPS = {
+    'urls': _warm_urls,
+    'templates': _warm_templates,
+    'caches': _warm_caches,
+    'pdf': _warm_pdf,
+}
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _run_steps(steps, timings):
+    for name in steps:
+        started = time.perf_counter()
+        try:
+            STEPS[name]()
+        except DatabaseError:
+            logger.warning("Preload step %r skipped: database unavailable.", name, exc_info=True)
+        timings[name] = (time.perf_counter() - started) * 1000
+
+
+def _run_steps_in_thread(steps, timings):
+    def target():
+        try:
+            _run_steps(steps, timings)
+        except Exception:
+            logger.exception("Preload failed.")
+        finally:
+            # This thread's connections would otherwise stay open until exit.
+            connections.close_all()
+
+    thread = threading.Thread(target=target, name='eshop-preload')
+    thread.start()
+    thread.join()
+
+
+def preload(steps=None):
+    """Run the ESHOP_PRELOAD warm-up steps. Returns {step: milliseconds}."""
+    if steps is None:
+        steps = getattr(settings, 'ESHOP_PRELOAD', DEFAULT_STEPS)
+    timings = {}
+    if _in_event_loop():
+        _run_steps_in_thread(steps, timings)
+    else:
+        _run_steps(steps, timings)
+    last_run.clear()
+    last_run.update(timings)
+    logger.info("Preloaded %s in %.0fms.", ', '.join(timings) or 'nothing', sum(timings.values()))
+    return timings
+
+
+@dataclass
+class StartupProfile:
+    total_ms: float
+    preload_ms: dict
+    # (module, self ms, cumulative ms) rows from -X importtime, import order.
+    imports: list = field(default_factory=list)
+
+    @property
+    def import_ms(self):
+        return self.total_ms - sum(self.preload_ms.values())
+
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+total_ms = (time.perf_counter() - started) * 1000
+from eshop.startup import last_run
+print(json.dumps({{'total_ms': total_ms, 'preload_ms': last_run}}))
+"""
+
+
+def _parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return rows
+
+
+def measure_cold_start(module='eshop_project.wsgi', importtime=False):
+    """
+    Import `module` in a fresh interpreter and time it, including the
+    preload its import runs. Returns a StartupProfile.
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', _PROBE.format(module=module)]
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'eshop_project.settings')}
+    result = subprocess.run(
+        command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return StartupProfile(
+        total_ms=report['total_ms'],
+        preload_ms=report['preload_ms'],
+        imports=_parse_importtime(result.stderr) if importtime else [],
+    )
@@ -0,0 +1,319 @@
+"""
+Deterministic synthetic catalog and quotation data.
+
+generate() fills the database with a PLC/HMI/VFD/SERVO category tree,
+brands, products with the spec fields of their family, related/compatible
+product links, customers and quotations with lines, using bulk_create in
+large batches (M2M rows go straight into the through tables) so that 100k
+products and a million quotation lines take minutes rather than hours.
+The same seed always produces the same rows; everything is named with the
+SYN prefix so it is easy to recognise.
+"""
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .compat_graph import invalidate_graph
+from .models import Brand, Category, Currency, OrderStatus, Product, Quotation, QuotationLine
+
+# Top-level categories and their series subcategories. Products go into the
+# family itself or one of its series, so both the home page (which lists the
+# families) and the category pages have data.
+CATEGORY_TREE = {
+    'VFD': ('FR-D700', 'FR-E800', 'FR-A800', 'FR-F800'),
+    'PLC': ('FX5U', 'FX3U', 'iQ-R', 'Q Series'),
+    'HMI': ('GOT2000', 'GOT SIMPLE', 'GT27', 'GT25'),
+    'SERVO': ('MR-J4', 'MR-J5', 'MR-JE', 'HG-KR'),
+}
+CATEGORIES = tuple(CATEGORY_TREE)
+BRANDS = ('Mitsubishi', 'Siemens', 'Schneider', 'Omron', 'Delta')
+COUNTRIES = ('Japan', 'Germany', 'France', 'China', 'Taiwan')
+SYNTHETIC_PASSWORD = 'synthetic'
+DEFAULT_BATCH_SIZE = 5000
+
+
+def _pick(*values):
+    return lambda rng: rng.choice(values)
+
+
+def _number(low, high, unit, step=1):
+    return lambda rng: f"{rng.randrange(low, high + 1, step)} {unit}"
+
+
+# Spec fields per family, the same groups as the ProductAdmin fieldsets.
+SPEC_FIELDS = {
+    'VFD': {
+        'rated_output_power': lambda rng: f"{rng.choice((0.4, 0.75, 1.5, 2.2, 3.7, 5.5, 7.5, 11, 15))} kW",
+        'rated_output_current': _number(1, 60, 'A'),
+        'input_voltage': _pick('1-phase 200-240V', '3-phase 200-240V', '3-phase 380-480V'),
+        'input_frequency': _pick('50/60 Hz'),
+        'output_voltage': _pick('3-phase 200-240V', '3-phase 380-480V'),
+        'output_frequency_range': _pick('0.2-400 Hz', '0.2-590 Hz'),
+    },
+    'PLC': {
+        'plc_input': _number(8, 64, 'points', 8),
+        'plc_output': _number(8, 64, 'points', 8),
+        'supply_voltage': _pick('24V DC', '100-240V AC'),
+        'output_type': _pick('Relay', 'Transistor (sink)', 'Transistor (source)'),
+    },
+    'HMI': {
+        'display_device': _pick('TFT color LCD', 'STN monochrome LCD'),
+        'screen_size': _pick('4.3"', '5.7"', '7"', '10.4"', '12.1"', '15"'),
+        'external_dimensions': lambda rng: f"{rng.randrange(120, 400)} x {rng.randrange(90, 300)} x {rng.randrange(30, 70)} mm",
+        'resolution': _pick('480 x 272', '640 x 480', '800 x 480', '800 x 600', '1024 x 768'),
+        'display_size': _pick('Wide', 'Standard'),
+        'display_color': _pick('65536 colors', '16 colors', 'Monochrome'),
+        'built_in_interface': _pick('Ethernet, RS-232, USB', 'Ethernet, RS-422/485', 'RS-232, USB'),
+        'compatible_software_package': _pick('GT Works3', 'GT Designer3'),
+        'weight': lambda rng: f"{rng.randrange(3, 30) / 10} kg",
+    },
+    'SERVO': {
+        'rated_output': _pick('50 W', '100 W', '200 W', '400 W', '750 W', '1 kW', '2 kW'),
+        'rated_torque': lambda rng: f"{rng.randrange(16, 950) / 100} N·m",
+        'maximum_torque': lambda rng: f"{rng.randrange(48, 2850) / 100} N·m",
+        'rated_speed': _pick('2000 r/min', '3000 r/min'),
+        'maximum_speed': _pick('3000 r/min', '4500 r/min', '6000 r/min'),
+        'power_supply_capacity': lambda rng: f"{rng.randrange(3, 40) / 10} kVA",
+        'power_supply_input': _pick('3-phase 200-240V AC', '1-phase 200-240V AC'),
+        'rated_voltage': _pick('200V AC', '400V AC'),
+        'rated_current': lambda rng: f"{rng.randrange(8, 110) / 10} A",
+        'maximum_current': lambda rng: f"{rng.randrange(24, 330) / 10} A",
+        'control_method': _pick('Sine-wave PWM control, current control method'),
+        'dynamic_brake': _pick('Built-in', 'External'),
+        'encoder_type': _pick('Absolute', 'Incremental'),
+        'communication': _pick('SSCNET III/H', 'CC-Link IE TSN', 'EtherCAT', 'Pulse train'),
+        'encoder_resolution': _pick('22 bits', '26 bits'),
+        'servo_motor': _pick('HG-KR', 'HG-MR', 'HG-SR'),
+        'servo_amplifier': _pick('MR-J4-A', 'MR-J5-G', 'MR-JE-A'),
+        'dimensions': lambda rng: f"{rng.randrange(40, 130)} x {rng.randrange(150, 250)} x {rng.randrange(135, 200)} mm",
+    },
+}
+
+
+@dataclass
+class SyntheticConfig:
+    products: int = 1000
+    customers: int = 100
+    quotations: int = 1000
+    lines_per_quotation: int = 5
+    # Outgoing related_products / compatible_modules links per product.
+    related_per_product: int = 3
+    compatible_per_product: int = 2
+    # Quotation dates are spread over this many days up to today.
+    days: int = 365
+    seed: int = 0
+    batch_size: int = DEFAULT_BATCH_SIZE
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class SyntheticDataGenerator:
+    def __init__(self, config, log=None):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.log = log or (lambda message: None)
+        self.counts = {}
+
+    def run(self):
+        categories = self.create_categories()
+        brands = self.create_brands()
+        product_prices = self.create_products(categories, brands)
+        self.create_links(new_from=self._first_new_product)
+        customer_ids = self.create_customers()
+        self.create_quotations(product_prices, customer_ids)
+        return self.counts
+
+    def _bulk_create(self, model, rows):
+        created = 0
+        for batch in _batches(rows, self.config.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.config.batch_size)
+            created += len(batch)
+        self.counts[model._meta.model_name] = self.counts.get(model._meta.model_name, 0) + created
+        return created
+
+    def create_categories(self):
+        """Create the family/series tree. Returns [(family name, [categories])]."""
+        names = list(CATEGORY_TREE) + [child for children in CATEGORY_TREE.values() for child in children]
+        existing = {category.name: category for category in Category.objects.filter(name__in=names)}
+        self._bulk_create(Category, (Category(name=name) for name in CATEGORY_TREE if name not in existing))
+        roots = {category.name: category for category in Category.objects.filter(name__in=CATEGORY_TREE)}
+        self._bulk_create(Category, (
+            Category(name=child, parent=roots[family])
+            for family, children in CATEGORY_TREE.items()
+            for child in children if child not in existing
+        ))
+        by_name = {category.name: category for category in Category.objects.filter(name__in=names)}
+        return [
+            (family, [by_name[family]] + [by_name[child] for child in children])
+            for family, children in CATEGORY_TREE.items()
+        ]
+
+    def create_brands(self):
+        names = [f'SYN-{name}' for name in BRANDS]
+        existing = set(Brand.objects.filter(name__in=names).values_list('name', flat=True))
+        self._bulk_create(Brand, (Brand(name=name) for name in names if name not in existing))
+        return list(Brand.objects.filter(name__in=names).order_by('name'))
+
+    def _product(self, index, categories, brands):
+        family, family_categories = categories[index % len(categories)]
+        price = Decimal(self.rng.randrange(5000, 5000000)) / 100
+        specs = {name: make_value(self.rng) for name, make_value in SPEC_FIELDS[family].items()}
+        return Product(
+            category=self.rng.choice(family_categories),
+            brand=self.rng.choice(brands),
+            name=f'SYN{self.config.seed}-{family}-{index:07d}',
+            sku=f'SYN-{self.config.seed}-{index:07d}',
+            original_price=price,
+            discounted_price=(price * Decimal('0.9')).quantize(Decimal('0.01')) if index % 3 == 0 else None,
+            image='products/placeholder.png',
+            country_of_origin=self.rng.choice(COUNTRIES),
+            description=f'Synthetic {family} product {index}.',
+            **specs,
+        )
+
+    def create_products(self, categories, brands):
+        """Create the products. Returns [(product_id, price)] of the seed's products."""
+        prefix = f'SYN-{self.config.seed}-'
+        start = self._first_new_product = Product.objects.filter(sku__startswith=prefix).count()
+        self._bulk_create(
+            Product,
+            (self._product(index, categories, brands) for index in range(start, self.config.products)),
+        )
+        self.log(f"{self.config.products} products")
+        return list(
+            Product.objects.filter(sku__startswith=prefix).order_by('pk').values_list('pk', 'original_price')
+        )
+
+    def create_links(self, new_from=0):
+        """
+        Link products through the M2M through tables directly: related
+        products within the same family, and PLCs to compatible HMI/SERVO
+        modules. Only products from index `new_from` on get outgoing links.
+        """
+        ids_by_family = {family: [] for family in CATEGORY_TREE}
+        new_ids = set()
+        rows = Product.objects.filter(sku__startswith=f'SYN-{self.config.seed}-').order_by('pk')
+        for index, (pk, name) in enumerate(rows.values_list('pk', 'name').iterator(chunk_size=self.config.batch_size)):
+            ids_by_family[name.split('-')[1]].append(pk)
+            if index >= new_from:
+                new_ids.add(pk)
+
+        related = Product.related_products.through
+        compatible = Product.compatible_modules.through
+        modules = ids_by_family['HMI'] + ids_by_family['SERVO']
+
+        def related_rows():
+            for family_ids in ids_by_family.values():
+                for pk in family_ids:
+                    if pk not in new_ids:
+                        continue
+                    for target in self.rng.sample(family_ids, min(self.config.related_per_product, len(family_ids))):
+                        if target != pk:
+                            yield related(from_product_id=pk, to_product_id=target)
+
+        def compatible_rows():
+            for pk in ids_by_family['PLC']:
+                if pk not in new_ids:
+                    continue
+                for target in self.rng.sample(modules, min(self.config.compatible_per_product, len(modules))):
+                    yield compatible(from_product_id=pk, to_product_id=target)
+
+        for through, rows in ((related, related_rows()), (compatible, compatible_rows())):
+            created = 0
+            for batch in _batches(rows, self.config.batch_size):
+                with transaction.atomic():
+                    through.objects.bulk_create(batch, ignore_conflicts=True)
+                created += len(batch)
+            self.counts[through._meta.model_name] = created
+        invalidate_graph()
+        self.log("product links")
+
+    def create_customers(self):
+        # Hashing is slow by design, so every synthetic customer shares one hash.
+        password = make_password(SYNTHETIC_PASSWORD)
+        prefix = f'syn{self.config.seed}_'
+        start = User.objects.filter(username__startswith=prefix).count()
+        self._bulk_create(User, (
+            User(username=f'{prefix}{index:06d}', email=f'{prefix}{index:06d}@example.com', password=password)
+            for index in range(start, self.config.customers)
+        ))
+        return list(User.objects.filter(username__startswith=prefix).order_by('pk').values_list('pk', flat=True))
+
+    def create_quotations(self, product_prices, customer_ids):
+        """Create quotations and their lines chunk by chunk, totals included."""
+        prefix = f'SYN{self.config.seed}-'
+        start = Quotation.objects.filter(order_number__startswith=prefix).count()
+        statuses = OrderStatus.values
+        per_quote = self.config.lines_per_quotation
+        chunk = max(1, self.config.batch_size // max(1, per_quote))
+        now = timezone.now()
+        for first in range(start, self.config.quotations, chunk):
+            quotations, lines = [], []
+            for index in range(first, min(first + chunk, self.config.quotations)):
+                quote_lines = []
+                total = Decimal(0)
+                for _ in range(per_quote):
+                    product_id, price = self.rng.choice(product_prices)
+                    line = QuotationLine(
+                        product_id=product_id,
+                        quantity=self.rng.randint(1, 20),
+                        unit_price=price,
+                        discount_percent=Decimal(self.rng.choice((0, 0, 5, 10, 15))),
+                        currency=Currency.BDT,
+                    )
+                    total += line.line_total()
+                    quote_lines.append(line)
+                quotations.append(Quotation(
+                    customer_id=self.rng.choice(customer_ids) if customer_ids else None,
+                    order_number=f'{prefix}{index:09d}',
+                    subject=f'Synthetic quotation {index}',
+                    status=self.rng.choice(statuses),
+                    total_amount=total.quantize(Decimal('0.01')),
+                ))
+                lines.append(quote_lines)
+            with transaction.atomic():
+                Quotation.objects.bulk_create(quotations)
+                self._backdate(quotations, first, now)
+                for quotation, quote_lines in zip(quotations, lines):
+                    for line in quote_lines:
+                        line.quotation_id = quotation.pk
+                QuotationLine.objects.bulk_create(
+                    [line for quote_lines in lines for line in quote_lines],
+                    batch_size=self.config.batch_size,
+                )
+            self.counts['quotation'] = self.counts.get('quotation', 0) + len(quotations)
+            self.counts['quotationline'] = self.counts.get('quotationline', 0) + len(quotations) * per_quote
+            self.log(f"{first + len(quotations)} / {self.config.quotations} quotations")
+
+
+    def _backdate(self, quotations, first, now):
+        """
+        created_at is auto_now_add, so quotations are moved back in time
+        afterwards, oldest first, with one UPDATE per day of a chunk (order
+        numbers are consecutive, so each day is one order_number range).
+        """
+        total, days = self.config.quotations, self.config.days
+        by_day = {}
+        for offset, quotation in enumerate(quotations, start=first):
+            by_day.setdefault(days - (offset * days) // total, []).append(quotation.order_number)
+        for days_back, order_numbers in by_day.items():
+            Quotation.objects.filter(order_number__range=(order_numbers[0], order_numbers[-1])).update(
+                created_at=now - timedelta(days=days_back)
+            )
+
+
+def generate(log=None, **options):
+    """Generate synthetic data; options are SyntheticConfig fields. Returns row counts created."""
+    return SyntheticDataGenerator(SyntheticConfig(**options), log=log).run()
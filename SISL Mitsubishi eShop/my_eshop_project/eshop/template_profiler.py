@@ -0,0 +1,196 @@
+"""
+Template render profiling for development.
+
+TemplateProfilerMiddleware times every template rendered during a request,
+both inclusive (with the templates it includes) and self time, and every
+{% for %} block, keyed by template and line. Each request logs its slowest
+entries to the "eshop.template_profile" logger; totals per worker are kept
+for the staff-only /perf/templates/ endpoint. A template that extends
+another is timed together with its parent.
+
+Configure with ESHOP_TEMPLATE_PROFILER in settings. When ENABLED is False
+the middleware removes itself at startup and nothing is patched.
+"""
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger('eshop.template_profile')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'TOP': 10,
+}
+
+_current = contextvars.ContextVar('eshop_template_profile', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ESHOP_TEMPLATE_PROFILER', {})}
+
+
+class TemplateProfile:
+    """Render counts and times per template name and per {% for %} block."""
+
+    def __init__(self):
+        # name -> [renders, inclusive ms, self ms]
+        self.templates = {}
+        # (template name, line, tag source) -> [renders, ms]
+        self.loops = {}
+        # Time spent in nested templates, one slot per template being rendered.
+        self._children = []
+
+    def enter_template(self):
+        self._children.append(0.0)
+
+    def exit_template(self, name, elapsed_ms):
+        children_ms = self._children.pop()
+        if self._children:
+            self._children[-1] += elapsed_ms
+        row = self.templates.setdefault(name, [0, 0.0, 0.0])
+        row[0] += 1
+        row[1] += elapsed_ms
+        row[2] += elapsed_ms - children_ms
+
+    def add_loop(self, key, elapsed_ms):
+        row = self.loops.setdefault(key, [0, 0.0])
+        row[0] += 1
+        row[1] += elapsed_ms
+
+    def merge(self, other):
+        for name, (renders, inclusive_ms, self_ms) in other.templates.items():
+            row = self.templates.setdefault(name, [0, 0.0, 0.0])
+            row[0] += renders
+            row[1] += inclusive_ms
+            row[2] += self_ms
+        for key, (renders, elapsed_ms) in other.loops.items():
+            row = self.loops.setdefault(key, [0, 0.0])
+            row[0] += renders
+            row[1] += elapsed_ms
+
+    def report(self, top=None):
+        templates = sorted(self.templates.items(), key=lambda item: -item[1][2])[:top]
+        loops = sorted(self.loops.items(), key=lambda item: -item[1][1])[:top]
+        return {
+            'templates': [
+                {'template': name, 'renders': renders,
+                 'total_ms': round(inclusive_ms, 2), 'self_ms': round(self_ms, 2)}
+                for name, (renders, inclusive_ms, self_ms) in templates
+            ],
+            'loops': [
+                {'template': name, 'line': line, 'tag': tag, 'renders': renders, 'total_ms': round(elapsed_ms, 2)}
+                for (name, line, tag), (renders, elapsed_ms) in loops
+            ],
+        }
+
+
+class _Totals:
+    """Per-worker totals of every profiled request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profile = TemplateProfile()
+        self.requests = 0
+
+    def add(self, profile):
+        with self._lock:
+            self._profile.merge(profile)
+            self.requests += 1
+
+    def reset(self):
+        with self._lock:
+            self._profile = TemplateProfile()
+            self.requests = 0
+
+    def snapshot(self, top=None):
+        with self._lock:
+            return {'requests': self.requests, **self._profile.report(top)}
+
+
+totals = _Totals()
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def _template_name(template):
+    return template.origin.template_name or template.name or '<string>'
+
+
+def install():
+    """Wrap Template.render and ForNode.render once per process."""
+    global _installed
+    from django.template.base import Template
+    from django.template.defaulttags import ForNode
+
+    with _install_lock:
+        if _installed:
+            return
+        original_render = Template.render
+        original_for_render = ForNode.render
+
+        def profiled_render(self, context):
+            profile = _current.get()
+            if profile is None:
+                return original_render(self, context)
+            profile.enter_template()
+            started = time.perf_counter()
+            try:
+                return original_render(self, context)
+            finally:
+                profile.exit_template(_template_name(self), (time.perf_counter() - started) * 1000)
+
+        def profiled_for_render(self, context):
+            profile = _current.get()
+            if profile is None:
+                return original_for_render(self, context)
+            started = time.perf_counter()
+            try:
+                return original_for_render(self, context)
+            finally:
+                # The parser records each node's origin and token, so a
+                # loop inside an included or parent template is keyed there.
+                key = (self.origin.template_name or '<string>', self.token.lineno, f'{{% {self.token.contents} %}}')
+                profile.add_loop(key, (time.perf_counter() - started) * 1000)
+
+        Template.render = profiled_render
+        ForNode.render = profiled_for_render
+        _installed = True
+
+
+class TemplateProfilerMiddleware:
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.top = config['TOP']
+        install()
+
+    def __call__(self, request):
+        profile = TemplateProfile()
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        if profile.templates:
+            totals.add(profile)
+            self._log(request, profile)
+        return response
+
+    def _log(self, request, profile):
+        report = profile.report(self.top)
+        lines = [
+            f"  {row['self_ms']:8.1f}ms self {row['total_ms']:8.1f}ms total {row['renders']:>5}x  {row['template']}"
+            for row in report['templates']
+        ]
+        lines += [
+            f"  {row['total_ms']:8.1f}ms loop {row['renders']:>5}x  {row['template']}:{row['line']}  {row['tag']}"
+            for row in report['loops']
+        ]
+        logger.info("Templates for %s %s:\n%s", request.method, request.path, '\n'.join(lines))
@@ -0,0 +1,63 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+CARD_TEMPLATE = 'partials/_product_card.html'
+SPEC_TEMPLATE = 'partials/_spec_table.html'
+
+
+def _card_cache_key(product):
+    # Everything the card shows is part of the key, so an edited product
+    # simply gets a new entry and nothing ever needs invalidating.
+    shown = (
+        product.pk, product.name, product.sku, product.image.name,
+        product.original_price, product.discounted_price, product.brand.name,
+    )
+    return 'eshop:product_card:' + hashlib.md5(repr(shown).encode(), usedforsecurity=False).hexdigest()
+
+
+@register.simple_tag
+def product_card(product):
+    """
+    Renders the listing card for a product, ideally one loaded with
+    Product.objects.cards(). The HTML is cached for
+    ESHOP_PRODUCT_CARD_CACHE_TTL seconds (0 disables the cache) in the
+    ESHOP_PRODUCT_CARD_CACHE cache.
+    """
+    timeout = getattr(settings, 'ESHOP_PRODUCT_CARD_CACHE_TTL', 600)
+    if not timeout:
+        return get_template(CARD_TEMPLATE).render({'product': product})
+    cache = caches[getattr(settings, 'ESHOP_PRODUCT_CARD_CACHE', 'default')]
+    key = _card_cache_key(product)
+    html = cache.get(key)
+    if html is None:
+        html = get_template(CARD_TEMPLATE).render({'product': product})
+        cache.set(key, html, timeout)
+    return mark_safe(html)
+
+
+@register.simple_tag
+def product_specs(product):
+    """
+    Renders the specification list of a product (see eshop.specs), cached
+    for ESHOP_PRODUCT_SPECS_CACHE_TTL seconds (0 disables the cache) per
+    product and updated_at in the ESHOP_PRODUCT_CARD_CACHE cache.
+    """
+    from eshop.specs import LAYOUT_VERSION, spec_rows
+
+    timeout = getattr(settings, 'ESHOP_PRODUCT_SPECS_CACHE_TTL', 3600)
+    if not timeout:
+        return get_template(SPEC_TEMPLATE).render({'rows': spec_rows(product)})
+    cache = caches[getattr(settings, 'ESHOP_PRODUCT_CARD_CACHE', 'default')]
+    key = f'eshop:product_specs:{LAYOUT_VERSION}:{product.pk}:{product.updated_at.timestamp()}'
+    html = cache.get(key)
+    if html is None:
+        html = get_template(SPEC_TEMPLATE).render({'rows': spec_rows(product)})
+        cache.set(key, html, timeout)
+    return mark_safe(html)
@@ -1,3 +1,1591 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import os
+import shutil
+import smtplib
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from urllib.parse import parse_qsl, urlsplit
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.template import engines
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from reportlab.platypus import SimpleDocTemplate, Table
+
+from .models import (
+    Brand, Category, EmailStatus, ExchangeRate, JobLock, JobRun, JobStatus, OrderNumberCounter, OrderStatus,
+    OutboundEmail, Product, ProductRecommendation, Quotation, QuotationLine, QuotationStatusLog,
+)
+from .benchmarks import SCENARIOS, compare, default_context, run_scenario
+from .catalog_snapshot import export_snapshot, open_bundle
+from .compat_graph import get_graph, invalidate_graph
+from .currency import (
+    ExchangeRateMissing, RateTable, annotate_totals, get_rates, invalidate_rates, quotation_totals,
+)
+from .instrumentation import RequestInstrumentationMiddleware, RequestStats, RollingStats, rolling_stats
+from .maintenance import clean_quotation_files, optimize_database
+from .metrics import EMAILS, REGISTRY, Counter, Histogram, Registry
+from .offload import get_pool, offload
+from .order_numbers import OrderNumberAllocator
+from .pdf import (
+    LazyStory, build_story, iter_story, quotation_data, render_many, render_merged_pdf, render_pdf,
+    spooled_quotation_pdf, write_zip,
+)
+from .outbox import dispatch, enqueue
+from .portal import history_summary
+from .query_budget import QueryBudgetExceeded, budget_for, query_budget
+from .ratelimit import bucket_processes, check, get_limit
+from .recommendations import build_recommendations
+from .serializers import OfflineQuotationLineSerializer
+from .scheduler import CronSchedule, Job, Scheduler
+from .startup import last_run as last_preload, measure_cold_start, preload
+from .template_profiler import totals as template_totals
+from .synthetic import generate
+from .variants import VariantError, create_variants
+from .workflow import (
+    CONFLICT_RETRIES, InvalidTransition, TransitionConflict, _hooks, bulk_transition, on_transition, transition,
+)
+
+
+_shared_cache = {}
+
+
+def setUpModule():
+    # A private directory for the file-based 'shared' cache, so test runs
+    # neither see each other's entries nor touch the project's. Rate limits
+    # refill at the full configured rate: the suite is a single process.
+    directory = tempfile.mkdtemp()
+    override = override_settings(CACHES={
+        **settings.CACHES, 'shared': {**settings.CACHES['shared'], 'LOCATION': directory},
+    }, ESHOP_RATE_LIMIT_PROCESSES=1)
+    override.enable()
+    _shared_cache.update(directory=directory, override=override)
+
+
+def tearDownModule():
+    _shared_cache['override'].disable()
+    shutil.rmtree(_shared_cache['directory'], ignore_errors=True)
+
+
+def make_product(name='FR-D720S-0.4K', sku='FR-D720S-0.4K', price='1000.00', category=None, brand=None):
+    category = category or Category.objects.get_or_create(name='VFD')[0]
+    brand = brand or Brand.objects.get_or_create(name='Mitsubishi')[0]
+    return Product.objects.create(
+        category=category,
+        brand=brand,
+        name=name,
+        sku=sku,
+        original_price=Decimal(price),
+        image='products/placeholder.png',
+        country_of_origin='Japan',
+    )
+
+
+def discount_post_data(product, quantity=1):
+    return {
+        'subject': '',
+        'notes': '',
+        'currency': 'BDT',
+        'lines-TOTAL_FORMS': '1',
+        'lines-INITIAL_FORMS': '0',
+        'lines-0-product': str(product.pk),
+        'lines-0-quantity': str(quantity),
+        'lines-0-unit_price': str(product.original_price),
+        'lines-0-discount_percent': '0',
+    }
+
+
+@override_settings(ESHOP_ORDER_NUMBER_PREFIX='ORD', ESHOP_ORDER_NUMBER_PERIOD='year', ESHOP_ORDER_NUMBER_DIGITS=5)
+class OrderNumberTests(TransactionTestCase):
+    def test_workers_reserve_disjoint_blocks(self):
+        worker_a = OrderNumberAllocator(block_size=5)
+        worker_b = OrderNumberAllocator(block_size=5)
+        numbers = [worker_a.next(), worker_b.next(), worker_a.next(), worker_b.next()]
+
+        prefix = 'ORD' + timezone.now().strftime('%Y')
+        self.assertEqual(numbers, [prefix + '00001', prefix + '00006', prefix + '00002', prefix + '00007'])
+        self.assertEqual(OrderNumberCounter.objects.get(prefix=prefix).last_value, 10)
+
+    def test_new_block_is_reserved_when_exhausted(self):
+        worker = OrderNumberAllocator(block_size=2)
+        numbers = [worker.next() for _ in range(5)]
+        self.assertEqual(len(set(numbers)), 5)
+        self.assertEqual(OrderNumberCounter.objects.get().last_value, 6)
+
+    @override_settings(ESHOP_RATE_LIMIT_ENABLED=False)
+    def test_invalid_discount_request_does_not_use_a_number(self):
+        product = make_product()
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@example.com', 'secret'))
+        data = discount_post_data(product)
+        data['lines-0-quantity'] = ''
+        # Inside a transaction every number comes straight from the counter
+        # row rather than from a block held in memory.
+        with transaction.atomic():
+            response = self.client.post(reverse('ask_for_discount', args=[product.sku]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Quotation.objects.exists())
+        self.assertFalse(OrderNumberCounter.objects.exists())
+
+
+# Every submission comes from one user; this is about order numbers, not abuse.
+@override_settings(ESHOP_RATE_LIMIT_ENABLED=False)
+class ConcurrentDiscountSubmissionTests(TransactionTestCase):
+    submissions = 200
+    workers = 16
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.product = make_product()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+
+    def _submit(self, _):
+        try:
+            client = Client()
+            client.force_login(self.user)
+            response = client.post(
+                reverse('ask_for_discount', args=[self.product.sku]),
+                discount_post_data(self.product),
+            )
+            return response.status_code
+        finally:
+            connection.close()
+
+    def test_parallel_submissions_get_unique_order_numbers(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                statuses = list(pool.map(self._submit, range(self.submissions)))
+
+        self.assertEqual(statuses, [200] * self.submissions)
+        order_numbers = list(Quotation.objects.values_list('order_number', flat=True))
+        self.assertEqual(len(order_numbers), self.submissions)
+        self.assertEqual(len(set(order_numbers)), self.submissions)
+
+
+class CurrencyTests(TestCase):
+    def setUp(self):
+        invalidate_rates()
+        self.addCleanup(invalidate_rates)
+
+    def _quotation(self):
+        product = make_product()
+        quotation = Quotation.objects.create(order_number='Q-FX', currency='BDT')
+        QuotationLine.objects.create(quotation=quotation, product=product, quantity=2,
+                                     unit_price=Decimal('1000.00'), discount_percent=Decimal('10'))
+        QuotationLine.objects.create(quotation=quotation, product=product, unit_price=Decimal('10.00'), currency='USD')
+        return quotation
+
+    def test_rate_table_converts_both_ways(self):
+        rates = RateTable({('USD', 'BDT'): '110'})
+        self.assertEqual(rates.convert(10, 'USD', 'BDT'), Decimal('1100.00'))
+        self.assertEqual(rates.convert(Decimal('550'), 'BDT', 'USD'), Decimal('5.00'))
+        self.assertEqual(rates.convert(Decimal('12.345'), 'BDT', 'BDT'), Decimal('12.35'))
+        self.assertIsNone(rates.convert(None, 'USD', 'BDT'))
+        with self.assertRaises(ExchangeRateMissing):
+            RateTable({}).convert(1, 'USD', 'BDT')
+
+    def test_totals_are_converted_with_known_rates(self):
+        ExchangeRate.objects.create(source_currency='USD', target_currency='BDT', rate=Decimal('110'))
+        quotation = self._quotation()
+        quotation.compute_total()
+        # 2 x 1000 BDT less 10%, plus 10 USD at 110.
+        self.assertEqual(quotation.total_amount, Decimal('2900.00'))
+
+        annotated = annotate_totals(Quotation.objects.filter(pk=quotation.pk)).get()
+        self.assertEqual(annotated.total_bdt, Decimal('2900.00'))
+        # Converted in SQL and not rounded; templates format it.
+        self.assertAlmostEqual(annotated.total_usd, Decimal('26.36'), places=2)
+        self.assertEqual(quotation_totals(quotation), [('BDT', Decimal('2900.00')), ('USD', Decimal('26.36'))])
+
+    def test_line_totals_keep_their_fractions(self):
+        product = make_product()
+        quotation = Quotation.objects.create(order_number='Q-CENTS')
+        QuotationLine.objects.create(quotation=quotation, product=product,
+                                     unit_price=Decimal('1005.00'), discount_percent=Decimal('15'))
+        quotation.compute_total()
+        self.assertEqual(quotation.total_amount, Decimal('854.25'))
+        QuotationLine.objects.create(quotation=quotation, product=product,
+                                     unit_price=Decimal('1250.00'), discount_percent=Decimal('5'))
+        quotation.compute_total()
+        self.assertEqual(quotation.total_amount, Decimal('2041.75'))
+        self.assertEqual(sum(line.line_total() for line in quotation.lines.all()), Decimal('2041.75'))
+
+    def test_unknown_pair_is_null_or_missing(self):
+        quotation = Quotation.objects.create(order_number='Q-BDT', total_amount=Decimal('500.00'))
+        annotated = annotate_totals(Quotation.objects.filter(pk=quotation.pk)).get()
+        self.assertEqual(annotated.total_bdt, Decimal('500.00'))
+        self.assertIsNone(annotated.total_usd)
+        self.assertEqual(quotation_totals(quotation), [('BDT', Decimal('500.00'))])
+        # A line in a currency without a rate cannot be totalled.
+        with self.assertRaises(ExchangeRateMissing):
+            self._quotation().compute_total()
+
+    def test_rates_are_cached_until_the_ttl_expires(self):
+        rate = ExchangeRate.objects.create(source_currency='USD', target_currency='BDT', rate=Decimal('110'))
+        with override_settings(ESHOP_EXCHANGE_RATE_TTL=0):
+            get_rates()
+            with self.assertNumQueries(1):
+                get_rates()
+        with override_settings(ESHOP_EXCHANGE_RATE_TTL=300):
+            table = get_rates()
+            # .update() sends no signal: the cached table is kept until the TTL runs out.
+            ExchangeRate.objects.filter(pk=rate.pk).update(rate=Decimal('120'))
+            with self.assertNumQueries(0):
+                self.assertIs(get_rates(), table)
+            self.assertEqual(get_rates().rate('USD', 'BDT'), Decimal('110'))
+            # Saving a rate clears the cache at once.
+            rate.refresh_from_db()
+            rate.save()
+            self.assertEqual(get_rates().rate('USD', 'BDT'), Decimal('120'))
+
+
+def pdf_data(line_count, amount=Decimal('1.50'), pk=1, order_number='Q-PDF'):
+    """A quotation snapshot as quotation_data() returns it, without the database."""
+    cells = ['FR-D720S-0.4K', '', '1', f'BDT {amount}', '0.00', f'BDT {amount}']
+    return {
+        'pk': pk,
+        'order_number': order_number,
+        'customer': 'buyer',
+        'currency': 'BDT',
+        'notes': 'N/A',
+        'lines': [(cells, amount) for _ in range(line_count)],
+        'totals': [('BDT', f'{amount * line_count:.2f}')],
+    }
+
+
+class PdfStreamingTests(TestCase):
+    def _item_tables(self, data):
+        tables = [flowable for flowable in iter_story(data) if isinstance(flowable, Table)]
+        # The first table is the quotation header.
+        return [table._cellvalues for table in tables[1:]]
+
+    def test_lines_are_chunked_with_a_running_subtotal(self):
+        # Lines: (chunks, line rows per chunk, subtotals carried forward).
+        expected = {
+            0: ([0], []),
+            20: ([20], []),
+            21: ([20, 1], ['BDT 30.00']),
+            # 180 lines after the first page fill six chunks exactly.
+            200: ([20] + [30] * 6, [f'BDT {lines * Decimal("1.5"):.2f}' for lines in range(20, 200, 30)]),
+        }
+        for line_count, (chunk_lines, carried) in expected.items():
+            with self.subTest(lines=line_count):
+                tables = self._item_tables(pdf_data(line_count))
+                # A column header row, the lines, then a subtotal or the total row.
+                self.assertEqual([len(rows) for rows in tables], [lines + 2 for lines in chunk_lines])
+                self.assertEqual([rows[-1][-1] for rows in tables[:-1]], carried)
+                self.assertTrue(all(rows[-1][-2] == 'Subtotal c/f' for rows in tables[:-1]))
+                self.assertEqual(tables[-1][-1], ['', '', '', '', 'Total (BDT)', f'{line_count * Decimal("1.5"):.2f}'])
+
+    def test_each_chunk_fills_one_page(self):
+        for line_count, pages in ((0, 1), (20, 1), (21, 2), (200, 7)):
+            with self.subTest(lines=line_count):
+                self.assertEqual(render_pdf(pdf_data(line_count), io.BytesIO()), pages)
+
+    def test_lazy_story_pulls_flowables_as_the_build_consumes_them(self):
+        pulled = []
+
+        def flowables():
+            for flowable in iter_story(pdf_data(200)):
+                pulled.append(flowable)
+                yield flowable
+
+        story = LazyStory(flowables(), lookahead=4)
+        self.assertEqual(len(story), 4)
+        self.assertEqual(len(pulled), 4)
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer)
+        doc.build(story)
+        self.assertEqual(doc.page, 7)
+        self.assertEqual(len(pulled), len(build_story(pdf_data(200))))
+
+    def test_quotation_streams_from_the_database(self):
+        product = make_product()
+        quotation = Quotation.objects.create(order_number='Q-STREAM')
+        QuotationLine.objects.bulk_create([
+            QuotationLine(quotation=quotation, product=product, unit_price=Decimal('10.00')) for _ in range(21)
+        ])
+        quotation.compute_total()
+        spool = spooled_quotation_pdf(quotation)
+        self.assertEqual(spool.read(5), b'%PDF-')
+        data = quotation_data(quotation, stream_lines=True)
+        self.assertEqual(len(list(data['lines'])), 21)
+        self.assertEqual(data['totals'], [('BDT', '210.00')])
+
+
+class PdfBatchTests(TestCase):
+    def setUp(self):
+        self.datas = [pdf_data(line_count, pk=pk, order_number=f'Q-{pk}') for pk, line_count in ((1, 5), (2, 21), (3, 0))]
+
+    def test_batch_renders_in_input_order(self):
+        serial = list(render_many(self.datas, processes=1))
+        self.assertEqual([(name, pages) for name, _, pages in serial],
+                         [('quotation_Q-1.pdf', 1), ('quotation_Q-2.pdf', 2), ('quotation_Q-3.pdf', 1)])
+        self.assertTrue(all(content.startswith(b'%PDF-') for _, content, _ in serial))
+        pooled = list(render_many(self.datas, processes=2))
+        self.assertEqual([(name, pages) for name, _, pages in pooled], [(name, pages) for name, _, pages in serial])
+
+    def test_zip_and_merged_pdf(self):
+        archive = io.BytesIO()
+        self.assertEqual(write_zip(render_many(self.datas, processes=1), archive), (3, 4))
+        with zipfile.ZipFile(archive) as opened:
+            self.assertEqual(opened.namelist(), ['quotation_Q-1.pdf', 'quotation_Q-2.pdf', 'quotation_Q-3.pdf'])
+        self.assertEqual(render_merged_pdf(self.datas, io.BytesIO()), 4)
+
+    def test_admin_download_actions(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin_user)
+        product = make_product()
+        quotations = [Quotation.objects.create(order_number=f'Q-ADMIN-{i}') for i in range(2)]
+        for quotation in quotations:
+            QuotationLine.objects.create(quotation=quotation, product=product, unit_price=Decimal('10.00'))
+        response = self.client.post(reverse('admin:eshop_quotation_changelist'), {
+            'action': 'download_pdfs_zip', '_selected_action': [quotation.pk for quotation in quotations],
+        })
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as opened:
+            self.assertEqual(opened.namelist(), ['quotation_Q-ADMIN-0.pdf', 'quotation_Q-ADMIN-1.pdf'])
+
+        response = self.client.post(reverse('admin:eshop_quotation_changelist'), {
+            'action': 'download_merged_pdf', '_selected_action': [quotation.pk for quotation in quotations],
+        })
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="quotations.pdf"')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF-'))
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """A minimal local SMTP server that accepts and counts messages."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPStandInHandler)
+        self.connections = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class _SMTPStandInHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.wfile.write(b"220 localhost stand-in\r\n")
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    with server.lock:
+                        server.messages += 1
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250 localhost\r\n")
+            elif command == b"DATA":
+                in_data = True
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                break
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+def closed_port():
+    """A local TCP port nothing listens on."""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPException("Mail server unavailable")
+
+
+class OutboxTests(TestCase):
+    def test_discount_request_queues_staff_and_customer_email(self):
+        product = make_product()
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+        self.client.force_login(user)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post(
+                reverse('ask_for_discount', args=[product.sku]), discount_post_data(product)
+            )
+            # The PDF is rendered when the emails are sent, not written here.
+            self.assertEqual(os.listdir(media_root), [])
+        self.assertEqual(response.status_code, 200)
+        quotation = Quotation.objects.get()
+        self.assertContains(response, reverse('quotation_pdf', args=[quotation.pk]))
+        recipients = set(OutboundEmail.objects.values_list('recipients', flat=True))
+        self.assertIn('buyer@example.com', recipients)
+        self.assertEqual(
+            OutboundEmail.objects.filter(quotation=quotation, attach_quotation_pdf=True).count(), 2
+        )
+        # Nothing is sent during the request itself.
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_dispatch_attaches_the_quotation_pdf(self):
+        product = make_product()
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@example.com', 'secret'))
+        self.client.post(reverse('ask_for_discount', args=[product.sku]), discount_post_data(product))
+        quotation = Quotation.objects.get()
+
+        self.assertEqual(dispatch(rate_limit=0), {'sent': 2, 'failed': 0, 'dead': 0})
+        for message in mail.outbox:
+            (file_name, content, mimetype), = message.attachments
+            self.assertEqual(file_name, f"quotation_{quotation.order_number}.pdf")
+            self.assertTrue(content.startswith(b'%PDF-'))
+            self.assertEqual(mimetype, 'application/pdf')
+
+    def test_email_for_a_deleted_quotation_is_not_sent(self):
+        product = make_product()
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@example.com', 'secret'))
+        self.client.post(reverse('ask_for_discount', args=[product.sku]), discount_post_data(product))
+        Quotation.objects.all().delete()
+
+        self.assertEqual(dispatch(rate_limit=0), {'sent': 0, 'failed': 2, 'dead': 0})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertIn('deleted', OutboundEmail.objects.first().last_error)
+
+    def test_claimed_email_is_left_to_its_dispatcher_until_the_lease_runs_out(self):
+        email = enqueue("Subject", "Body", ["sales@example.com"])
+        OutboundEmail.objects.update(claimed_by='other:1:abcdef', claimed_until=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(dispatch(rate_limit=0), {'sent': 0, 'failed': 0, 'dead': 0})
+
+        OutboundEmail.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatch(rate_limit=0), {'sent': 1, 'failed': 0, 'dead': 0})
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.claimed_by, email.claimed_until), (EmailStatus.SENT, '', None))
+
+    @override_settings(EMAIL_BACKEND='eshop.tests.FailingEmailBackend', ESHOP_EMAIL_RETRY_DELAY=60)
+    def test_failing_email_backs_off_then_is_dead_lettered(self):
+        email = enqueue("Subject", "Body", ["sales@example.com"])
+        delays = []
+        for _ in range(3):
+            self.assertEqual(sum(dispatch(max_attempts=3, rate_limit=0).values()), 1)
+            # Not due again until its backoff has passed.
+            self.assertEqual(dispatch(max_attempts=3, rate_limit=0), {'sent': 0, 'failed': 0, 'dead': 0})
+            email.refresh_from_db()
+            if email.status == EmailStatus.QUEUED:
+                delays.append(round((email.next_attempt_at - timezone.now()).total_seconds() / 60))
+            OutboundEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(delays, [1, 2])
+        email.refresh_from_db()
+        self.assertEqual(email.status, EmailStatus.DEAD)
+        self.assertEqual(email.attempts, 3)
+        self.assertIn("Mail server unavailable", email.last_error)
+
+    def test_unreachable_mail_server_leaves_the_outbox_for_the_next_poll(self):
+        email = enqueue("Subject", "Body", ["sales@example.com"])
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=closed_port(), EMAIL_TIMEOUT=2,
+        ), self.assertLogs('eshop.outbox', 'WARNING'):
+            self.assertEqual(dispatch(rate_limit=0), {'sent': 0, 'failed': 0, 'dead': 0})
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (EmailStatus.QUEUED, 0))
+
+
+class OutboxThroughputTests(TestCase):
+    queued = 1000
+    # Emails per second; a small fraction of what one local connection manages.
+    min_throughput = 100
+
+    def setUp(self):
+        self.server = SMTPStandIn()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_drains_outbox_over_one_connection(self):
+        OutboundEmail.objects.bulk_create([
+            OutboundEmail(subject=f"Quotation {i}", body="Body", from_email="info@example.com",
+                          recipients="customer@example.com")
+            for i in range(self.queued)
+        ])
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.server.port,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='', EMAIL_USE_TLS=False,
+        ):
+            sent_before = EMAILS._values.get(('sent',), 0)
+            started = time.monotonic()
+            stats = dispatch(batch_size=200, rate_limit=0)
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(stats, {'sent': self.queued, 'failed': 0, 'dead': 0})
+        self.assertEqual(self.server.messages, self.queued)
+        self.assertEqual(self.server.connections, 1)
+        self.assertFalse(OutboundEmail.objects.exclude(status=EmailStatus.SENT).exists())
+        self.assertEqual(EMAILS._values[('sent',)] - sent_before, self.queued)
+        self.assertGreater(self.queued / elapsed, self.min_throughput)
+
+
+class ConcurrentDispatchTests(TransactionTestCase):
+    queued = 200
+    dispatchers = 4
+
+    def _dispatch(self, _):
+        try:
+            return dispatch(batch_size=10, rate_limit=0)
+        finally:
+            connection.close()
+
+    def test_parallel_dispatchers_send_each_email_once(self):
+        OutboundEmail.objects.bulk_create([
+            OutboundEmail(subject=f"Quotation {i}", body="Body", from_email="info@example.com",
+                          recipients="customer@example.com")
+            for i in range(self.queued)
+        ])
+        with ThreadPoolExecutor(max_workers=self.dispatchers) as pool:
+            results = list(pool.map(self._dispatch, range(self.dispatchers)))
+
+        self.assertEqual(sum(stats['sent'] for stats in results), self.queued)
+        subjects = [message.subject for message in mail.outbox]
+        self.assertEqual(len(subjects), self.queued)
+        self.assertEqual(len(set(subjects)), self.queued)
+        self.assertFalse(OutboundEmail.objects.exclude(status=EmailStatus.SENT).exists())
+
+
+class MetricsTests(TestCase):
+    def _process_registry(self, directory):
+        registry = Registry(directory=directory, flush_interval=0)
+        Counter('jobs_total', 'Jobs run.', ['kind'], registry=registry)
+        Histogram('job_seconds', 'Job duration.', buckets=(0.1, 1), registry=registry)
+        return registry
+
+    def test_scrape_sums_every_process_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            worker_a = self._process_registry(directory)
+            worker_b = self._process_registry(directory)
+            worker_a._metrics['jobs_total'].labels(kind='pdf').inc(2)
+            worker_b._metrics['jobs_total'].labels(kind='pdf').inc(3)
+            worker_b._metrics['job_seconds'].observe(0.5)
+            # A process that has exited is folded into the archive, not dropped.
+            with open(os.path.join(directory, '999999999-deadbeef.json'), 'w') as fh:
+                fh.write('{"jobs_total": [[["pdf"], 10]]}')
+
+            scraper = self._process_registry(directory)
+            text = scraper.exposition()
+
+            self.assertIn('jobs_total{kind="pdf"} 15.0', text)
+            self.assertIn('job_seconds_bucket{le="0.1"} 0.0', text)
+            self.assertIn('job_seconds_bucket{le="1.0"} 1.0', text)
+            self.assertIn('job_seconds_bucket{le="+Inf"} 1.0', text)
+            self.assertIn('job_seconds_count 1.0', text)
+            self.assertNotIn('999999999-deadbeef.json', os.listdir(directory))
+            self.assertIn('jobs_total{kind="pdf"} 15.0', scraper.exposition())
+
+    @override_settings(ESHOP_METRICS_TOKEN='scrape-secret', ESHOP_METRICS_ALLOWED_IPS=[])
+    def test_metrics_endpoint(self):
+        product = make_product()
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+        self.client.force_login(user)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            self.client.post(reverse('ask_for_discount', args=[product.sku]), discount_post_data(product))
+        # The quotation PDF is rendered when its emails are sent.
+        dispatch(rate_limit=0)
+        self.client.logout()
+
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('eshop_quotations{status="pending"} 1.0', text)
+        self.assertIn('eshop_quotations{status="delivered"} 0.0', text)
+        self.assertIn('eshop_quotations_submitted_total{currency="BDT"}', text)
+        self.assertIn('eshop_pdf_render_seconds_count{kind="single"}', text)
+
+
+class StorefrontBenchmarkTests(TransactionTestCase):
+    """Every benchmark scenario answers successfully within its query budget."""
+
+    def setUp(self):
+        # The WSGI driver closes the connection after each request like a
+        # real server does, so these tests cannot share one transaction.
+        self.counts = generate(products=40, customers=5, quotations=20, lines_per_quotation=3, seed=7)
+
+    def test_generator_is_sized_by_its_options(self):
+        self.assertEqual(self.counts['product'], 40)
+        self.assertEqual(Quotation.objects.filter(order_number__startswith='SYN7-').count(), 20)
+        quotation = Quotation.objects.filter(order_number__startswith='SYN7-').first()
+        self.assertEqual(quotation.lines.count(), 3)
+        total = sum(line.line_total() for line in quotation.lines.all())
+        self.assertEqual(quotation.total_amount, total.quantize(Decimal('0.01')))
+        # Products carry the spec fields of their family and link within it.
+        plc = Product.objects.filter(name__startswith='SYN7-PLC-').first()
+        self.assertTrue(plc.plc_input)
+        self.assertIsNone(plc.rated_torque)
+        self.assertIn('PLC', [plc.category.name, getattr(plc.category.parent, 'name', None)])
+        self.assertTrue(plc.compatible_modules.exists())
+        self.assertFalse(plc.related_products.exclude(name__startswith='SYN7-PLC-').exists())
+
+    def test_scenarios_stay_within_query_budgets(self):
+        context = default_context()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for driver in ('client', 'wsgi'):
+                results = [run_scenario(s, context, driver, requests=3, warmup=1) for s in SCENARIOS]
+                self.assertEqual(compare(results), [])
+
+    def test_regressions_against_baseline_are_reported(self):
+        context = default_context()
+        result = run_scenario(SCENARIOS[0], context, requests=3, warmup=0)
+        baseline = {result.key: {'queries': result.queries - 1, 'p95_ms': result.p95_ms, 'throughput': 0}}
+        problems = compare([result], baseline)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('queries went from', problems[0])
+
+
+class ProductVariantTests(TestCase):
+    def setUp(self):
+        self.template = make_product(name='FR-D720S-0.4K', sku='FR-D720S-0.4K')
+        self.template.input_voltage = '1-phase 200-240V'
+        self.template.save()
+        self.template.related_products.add(make_product(name='FR-PU07', sku='FR-PU07'))
+
+    def test_variants_are_created_with_a_constant_number_of_queries(self):
+        rows = [{'name': f'FR-D720S-{kw}K', 'sku': f'FR-D720S-{kw}K', 'rated_output_power': f'{kw} kW'}
+                for kw in ('0.75', '1.5', '2.2')]
+        with self.assertNumQueries(7):
+            variants = create_variants(self.template, rows, link_siblings=True)
+
+        variant = Product.objects.get(sku='FR-D720S-2.2K')
+        self.assertEqual(len(variants), 3)
+        self.assertEqual(variant.rated_output_power, '2.2 kW')
+        self.assertEqual(variant.input_voltage, '1-phase 200-240V')
+        self.assertEqual(
+            set(variant.related_products.values_list('sku', flat=True)),
+            {'FR-PU07', 'FR-D720S-0.4K', 'FR-D720S-0.75K', 'FR-D720S-1.5K'},
+        )
+
+    def test_collisions_create_nothing(self):
+        rows = [{'name': 'FR-D720S-0.75K', 'sku': 'FR-D720S-0.75K'}, {'name': 'Other', 'sku': 'FR-PU07'}]
+        with self.assertRaises(VariantError) as raised:
+            create_variants(self.template, rows)
+        self.assertEqual(raised.exception.errors, ["A product with SKU 'FR-PU07' already exists."])
+        self.assertFalse(Product.objects.filter(sku='FR-D720S-0.75K').exists())
+
+
+class CompatibilityGraphTests(TestCase):
+    def setUp(self):
+        invalidate_graph()
+        plc = Category.objects.create(name='PLC')
+        self.plc = make_product(name='FX5U-32MR', sku='FX5U-32MR', category=plc)
+        self.hmi = make_product(name='GS2107', sku='GS2107', category=plc)
+        self.cable = make_product(name='GT09-C30R2-9P', sku='GT09-C30R2-9P', category=plc)
+        self.plc.compatible_modules.add(self.hmi)
+        self.hmi.compatible_modules.add(self.cable)
+        self.plc.related_products.add(make_product(name='FX5U-64MR', sku='FX5U-64MR', category=plc))
+
+    def test_walks_and_invalidation(self):
+        graph = get_graph()
+        self.assertEqual(graph.compatible_within(self.plc.pk, 1), {self.hmi.pk: 1})
+        self.assertEqual(graph.compatible_within(self.plc.pk, 2), {self.hmi.pk: 1, self.cable.pk: 2})
+        self.assertEqual(graph.compatible_within(self.cable.pk, 2, direction='both'), {self.hmi.pk: 1, self.plc.pk: 2})
+        self.assertEqual(graph.bill_of_materials([self.plc.pk]), [
+            (self.plc.pk, 0, None), (self.hmi.pk, 1, self.plc.pk), (self.cable.pk, 2, self.hmi.pk),
+        ])
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_graph(), graph)
+        self.hmi.compatible_modules.remove(self.cable)
+        self.assertEqual(get_graph().compatible_within(self.plc.pk, 2), {self.hmi.pk: 1})
+
+    def test_detail_page_and_configurator_api(self):
+        self.plc.related_products.add(*[
+            make_product(name=f'FX5U-{n}MT', sku=f'FX5U-{n}MT') for n in range(5)
+        ])
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('product_detail', args=[self.plc.sku]))
+        self.assertContains(response, 'Compatible Modules')
+        self.assertContains(response, 'FX5U-4MT')
+        # Every grid card's button leads to the discount form of its product.
+        self.assertContains(response, f'href="{reverse("ask_for_discount", args=["FX5U-4MT"])}"')
+        self.assertContains(response, f'href="{reverse("ask_for_discount", args=[self.hmi.sku])}"')
+        self.assertNotContains(response, 'href="#"')
+
+        response = self.client.get(reverse('api_configurator', args=[self.plc.pk]), {'hops': 2})
+        self.assertEqual(
+            [(row['sku'], row['hops']) for row in response.json()['compatible']],
+            [('GS2107', 1), ('GT09-C30R2-9P', 2)],
+        )
+        response = self.client.get(reverse('api_bill_of_materials'), {'ids': f'{self.plc.pk}'})
+        self.assertEqual([row['required_by'] for row in response.json()['items']], [None, self.plc.pk, self.hmi.pk])
+        response = self.client.get(reverse('api_configurator', args=[self.plc.pk]), {'hops': 9})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecommendationTests(TestCase):
+    def quote(self, *products, status=OrderStatus.PENDING):
+        quotation = Quotation.objects.create(status=status)
+        QuotationLine.objects.bulk_create([QuotationLine(quotation=quotation, product=p) for p in products])
+
+    def test_cosine_neighbours_are_stored_and_served(self):
+        plc, hmi, cable, servo = [make_product(name=sku, sku=sku) for sku in ('FX5U', 'GS2107', 'GT09', 'MR-J4')]
+        self.quote(plc, hmi, cable)
+        self.quote(plc, hmi)
+        self.quote(plc, servo)
+        self.quote(hmi, servo, status=OrderStatus.CANCELED)
+
+        stats = build_recommendations(top_k=2)
+        self.assertEqual(stats['baskets'], 3)
+        rows = list(ProductRecommendation.objects.filter(product=plc).values_list('recommended__sku', 'co_quotations'))
+        self.assertEqual(rows, [('GS2107', 2), ('GT09', 1)])
+        score = ProductRecommendation.objects.get(product=plc, rank=1).score
+        self.assertAlmostEqual(score, 2 / (3 * 2) ** 0.5)
+
+        # An incremental run over the recent quotations gives the same rows.
+        full = list(ProductRecommendation.objects.values_list('product', 'recommended', 'rank', 'score'))
+        build_recommendations(top_k=2, since=timezone.now() - timedelta(days=1))
+        self.assertEqual(list(ProductRecommendation.objects.values_list('product', 'recommended', 'rank', 'score')), full)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('product_detail', args=[plc.sku]))
+        self.assertContains(response, 'Customers Also Quoted')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api_product_recommendations', args=[plc.pk]))
+        self.assertEqual([row['sku'] for row in response.json()['recommendations']], ['GS2107', 'GT09'])
+
+
+class ProductCardTests(TestCase):
+    def test_listings_load_only_card_columns(self):
+        vfd = Category.objects.create(name='VFD')
+        product = make_product(category=vfd)
+        product.description = 'Long description ' * 100
+        product.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('category_filter', args=['VFD']))
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('description', queries[1]['sql'])
+        self.assertContains(response, reverse('ask_for_discount', args=[product.sku]))
+
+        # A changed price is a different cache entry, never a stale card.
+        Product.objects.filter(pk=product.pk).update(original_price=Decimal('1234.00'))
+        self.assertContains(self.client.get(reverse('category_filter', args=['VFD'])), '৳1234.00')
+
+    @override_settings(ESHOP_PAGE_SIZE=2)
+    def test_keyset_pages_cover_every_product_once(self):
+        vfd = Category.objects.create(name='VFD')
+        for i, price in enumerate(['300', '100', '200', '100', '100']):
+            make_product(name=f'FR-E820-{i}', sku=f'FR-E820-{i}', price=price, category=vfd)
+        url = reverse('category_filter', args=['VFD'])
+
+        seen, params = [], {'sort': 'price'}
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertNotIn('OFFSET', queries[-1]['sql'])
+            self.assertTemplateUsed(response, 'partials/_product_page.html')
+            self.assertTemplateNotUsed(response, 'category_filter.html')
+            seen += [product.original_price for product in response.context['products']]
+            if not response.context['next_url']:
+                break
+            params = dict(parse_qsl(urlsplit(response.context['next_url']).query))
+        self.assertEqual(seen, sorted(Decimal(p) for p in ['300', '100', '200', '100', '100']))
+
+        # A mangled cursor starts over instead of failing.
+        response = self.client.get(url, {'sort': 'price', 'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 2)
+
+    def test_detail_specs_follow_the_family_and_are_cached_per_update(self):
+        servo = Category.objects.create(name='SERVO')
+        series = Category.objects.create(name='MR-J5', parent=servo)
+        product = make_product(category=series)
+        product.rated_torque, product.rated_output, product.plc_input = '1.3 N·m', '400 W', '8 points'
+        product.save()
+        url = reverse('product_detail', args=[product.sku])
+
+        response = self.client.get(url)
+        content = response.content.decode()
+        # SERVO fields in fieldset order, then other fields, then origin.
+        positions = [content.index(label) for label in (
+            'Rated Output:', 'Rated Torque:', 'PLC Input:', 'Country Of Origin:',
+        )]
+        self.assertEqual(positions, sorted(positions))
+        self.assertNotIn('Rated Output Power', content)
+
+        # Served from the cache: a queryset update does not touch updated_at.
+        Product.objects.filter(pk=product.pk).update(rated_torque='9.9 N·m')
+        self.assertContains(self.client.get(url), '1.3 N·m')
+        product.refresh_from_db()
+        product.save()
+        self.assertContains(self.client.get(url), '9.9 N·m')
+
+
+class AsyncViewTests(TestCase):
+    async def test_catalog_endpoints_run_async(self):
+        vfd = await Category.objects.acreate(name='VFD')
+        brand = await Brand.objects.acreate(name='Mitsubishi')
+        product = await Product.objects.acreate(
+            category=vfd, brand=brand, name='FR-D720S-0.4K', sku='FR-D720S-0.4K',
+            original_price=Decimal('1000.00'), image='products/placeholder.png', country_of_origin='Japan',
+        )
+        user = await User.objects.acreate(username='async-customer', is_staff=True)
+        await sync_to_async(self.async_client.force_login)(user)
+
+        response = await self.async_client.get(reverse('api_product_autocomplete'), {'q': 'd720'})
+        self.assertEqual(response.json()['results'], [{'id': product.pk, 'name': product.name, 'sku': product.sku}])
+        response = await self.async_client.get(reverse('api_product_list'), {'sort': 'price'})
+        self.assertEqual([row['sku'] for row in response.json()['results']], [product.sku])
+        response = await self.async_client.get(reverse('api_product_detail', args=[product.pk]))
+        self.assertEqual(response.json()['brand__name'], 'Mitsubishi')
+        # The lazy request.user is resolved before the template asks for it.
+        response = await self.async_client.get(reverse('category_filter', args=['vfd']))
+        self.assertContains(response, product.name)
+        self.assertContains(response, reverse('order_management'))
+
+    def test_offload_pool_bounds_concurrency(self):
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def job():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return threading.current_thread().name
+
+        async def burst():
+            return await asyncio.gather(*(offload('test-burst', job) for _ in range(8)))
+
+        with override_settings(ESHOP_OFFLOAD_POOLS={'test-burst': 2}):
+            names = asyncio.run(burst())
+        self.assertEqual(peak[0], 2)
+        self.assertTrue(all(name.startswith('eshop-test-burst') for name in names))
+        self.assertEqual(get_pool('test-burst')._max_workers, 2)
+
+
+class StartupTests(TestCase):
+    def test_cold_start_within_target(self):
+        profile = measure_cold_start(importtime=True)
+        self.assertLessEqual(profile.total_ms, settings.ESHOP_COLD_START_TARGET_MS)
+        self.assertEqual(list(profile.preload_ms), settings.ESHOP_PRELOAD)
+        # ReportLab is loaded on the first PDF render, not at startup.
+        self.assertFalse([name for name, _, _ in profile.imports if name.startswith('reportlab')])
+
+    def test_preload_steps(self):
+        timings = preload(['urls', 'templates', 'caches', 'pdf'])
+        self.assertEqual(list(timings), ['urls', 'templates', 'caches', 'pdf'])
+
+    def test_asgi_module_imports_inside_a_running_event_loop(self):
+        # As uvicorn does: the ORM refuses sync queries on the loop's thread.
+        async def import_application():
+            sys.modules.pop('eshop_project.asgi', None)
+            return importlib.import_module('eshop_project.asgi').application
+
+        invalidate_rates()
+        invalidate_graph()
+        with self.assertNoLogs('eshop.startup', 'WARNING'):
+            self.assertIsNotNone(asyncio.run(import_application()))
+        self.assertIn('caches', last_preload)
+
+
+class TemplatePerformanceTests(TestCase):
+    def test_profiler_reports_templates_and_loops(self):
+        make_product()
+        template_totals.reset()
+        # Card cache off, so the card template is rendered rather than reused.
+        with override_settings(ESHOP_TEMPLATE_PROFILER={'ENABLED': True}, ESHOP_PRODUCT_CARD_CACHE_TTL=0):
+            response = Client().get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        report = template_totals.snapshot()
+        self.assertEqual(report['requests'], 1)
+        templates = {row['template']: row for row in report['templates']}
+        self.assertEqual(templates['partials/_product_card.html']['renders'], 1)
+        self.assertGreaterEqual(templates['home.html']['total_ms'], templates['partials/_product_card.html']['total_ms'])
+        self.assertIn(('home.html', '{% for product in vfd_products|slice:":4" %}'),
+                      {(row['template'], row['tag']) for row in report['loops']})
+
+    def test_templates_compiled_once(self):
+        engine = engines['django'].engine
+        self.assertIs(engine.get_template('home.html'), engine.get_template('home.html'))
+        out = StringIO()
+        call_command('precompile_templates', '--app', 'eshop', stdout=out)
+        self.assertIn('Compiled', out.getvalue())
+
+
+class OfflineCatalogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('engineer', 'engineer@example.com', 'secret')
+        self.client.force_login(self.user)
+
+    def test_snapshot_versions_and_delta(self):
+        from PIL import Image
+
+        kept, changed, removed = make_product(), make_product('FR-E720-0.1K', 'FR-E720-0.1K'), make_product(
+            'FR-A820-0.4K', 'FR-A820-0.4K')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, 'products'))
+            Product.objects.filter(pk=kept.pk).update(image='products/kept.png')
+            Image.new('RGB', (800, 600), 'navy').save(os.path.join(media_root, 'products', 'kept.png'))
+            first, created = export_snapshot()
+            self.assertTrue(created)
+            self.assertEqual((first.version, first.products), (1, 3))
+            self.assertEqual(export_snapshot(), (first, False))
+
+            Product.objects.filter(pk=changed.pk).update(original_price=Decimal('999.00'))
+            removed_pk = removed.pk
+            removed.delete()
+            added = make_product('FR-F820-0.75K', 'FR-F820-0.75K')
+            second, created = export_snapshot()
+            self.assertEqual((second.version, second.changed, second.removed), (2, 2, 1))
+            snapshots = os.path.dirname(second.file.path)
+            self.assertFalse([name for name in os.listdir(snapshots) if name.endswith('.partial')])
+
+            url = reverse('api_catalog_snapshot')
+            response = self.client.get(url, {'since': '1'})
+            self.assertEqual(response['X-Catalog-Base-Version'], '1')
+            bundle_path = os.path.join(media_root, 'delta.sqlite3.gz')
+            with open(bundle_path, 'wb') as handle:
+                handle.write(b''.join(response.streaming_content))
+            with open_bundle(bundle_path) as db:
+                self.assertEqual(
+                    db.execute('SELECT id, original_price FROM products ORDER BY id').fetchall(),
+                    [(changed.pk, '999.00'), (added.pk, '1000.00')],
+                )
+                self.assertEqual(db.execute('SELECT id FROM removed').fetchall(), [(removed_pk,)])
+                # The kept product's thumbnail shipped in v1 and is not resent.
+                self.assertEqual(db.execute('SELECT count(*) FROM thumbnails').fetchone(), (0,))
+
+            response = self.client.get(url)
+            with open(bundle_path, 'wb') as handle:
+                handle.write(b''.join(response.streaming_content))
+            with open_bundle(bundle_path) as db:
+                (thumbnail,), = db.execute('SELECT data FROM thumbnails WHERE product_id = ?', (kept.pk,))
+                self.assertLess(len(thumbnail), 10000)
+            self.assertEqual(self.client.get(url, {'since': '2'}).status_code, 204)
+
+    def test_offline_import_is_idempotent(self):
+        product = make_product()
+        quotation = {
+            'offline_id': str(uuid.uuid4()),
+            'catalog_version': 1,
+            'lines': [{'product': product.pk, 'quantity': 2, 'unit_price': '900.00', 'discount_percent': '10'}],
+        }
+        stale = {'offline_id': str(uuid.uuid4()), 'lines': [{'product': 999999, 'quantity': 1, 'unit_price': '1'}]}
+        url = reverse('api_quotation_import')
+        response = self.client.post(url, {'quotations': [quotation, stale]}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        (created,) = body['created']
+        self.assertEqual(created['total_amount'], '1620.00')
+        self.assertEqual(created['price_changes'], [{'product': product.pk, 'quoted': '900.00', 'current': '1000.00'}])
+        self.assertEqual(body['rejected'][0]['offline_id'], stale['offline_id'])
+
+        with self.assertNumQueries(4):
+            response = self.client.post(url, {'quotations': [quotation]}, content_type='application/json')
+        self.assertEqual(response.json()['duplicates'][0]['id'], created['id'])
+        saved = Quotation.objects.get(offline_id=quotation['offline_id'])
+        self.assertEqual((saved.customer, saved.lines.count(), saved.catalog_version), (self.user, 1, 1))
+
+    def test_offline_import_line_without_discount(self):
+        product = make_product()
+        quotation = {
+            'offline_id': str(uuid.uuid4()),
+            'lines': [{'product': product.pk, 'quantity': 3, 'unit_price': '1000'}],
+        }
+        response = self.client.post(
+            reverse('api_quotation_import'), {'quotations': [quotation]}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['created'][0]['total_amount'], '3000.00')
+        self.assertEqual(QuotationLine.objects.get(quotation__offline_id=quotation['offline_id']).discount_percent, 0)
+        line = OfflineQuotationLineSerializer(data=quotation['lines'][0])
+        self.assertTrue(line.is_valid(), line.errors)
+        self.assertIsInstance(line.validated_data['discount_percent'], Decimal)
+
+
+class RateLimitTests(TestCase):
+    limits = {
+        'search': {'rate': '1/h', 'burst': 2},
+        'quotation_import': {'rate': '1/h', 'burst': 1, 'key': 'user'},
+    }
+
+    def setUp(self):
+        # Emptied buckets would outlive the test, and user ids are reused.
+        self.addCleanup(cache.clear)
+
+    def test_search_burst_gets_429_with_retry_after(self):
+        with override_settings(ESHOP_RATE_LIMITS=self.limits):
+            bot = Client(REMOTE_ADDR='10.45.0.1')
+            statuses = [bot.get(reverse('search'), {'q': 'd720'}).status_code for _ in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+            response = bot.get(reverse('search'), {'q': 'd720'})
+            self.assertGreater(int(response['Retry-After']), 3000)
+            # Other clients have their own bucket.
+            self.assertEqual(Client(REMOTE_ADDR='10.45.0.2').get(reverse('search')).status_code, 200)
+
+    def test_api_throttle_is_per_user(self):
+        url = reverse('api_quotation_import')
+        with override_settings(ESHOP_RATE_LIMITS=self.limits):
+            for username in ('throttled-a', 'throttled-b'):
+                client = Client(REMOTE_ADDR='10.45.0.3')
+                client.force_login(User.objects.create_user(username=username))
+                # Throttling runs before validation, so even an empty upload takes a token.
+                self.assertEqual(client.post(url, {'quotations': []}, content_type='application/json').status_code, 400)
+                response = client.post(url, {'quotations': []}, content_type='application/json')
+                self.assertEqual(response.status_code, 429)
+                self.assertIn('Retry-After', response)
+
+    def test_checks_cost_under_a_millisecond_and_survive_cache_failure(self):
+        limits = {'benchmark': {'rate': '1000000/s', 'burst': 1000000}}
+        for cache_alias in ('default', 'no-such-cache'):
+            with override_settings(ESHOP_RATE_LIMITS=limits, ESHOP_RATE_LIMIT_CACHE=cache_alias):
+                with self.assertLogs('eshop.ratelimit', 'WARNING') if cache_alias != 'default' else nullcontext():
+                    started = time.perf_counter()
+                    for index in range(500):
+                        self.assertEqual(check('benchmark', f'test:{index % 50}'), (True, 0))
+                    self.assertLess((time.perf_counter() - started) / 500, 0.001)
+
+    def test_per_process_buckets_split_the_rate_and_keep_the_burst(self):
+        limits = {'search': {'rate': '8/h', 'burst': 8}}
+        with override_settings(ESHOP_RATE_LIMITS=limits, ESHOP_RATE_LIMIT_PROCESSES=4):
+            self.assertEqual(bucket_processes(), 4)
+            self.assertEqual((get_limit('search').burst, get_limit('search').per_second), (8, 2 / 3600))
+            # A cache every worker shares enforces the configured rate as is.
+            with override_settings(ESHOP_RATE_LIMIT_CACHE='shared'):
+                self.assertEqual(bucket_processes(), 1)
+                self.assertEqual((get_limit('search').burst, get_limit('search').per_second), (8, 8 / 3600))
+
+    def test_configured_quotation_limit_holds_per_worker(self):
+        # The production policy, with buckets in each of six processes: a
+        # customer whose requests all reach one worker still gets the burst.
+        product = make_product()
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@example.com', 'secret'))
+        quotation = settings.ESHOP_RATE_LIMITS['quotation']
+        with override_settings(ESHOP_RATE_LIMIT_PROCESSES=6, ESHOP_RATE_LIMITS={'quotation': quotation}):
+            statuses = [
+                self.client.post(reverse('ask_for_discount', args=[product.sku]), {}).status_code
+                for _ in range(quotation['burst'] + 1)
+            ]
+        self.assertEqual(statuses, [200] * quotation['burst'] + [429])
+
+
+class QuotationLineEditTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='line-editor', is_staff=True))
+        self.products = [make_product(name=f'FR-E8{index}', sku=f'FR-E8{index}') for index in range(3)]
+        self.quotation = Quotation.objects.create(order_number='Q-LINES')
+        QuotationLine.objects.bulk_create([
+            QuotationLine(quotation=self.quotation, product=product, quantity=1, unit_price=Decimal('100.00'))
+            for product in self.products
+        ])
+        self.url = reverse('api_quotation_lines', args=[self.quotation.pk])
+        get_rates()
+
+    def post(self, batch):
+        return self.client.post(self.url, batch, content_type='application/json')
+
+    def test_batch_is_applied_with_a_fixed_number_of_queries(self):
+        first, second, third = self.quotation.lines.order_by('pk')
+        batch = {
+            'version': 1,
+            'add': [{'product': self.products[0].pk, 'quantity': 3, 'unit_price': '50.00', 'discount_percent': '10'}],
+            'update': [{'id': first.pk, 'quantity': 2}, {'id': second.pk, 'discount_percent': '50'}],
+            'delete': [third.pk],
+        }
+        # Session, user, quotation, savepoint; version bump, lines, products,
+        # delete, update, insert; total aggregate, its update and the
+        # savepoint release.
+        with self.assertNumQueries(13):
+            response = self.post(batch)
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual((body['version'], body['total_amount'], body['deleted']), (2, '385.00', [third.pk]))
+        self.assertEqual([line['line_total'] for line in body['updated']], ['200.00', '50.00'])
+        (added,) = body['created']
+        self.assertEqual(added['line_total'], '135.00')
+        self.assertEqual(self.quotation.lines.count(), 3)
+
+    def test_stale_version_and_unknown_lines_change_nothing(self):
+        line = self.quotation.lines.first()
+        self.assertEqual(self.post({'version': 1, 'update': [{'id': line.pk, 'quantity': 5}]}).status_code, 200)
+        response = self.post({'version': 1, 'update': [{'id': line.pk, 'quantity': 9}]})
+        self.assertEqual((response.status_code, response.json()['version']), (409, 2))
+        response = self.post({'version': 2, 'update': [{'id': line.pk, 'quantity': 9}], 'delete': [999999]})
+        self.assertEqual(response.status_code, 400)
+        self.quotation.refresh_from_db()
+        self.assertEqual((self.quotation.version, self.quotation.lines.get(pk=line.pk).quantity), (2, 5))
+        self.assertEqual(self.client.get(self.url).json()['total_amount'], '700.00')
+
+    def test_currency_without_a_rate_is_refused(self):
+        response = self.post({'version': 1, 'add': [{'product': self.products[0].pk, 'quantity': 1,
+                                                       'unit_price': '10.00', 'currency': 'USD'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No exchange rate from USD to BDT', response.json()['detail'])
+        self.quotation.refresh_from_db()
+        self.assertEqual((self.quotation.version, self.quotation.lines.count()), (1, 3))
+
+    def test_only_pending_quotations_can_be_edited(self):
+        line = self.quotation.lines.first()
+        transition(self.quotation, OrderStatus.CONFIRMED)
+        response = self.post({'version': 1, 'update': [{'id': line.pk, 'quantity': 9}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('only pending quotations can be edited', response.json()['detail'])
+        self.quotation.refresh_from_db()
+        self.assertEqual((self.quotation.version, self.quotation.lines.get(pk=line.pk).quantity), (1, 1))
+
+
+class WorkflowTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+
+    def _racing(self, queryset, victim, races):
+        """Before each of the first `races` UPDATEs, deliver `victim` as another worker would."""
+        updates = []
+
+        class RacingQuerySet(type(queryset)):
+            def update(self, **kwargs):
+                updates.append(kwargs)
+                if len(updates) <= races:
+                    Quotation.objects.filter(pk=victim.pk).update(status=OrderStatus.DELIVERED)
+                return super().update(**kwargs)
+
+        queryset.__class__ = RacingQuerySet
+        return queryset, updates
+
+    def test_only_allowed_transitions_are_made(self):
+        quotation = Quotation.objects.create(order_number='Q-FLOW')
+        with self.assertRaises(InvalidTransition):
+            transition(quotation, OrderStatus.DELIVERED)
+        transition(quotation, OrderStatus.CONFIRMED, user=self.customer, note='Approved')
+        transition(quotation, OrderStatus.DELIVERED)
+        with self.assertRaises(InvalidTransition):
+            transition(quotation, OrderStatus.CANCELED)
+        quotation.refresh_from_db()
+        self.assertEqual(quotation.status, OrderStatus.DELIVERED)
+        self.assertEqual(
+            list(QuotationStatusLog.objects.order_by('pk').values_list('from_status', 'to_status', 'note')),
+            [(OrderStatus.PENDING, OrderStatus.CONFIRMED, 'Approved'), (OrderStatus.CONFIRMED, OrderStatus.DELIVERED, '')],
+        )
+
+    def test_bulk_transition_is_one_update_and_one_log_insert(self):
+        movable = [Quotation.objects.create(order_number=f'Q-BULK-{i}') for i in range(5)]
+        delivered = Quotation.objects.create(order_number='Q-DONE', status=OrderStatus.DELIVERED)
+        with CaptureQueriesContext(connection) as queries:
+            changes = bulk_transition(Quotation.objects.all(), OrderStatus.CANCELED)
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        self.assertEqual(statements.count('UPDATE'), 1)
+        self.assertEqual(statements.count('INSERT'), 1)
+        self.assertEqual(sorted(changes), [(quotation.pk, OrderStatus.PENDING) for quotation in movable])
+        self.assertEqual(QuotationStatusLog.objects.filter(to_status=OrderStatus.CANCELED).count(), 5)
+        delivered.refresh_from_db()
+        self.assertEqual(delivered.status, OrderStatus.DELIVERED)
+
+    def test_bulk_transition_retries_conflicts(self):
+        quotations = [Quotation.objects.create(order_number=f'Q-RACE-{i}') for i in range(3)]
+        queryset, updates = self._racing(Quotation.objects.all(), quotations[0], races=1)
+        # The conflicting attempt is rolled back, the concurrent change with it.
+        self.assertEqual(len(bulk_transition(queryset, OrderStatus.CONFIRMED)), 3)
+        self.assertEqual(len(updates), 2)
+
+        queryset, updates = self._racing(Quotation.objects.all(), quotations[0], races=CONFLICT_RETRIES)
+        with self.assertRaises(TransitionConflict):
+            bulk_transition(queryset, OrderStatus.CANCELED)
+        self.assertEqual(len(updates), CONFLICT_RETRIES)
+        self.assertFalse(QuotationStatusLog.objects.filter(to_status=OrderStatus.CANCELED).exists())
+
+    def test_hooks_run_only_after_commit(self):
+        calls = []
+
+        @on_transition(OrderStatus.CONFIRMED)
+        def hook(changes, to_status, user):
+            calls.append((changes, to_status))
+        self.addCleanup(_hooks[OrderStatus.CONFIRMED].remove, hook)
+
+        quotation = Quotation.objects.create(order_number='Q-HOOK')
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                transition(quotation, OrderStatus.CONFIRMED)
+                raise RuntimeError("rolled back")
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            transition(quotation, OrderStatus.CONFIRMED)
+            self.assertEqual(calls, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(calls, [([(quotation.pk, OrderStatus.PENDING)], OrderStatus.CONFIRMED)])
+
+    def test_customers_are_emailed_status_changes(self):
+        mine = Quotation.objects.create(customer=self.customer, order_number='Q-MAIL')
+        anonymous = Quotation.objects.create(order_number='Q-ANON')
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_transition(Quotation.objects.filter(pk__in=[mine.pk, anonymous.pk]), OrderStatus.CONFIRMED)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.quotation, mine)
+        self.assertEqual(email.recipients, 'buyer@example.com')
+        self.assertEqual(email.subject, 'Your discount request Q-MAIL is confirmed')
+        self.assertIn('is now confirmed', email.body)
+
+
+@override_settings(ESHOP_INSTRUMENTATION={'ENABLED': True, 'SLOW_REQUEST_MS': 0})
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        rolling_stats.reset()
+        self.addCleanup(rolling_stats.reset)
+
+    def test_disabled_middleware_removes_itself(self):
+        with override_settings(ESHOP_INSTRUMENTATION={'ENABLED': False}):
+            with self.assertRaises(MiddlewareNotUsed):
+                RequestInstrumentationMiddleware(lambda request: HttpResponse())
+            response = Client().get(reverse('home'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(rolling_stats.snapshot(), {})
+
+    def test_request_queries_are_counted(self):
+        make_product()
+        with CaptureQueriesContext(connection) as queries, self.assertLogs('eshop.slow_requests', 'WARNING') as logs:
+            response = self.client.get(reverse('home'))
+        self.assertRegex(
+            response['Server-Timing'],
+            rf'^db;dur=[0-9.]+;desc="{len(queries)} queries", tpl;dur=[0-9.]+, total;dur=[0-9.]+$',
+        )
+        self.assertIn(f'{len(queries)} queries', logs.output[0])
+        report = rolling_stats.snapshot()['home']
+        self.assertEqual(report['count'], 1)
+        self.assertEqual(report['avg_queries'], len(queries))
+        self.assertEqual(report['avg_response_bytes'], len(response.content))
+
+    def test_percentiles_over_the_window(self):
+        stats = RollingStats(window=100)
+        for wall_ms in range(1, 151):
+            sample = RequestStats(max_queries=0)
+            sample.wall_ms, sample.db_count = wall_ms, 2
+            stats.record('home', sample)
+        # Only the last 100 requests (51-150 ms) are kept.
+        report = stats.snapshot()['home']
+        self.assertEqual(report['count'], 100)
+        self.assertEqual((report['p50_ms'], report['p95_ms'], report['p99_ms']), (101, 145, 149))
+        self.assertEqual(report['avg_queries'], 2)
+
+
+class CustomerPortalTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.addCleanup(caches['shared'].clear)
+        # Re-quotes are rate limited.
+        self.addCleanup(cache.clear)
+        self.customer = User.objects.create_user(username='portal-customer', email='portal@example.com')
+        self.client.force_login(self.customer)
+        self.product = make_product(price='1200.00')
+        self.quotation = Quotation.objects.create(customer=self.customer, order_number='Q-PORTAL')
+        QuotationLine.objects.create(
+            quotation=self.quotation, product=self.product, quantity=2, unit_price=Decimal('1000.00'),
+            discount_percent=Decimal('10'),
+        )
+        self.quotation.compute_total()
+        get_rates()
+
+    def test_history_lists_own_quotations_and_caches_the_summary(self):
+        other = User.objects.create_user(username='someone-else')
+        not_mine = Quotation.objects.create(customer=other, order_number='Q-OTHER')
+        response = self.client.get(reverse('customer_portal'))
+        self.assertEqual([q.order_number for q in response.context['quotations']], ['Q-PORTAL'])
+        self.assertEqual(response.context['quotations'][0].line_count, 1)
+        self.assertEqual(response.context['summary']['quotations'], 1)
+        self.assertEqual(response.context['summary']['total'], Decimal('1800.00'))
+        # Session, user and the page; the summary comes from the cache.
+        with self.assertNumQueries(3):
+            self.client.get(reverse('customer_portal'))
+        self.assertEqual(self.client.get(reverse('quotation_detail', args=[not_mine.pk])).status_code, 404)
+
+    def test_summary_is_invalidated_by_new_quotations_and_transitions(self):
+        self.assertEqual(history_summary(self.customer)['by_status'], {'Pending': 1})
+        Quotation.objects.create(customer=self.customer, order_number='Q-PORTAL-2')
+        self.assertEqual(history_summary(self.customer)['quotations'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            transition(self.quotation, OrderStatus.CONFIRMED)
+        self.assertEqual(history_summary(self.customer)['by_status'], {'Pending': 1, 'Confirmed': 1})
+
+    def test_invalidation_reaches_other_workers(self):
+        # Another Passenger process has its own cache objects over the same files.
+        other_worker = FileBasedCache(caches['shared']._dir, {})
+        history_summary(self.customer)
+        key = f'eshop:quotation_history:{self.customer.pk}'
+        self.assertEqual(other_worker.get(key)['quotations'], 1)
+        Quotation.objects.create(customer=self.customer, order_number='Q-PORTAL-2')
+        self.assertIsNone(other_worker.get(key))
+
+    def test_requote_copies_lines_at_current_prices(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post(reverse('requote', args=[self.quotation.pk]))
+        new_quote = Quotation.objects.exclude(pk=self.quotation.pk).get()
+        self.assertRedirects(response, reverse('quotation_detail', args=[new_quote.pk]))
+        (line,) = new_quote.lines.all()
+        self.assertEqual((line.product, line.quantity, line.unit_price, line.discount_percent),
+                         (self.product, 2, Decimal('1200.00'), 0))
+        self.assertEqual((new_quote.customer, new_quote.total_amount), (self.customer, Decimal('2400.00')))
+        self.assertEqual(OutboundEmail.objects.filter(quotation=new_quote).count(), 2)
+
+        stranger = User.objects.create_user(username='stranger')
+        self.client.force_login(stranger)
+        self.assertEqual(self.client.post(reverse('requote', args=[self.quotation.pk])).status_code, 404)
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        self.now = datetime(2026, 10, 19, 10, 2)
+        self.calls = []
+
+    def clock(self):
+        return self.now
+
+    def tick(self):
+        self.calls.append(self.now)
+        return {'ticks': len(self.calls)}
+
+    def test_cron_schedules(self):
+        monday = datetime(2026, 10, 19, 10, 7, 30)
+        cases = [
+            ('*/15 * * * *', monday, datetime(2026, 10, 19, 10, 15)),
+            ('30 2 * * *', monday, datetime(2026, 10, 20, 2, 30)),
+            ('0 4 * * 0', monday, datetime(2026, 10, 25, 4, 0)),
+            # Both day fields restricted: the 1st, the 15th or any Friday.
+            ('0 0 1,15 * 5', monday, datetime(2026, 10, 23, 0, 0)),
+            ('0 9-17/4 * * 1-5', datetime(2026, 10, 23, 17, 0), datetime(2026, 10, 26, 9, 0)),
+            ('@monthly', datetime(2026, 12, 31, 12, 0), datetime(2027, 1, 1, 0, 0)),
+        ]
+        for spec, after, expected in cases:
+            with self.subTest(spec):
+                self.assertEqual(CronSchedule(spec).next_after(after), expected)
+        for spec in ('61 * * * *', '* * *', 'a b c d e', '5-1 * * * *'):
+            with self.subTest(spec), self.assertRaises(ValueError):
+                CronSchedule(spec)
+        with self.assertRaises(ValueError):
+            CronSchedule('0 0 31 2 *').next_after(monday)
+
+    def test_each_due_run_happens_once_across_schedulers(self):
+        jobs = {'tick': Job('tick', '*/5 * * * *', self.tick, lease=60)}
+        first, second = (Scheduler(jobs, owner=owner, clock=self.clock) for owner in ('first', 'second'))
+        first.sync()
+        second.sync()
+        self.assertEqual(first.run_pending(), [])
+
+        self.now = datetime(2026, 10, 19, 10, 5)
+        runs = first.run_pending() + second.run_pending()
+        self.assertEqual(
+            [(run.owner, run.status, run.result) for run in runs], [('first', JobStatus.SUCCEEDED, 'ticks=1')],
+        )
+        lock = JobLock.objects.get(name='tick')
+        self.assertEqual((lock.next_run_at, lock.owner, lock.locked_until), (datetime(2026, 10, 19, 10, 10), '', None))
+        self.assertIn('eshop_job_last_success_timestamp_seconds{job="tick"}', REGISTRY.exposition())
+
+        # A scheduler that dies mid-run keeps the job until its lease runs out.
+        self.now = datetime(2026, 10, 19, 10, 10)
+        self.assertTrue(first.claim(jobs['tick']))
+        JobRun.objects.create(job='tick', owner='first', started_at=self.now)
+        self.now += timedelta(seconds=30)
+        self.assertEqual(second.run_pending(), [])
+        self.now += timedelta(seconds=31)
+        (run,) = second.run_pending()
+        self.assertEqual((run.owner, len(self.calls)), ('second', 2))
+        self.assertEqual(JobRun.objects.get(owner='first', started_at=datetime(2026, 10, 19, 10, 10)).status,
+                         JobStatus.FAILED)
+
+    def test_failed_runs_are_recorded_and_rescheduled(self):
+        def broken():
+            raise RuntimeError("disk full")
+
+        scheduler = Scheduler({'broken': Job('broken', '@hourly', broken)}, clock=self.clock)
+        scheduler.sync()
+        with self.assertLogs('eshop.scheduler', 'ERROR'):
+            run = scheduler.run_now('broken')
+        self.assertEqual(run.status, JobStatus.FAILED)
+        self.assertIn('RuntimeError: disk full', run.error)
+        self.assertIsNotNone(run.duration)
+        lock = JobLock.objects.get(name='broken')
+        self.assertEqual((lock.next_run_at, lock.owner), (datetime(2026, 10, 19, 11, 0), ''))
+
+    def test_maintenance_jobs(self):
+        old = timezone.now() - timedelta(days=40)
+        stale = Quotation.objects.create(order_number='Q-STALE')
+        confirmed = Quotation.objects.create(order_number='Q-CONFIRMED', status=OrderStatus.CONFIRMED)
+        fresh = Quotation.objects.create(order_number='Q-FRESH')
+        Quotation.objects.filter(pk__in=[stale.pk, confirmed.pk]).update(created_at=old)
+        jobs = {'expire': {'schedule': '@daily', 'function': 'eshop.maintenance.expire_stale_quotations'}}
+        out = StringIO()
+        with override_settings(ESHOP_SCHEDULED_JOBS=jobs):
+            call_command('run_scheduler', '--run', 'expire', stdout=out)
+        self.assertIn('expire succeeded', out.getvalue())
+        self.assertIn('expired=1', out.getvalue())
+        statuses = dict(Quotation.objects.values_list('order_number', 'status'))
+        self.assertEqual(statuses, {'Q-STALE': OrderStatus.CANCELED, 'Q-CONFIRMED': OrderStatus.CONFIRMED,
+                                    'Q-FRESH': OrderStatus.PENDING})
+        self.assertTrue(QuotationStatusLog.objects.filter(quotation=stale, to_status=OrderStatus.CANCELED).exists())
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            directory = os.path.join(media_root, 'quotations')
+            os.makedirs(directory)
+            paths = {}
+            for name in ('old', 'queued', 'recent'):
+                paths[name] = os.path.join(directory, f'{name}.pdf')
+                with open(paths[name], 'wb') as pdf:
+                    pdf.write(b'%PDF')
+            for name in ('old', 'queued'):
+                os.utime(paths[name], (old.timestamp(), old.timestamp()))
+            enqueue("Quotation", "Attached.", ['sales@example.com'], attachment_path=paths['queued'], quotation=fresh)
+            stats = clean_quotation_files(max_age_days=30)
+            self.assertEqual(stats, {'removed': 1, 'freed_bytes': 4, 'kept_for_outbox': 1})
+            self.assertEqual(sorted(os.listdir(directory)), ['queued.pdf', 'recent.pdf'])
+
+        stats = optimize_database()
+        self.assertGreater(stats['size_after'], 0)
+
+
+class QueryBudgetTests(TestCase):
+    """Every route in eshop/urls.py stays within ESHOP_QUERY_BUDGETS whatever the page shows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        brands = [Brand.objects.create(name=f'Brand {index}') for index in range(3)]
+        products = []
+        for index, name in enumerate(['Drives', 'Controllers', 'Panels']):
+            parent = Category.objects.create(name=name)
+            for child in ('VFD', 'PLC', 'HMI', 'SERVO', 'FX', 'GOT')[index * 2:index * 2 + 2]:
+                category = Category.objects.create(name=child, parent=parent)
+                products += [
+                    make_product(name=f'{child}-{number}', sku=f'{child}-{number}', category=category,
+                                 brand=brands[number % 3])
+                    for number in range(4)
+                ]
+        first = products[0]
+        first.related_products.set(products[1:4])
+        first.compatible_modules.set(products[4:8])
+        ProductRecommendation.objects.bulk_create([
+            ProductRecommendation(product=first, recommended=product, rank=rank, score=0.5, co_quotations=2)
+            for rank, product in enumerate(products[8:11])
+        ])
+        cls.staff = User.objects.create_user(username='budget-staff', is_staff=True)
+        cls.quotation = Quotation.objects.create(customer=cls.staff, order_number='Q-BUDGET', total_amount=1)
+        QuotationLine.objects.bulk_create([
+            QuotationLine(quotation=cls.quotation, product=product, quantity=1, unit_price=product.original_price)
+            for product in products[:4]
+        ])
+        cls.product, cls.brand = first, first.brand
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+        self.addCleanup(cache.clear)
+
+    def cold_caches(self):
+        # Budgets hold for a worker that has not cached anything yet.
+        cache.clear()
+        caches['shared'].clear()
+        invalidate_graph()
+        invalidate_rates()
+
+    def route_requests(self):
+        """url name -> (method, path, data) for one representative request."""
+        product, quotation = self.product, self.quotation
+        return {
+            'home': ('GET', reverse('home'), None),
+            'product_detail': ('GET', reverse('product_detail', args=[product.sku]), None),
+            'fx_series': ('GET', reverse('fx_series'), None),
+            'vfd': ('GET', reverse('vfd'), None),
+            'shop': ('GET', reverse('shop'), None),
+            'category_filter': ('GET', reverse('category_filter', args=['VFD']), None),
+            'brand_detail': ('GET', reverse('brand_detail', args=[self.brand.pk]), None),
+            'search': ('GET', reverse('search'), {'q': '-'}),
+            'ask_for_discount': ('GET', reverse('ask_for_discount', args=[product.sku]), None),
+            'quotation_detail': ('GET', reverse('quotation_detail', args=[quotation.pk]), None),
+            'quotation_pdf': ('GET', reverse('quotation_pdf', args=[quotation.pk]), None),
+            'requote': ('POST', reverse('requote', args=[quotation.pk]), None),
+            'customer_portal': ('GET', reverse('customer_portal'), None),
+            'order_management': ('GET', reverse('order_management'), None),
+            'metrics': ('GET', reverse('metrics'), None),
+            'performance_stats': ('GET', reverse('performance_stats'), None),
+            'template_profile': ('GET', reverse('template_profile'), None),
+            'api_product_list': ('GET', reverse('api_product_list'), None),
+            'api_product_autocomplete': ('GET', reverse('api_product_autocomplete'), {'q': 'VFD'}),
+            'api_product_detail': ('GET', reverse('api_product_detail', args=[product.pk]), None),
+            'api_product_recommendations': ('GET', reverse('api_product_recommendations', args=[product.pk]), None),
+            'api_configurator': ('GET', reverse('api_configurator', args=[product.pk]), {'hops': 2}),
+            'api_bill_of_materials': ('GET', reverse('api_bill_of_materials'), {'ids': f'{product.pk}'}),
+            'api_quotation_transition': ('POST', reverse('api_quotation_transition'), {'status': 'C', 'from_status': 'P'}),
+            'api_quotation_lines': ('GET', reverse('api_quotation_lines', args=[quotation.pk]), None),
+            'api_quotation_import': ('POST', reverse('api_quotation_import'), {'quotations': [{
+                'offline_id': str(uuid.uuid4()),
+                'lines': [{'product': product.pk, 'quantity': 1, 'unit_price': '1000.00'}],
+            }]}),
+            'api_catalog_snapshot': ('GET', reverse('api_catalog_snapshot'), None),
+        }
+
+    def request(self, method, path, data):
+        if method == 'POST':
+            return self.client.post(path, data, content_type='application/json')
+        return self.client.get(path, data)
+
+    def test_every_route_stays_within_its_budget(self):
+        from .urls import urlpatterns
+
+        requests = self.route_requests()
+        self.assertEqual(sorted(requests), sorted(pattern.name for pattern in urlpatterns))
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for name, (method, path, data) in requests.items():
+                with self.subTest(name):
+                    self.cold_caches()
+                    with query_budget(budget_for(name), label=name):
+                        response = self.request(method, path, data)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                    self.assertLess(response.status_code, 500)
+
+    def test_middleware_reports_repeated_queries_with_their_template(self):
+        budgets = {'quotation_detail': 2}
+        config = {'ENABLED': True, 'RAISE': True}
+        with override_settings(ESHOP_QUERY_BUDGETS=budgets, ESHOP_QUERY_BUDGET=config):
+            client = Client()
+            client.force_login(self.staff)
+            with self.assertRaises(QueryBudgetExceeded) as raised:
+                client.get(reverse('quotation_detail', args=[self.quotation.pk]))
+        self.assertIn('ran 4 queries, over its budget of 2', str(raised.exception))
+
+        # An N+1 reports the repeated statement and the tag that ran it.
+        lines = Quotation.objects.get(pk=self.quotation.pk).lines.all()
+        template = engines['django'].from_string('{% for line in lines %}{{ line.product.name }}{% endfor %}')
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            with query_budget(2, label='lines'):
+                template.render({'lines': lines})
+        report = str(raised.exception)
+        self.assertIn('4 x SELECT', report)
+        self.assertIn(':1 {{ line.product.name }}', report)
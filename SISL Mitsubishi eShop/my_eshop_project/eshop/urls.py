@@ -1,15 +1,33 @@
 from django.urls import path
-from . import views
+from . import api_views, views
 
 urlpatterns = [
     path('', views.home_view, name='home'),
     path('product/<str:sku>/', views.product_detail_view, name='product_detail'),
     path('fx-series/', views.fx_series_view, name='fx_series'),
     path('vfd/', views.vfd_view, name='vfd'),
+    path('shop/', views.shop_view, name='shop'),
     path('category/<str:cat_name>/', views.category_filter_view, name='category_filter'),
     path('brand/<int:brand_id>/', views.brand_detail_view, name='brand_detail'),
     path('search/', views.search_view, name='search'),
     path('ask-discount/<str:sku>/', views.ask_for_discount_view, name='ask_for_discount'),
     path('quotation/<int:pk>/', views.quotation_detail_view, name='quotation_detail'),
+    path('quotation/<int:pk>/pdf/', views.quotation_pdf_view, name='quotation_pdf'),
+    path('quotation/<int:pk>/requote/', views.requote_view, name='requote'),
+    path('account/quotations/', views.customer_portal_view, name='customer_portal'),
     path('order-management/', views.order_management_view, name='order_management'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('perf/stats/', views.performance_stats_view, name='performance_stats'),
+    path('perf/templates/', views.template_profile_view, name='template_profile'),
+    path('api/products/', api_views.product_list_view, name='api_product_list'),
+    path('api/products/autocomplete/', api_views.product_autocomplete_view, name='api_product_autocomplete'),
+    path('api/products/<int:pk>/', api_views.product_detail_api_view, name='api_product_detail'),
+    path('api/products/<int:product_id>/recommendations/', api_views.ProductRecommendationsAPIView.as_view(),
+         name='api_product_recommendations'),
+    path('api/configurator/<int:product_id>/', api_views.ConfiguratorAPIView.as_view(), name='api_configurator'),
+    path('api/configurator/bom/', api_views.BillOfMaterialsAPIView.as_view(), name='api_bill_of_materials'),
+    path('api/quotations/transition/', api_views.QuotationBulkTransitionAPIView.as_view(), name='api_quotation_transition'),
+    path('api/quotations/<int:pk>/lines/', api_views.QuotationLinesAPIView.as_view(), name='api_quotation_lines'),
+    path('api/quotations/import/', api_views.OfflineQuotationImportAPIView.as_view(), name='api_quotation_import'),
+    path('api/catalog/snapshot/', api_views.CatalogSnapshotAPIView.as_view(), name='api_catalog_snapshot'),
 ]
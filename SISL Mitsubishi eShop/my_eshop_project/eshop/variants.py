@@ -0,0 +1,149 @@
+"""
+Bulk product variants.
+
+A series such as FR-D720S comes in many ratings that share almost every
+field. create_variants() copies a template product once per row of
+name/SKU/spec overrides and creates them all in one transaction: name and
+SKU collisions are checked with a single query, products are inserted with
+bulk_create, and the template's related_products/compatible_modules links
+are copied by inserting straight into the M2M through tables.
+"""
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .compat_graph import invalidate_graph
+from .models import Product
+
+# Fields a variant row may override. Relations and the key are always
+# taken from the template.
+VARIANT_FIELDS = tuple(
+    field.name for field in Product._meta.concrete_fields
+    if not field.primary_key and not field.is_relation
+)
+REQUIRED_COLUMNS = ('name', 'sku')
+
+
+class VariantError(ValueError):
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("; ".join(self.errors))
+
+
+def parse_variant_rows(text):
+    """
+    Parse CSV text with a header row. `name` and `sku` are required, other
+    columns are field overrides; empty cells keep the template's value.
+    """
+    reader = csv.DictReader(io.StringIO(text.strip()))
+    columns = [column.strip() for column in reader.fieldnames or ()]
+    reader.fieldnames = columns
+    errors = [f"Missing column '{column}'." for column in REQUIRED_COLUMNS if column not in columns]
+    errors += [f"Unknown column '{column}'." for column in columns if column not in VARIANT_FIELDS]
+    if errors:
+        raise VariantError(errors)
+    rows = []
+    for row in reader:
+        values = {column: (value or '').strip() for column, value in row.items() if column}
+        if any(values.values()):
+            rows.append({column: value for column, value in values.items() if value})
+    if not rows:
+        raise VariantError(["No variant rows given."])
+    return rows
+
+
+def _check_collisions(rows):
+    errors = []
+    for column in REQUIRED_COLUMNS:
+        seen = set()
+        for number, row in enumerate(rows, start=1):
+            value = row.get(column)
+            if not value:
+                errors.append(f"Row {number}: '{column}' is required.")
+            elif value in seen:
+                errors.append(f"Row {number}: {column} '{value}' appears more than once.")
+            seen.add(value)
+    if errors:
+        raise VariantError(errors)
+
+    names = [row['name'] for row in rows]
+    skus = [row['sku'] for row in rows]
+    taken = Product.objects.filter(Q(name__in=names) | Q(sku__in=skus)).values_list('name', 'sku')
+    for name, sku in taken:
+        if name in names:
+            errors.append(f"A product with Model Name '{name}' already exists.")
+        if sku in skus:
+            errors.append(f"A product with SKU '{sku}' already exists.")
+    if errors:
+        raise VariantError(errors)
+
+
+def _build_variant(template, row, number):
+    variant = Product(**{name: getattr(template, name) for name in VARIANT_FIELDS})
+    variant.category_id = template.category_id
+    variant.brand_id = template.brand_id
+    for name, value in row.items():
+        field = Product._meta.get_field(name)
+        try:
+            setattr(variant, name, field.to_python(value))
+        except ValidationError as exc:
+            raise VariantError([f"Row {number}: {name}: {' '.join(exc.messages)}"])
+    try:
+        # Uniqueness was checked for the whole batch already; relations come
+        # from the template, so no per-row queries are needed here.
+        variant.full_clean(exclude=['category', 'brand'], validate_unique=False)
+    except ValidationError as exc:
+        raise VariantError([
+            f"Row {number}: {field}: {' '.join(messages)}" for field, messages in exc.message_dict.items()
+        ])
+    return variant
+
+
+def create_variants(template, rows, copy_links=True, link_siblings=False):
+    """
+    Create one product per row (dicts of field overrides with at least name
+    and sku) from `template`. With copy_links the template's related and
+    compatible products are linked to every variant; with link_siblings the
+    variants and the template list each other as related products.
+    Raises VariantError and creates nothing if any row is invalid.
+    """
+    _check_collisions(rows)
+    variants = [_build_variant(template, row, number) for number, row in enumerate(rows, start=1)]
+
+    related = Product.related_products.through
+    compatible = Product.compatible_modules.through
+    try:
+        with transaction.atomic():
+            variants = Product.objects.bulk_create(variants)
+            related_ids = compatible_ids = []
+            if copy_links:
+                related_ids = list(
+                    related.objects.filter(from_product_id=template.pk).values_list('to_product_id', flat=True)
+                )
+                compatible_ids = list(
+                    compatible.objects.filter(from_product_id=template.pk).values_list('to_product_id', flat=True)
+                )
+            related_rows = [
+                related(from_product_id=variant.pk, to_product_id=target)
+                for variant in variants for target in related_ids
+            ]
+            if link_siblings:
+                family = [template.pk] + [variant.pk for variant in variants]
+                related_rows += [
+                    related(from_product_id=source, to_product_id=target)
+                    for source in family for target in family if source != target
+                ]
+            related.objects.bulk_create(related_rows, ignore_conflicts=True)
+            compatible.objects.bulk_create([
+                compatible(from_product_id=variant.pk, to_product_id=target)
+                for variant in variants for target in compatible_ids
+            ])
+    except IntegrityError as exc:
+        # Another request took a name or SKU since the collision check.
+        raise VariantError([f"Could not create the variants: {exc}"])
+    # bulk_create on the through tables sends no m2m_changed.
+    invalidate_graph()
+    return variants
@@ -1,51 +1,79 @@
 import os
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib import messages
 from django.conf import settings
-from django.core.mail import EmailMessage
+from django.db import transaction
+from django.contrib.auth import get_user
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
 from django.contrib.admin.views.decorators import staff_member_required
 from django.template.response import TemplateResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_POST
 
-# ReportLab imports for PDF generation
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-
+from .currency import annotate_totals, get_rates
+from .instrumentation import get_config as instrumentation_config, rolling_stats
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, QUOTATIONS_SUBMITTED, REGISTRY
 from .models import Category, Banner, Brand, Product, Quotation
+from .offload import offload
+from .order_numbers import next_order_number
+from .outbox import enqueue_quotation_emails
+from .pagination import SORTS, apaginate
+from .pdf import spooled_quotation_pdf
+from .portal import history_page, history_summary, requote
+from .ratelimit import rate_limit
+from .template_profiler import get_config as template_profiler_config, totals as template_totals
 from .forms import BrandForm, ProductForm, QuotationHeaderForm, QuotationLineFormSet
 
 
 def home_view(request):
-    categories = Category.objects.filter(parent__isnull=True)
+    categories = Category.objects.filter(parent__isnull=True).prefetch_related('children')
     banner = Banner.objects.first()
-    vfd_products = Product.objects.filter(category__name__iexact='VFD').order_by('-id')[:8]
-    plc_products = Product.objects.filter(category__name__iexact='PLC').order_by('-id')[:8]
-    hmi_products = Product.objects.filter(category__name__iexact='HMI').order_by('-id')[:8]
+    cards = Product.objects.cards().order_by('-id')
     return render(request, 'home.html', {
         'categories': categories,
         'banner': banner,
-        'vfd_products': vfd_products,
-        'plc_products': plc_products,
-        'hmi_products': hmi_products,
+        'vfd_products': cards.filter(category__name__iexact='VFD')[:8],
+        'plc_products': cards.filter(category__name__iexact='PLC')[:8],
+        'hmi_products': cards.filter(category__name__iexact='HMI')[:8],
+        'servo_products': cards.filter(category__name__iexact='SERVO')[:8],
     })
 
 
 def product_detail_view(request, sku):
     if not sku or sku.lower() == 'none':
         return redirect('home')
-    product = get_object_or_404(Product, sku=sku)
-    return render(request, 'product_detail.html', {'product': product})
+    # The product with its brand and category, then everything it links
+    # to in one more query, however many links it has.
+    product = get_object_or_404(Product.objects.select_related('brand', 'category__parent'), sku=sku)
+    linked = list(Product.objects.only('name', 'sku', 'image', 'original_price').linked_to(product.pk))
+    return render(request, 'product_detail.html', {
+        'product': product,
+        'related_products': [item for item in linked if item.is_related],
+        'compatible_modules': [item for item in linked if item.is_compatible],
+        'also_quoted': sorted(
+            (item for item in linked if item.recommendation_rank is not None),
+            key=lambda item: item.recommendation_rank,
+        ),
+    })
 
 
 def fx_series_view(request):
     """
-    Placeholder view for FX Series.
-    Create a corresponding template 'fx_series.html' as needed.
+    FX Series landing page: the first sixteen FX products, in two rows of eight.
     """
-    return render(request, 'fx_series.html')
+    fx_products = list(Product.objects.cards().filter(name__istartswith='FX').order_by('name')[:16])
+    return render(request, 'fx_series.html', {
+        'fx_products': fx_products[:8],
+        'another_fx_products': fx_products[8:],
+    })
 
 
 def vfd_view(request):
@@ -56,48 +84,80 @@ def vfd_view(request):
     return render(request, 'vfd.html')
 
 
-def category_filter_view(request, cat_name):
+async def _arender(request, template, context):
     """
-    Placeholder view that filters products by category.
-    Adjust the query and template as required.
+    render() for async views. request.user loads lazily through the sync
+    ORM, so it is resolved first and templates (base.html checks
+    user.is_staff) then render without touching the database.
     """
-    products = Product.objects.filter(category__name__iexact=cat_name)
-    return render(request, 'category_filter.html', {
-        'cat_name': cat_name,
-        'products': products,
-    })
+    request.user = await sync_to_async(get_user)(request)
+    return render(request, template, context)
 
 
-def brand_detail_view(request, brand_id):
+async def _product_listing(request, template, products, context):
     """
-    Placeholder view for brand detail.
-    Create 'brand_detail.html' as needed.
+    One keyset page of `products` in the requested sort order. "Load more"
+    requests (AJAX) get only the next page's cards and button.
     """
-    brand = get_object_or_404(Brand, id=brand_id)
-    return render(request, 'brand_detail.html', {'brand': brand})
+    page = await apaginate(products, request.GET.get('sort'), request.GET.get('after'))
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['sort'] = page.sort
+        params['after'] = page.next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+    context.update({
+        'page': page,
+        'products': page.items,
+        'next_url': next_url,
+        'sort_options': [(key, label) for key, (label, _) in SORTS.items()],
+    })
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        template = 'partials/_product_page.html'
+    response = await _arender(request, template, context)
+    patch_vary_headers(response, ['X-Requested-With'])
+    return response
 
 
-def search_view(request):
-    """
-    Placeholder view for search results.
-    Adjust the query and template as needed.
-    """
+async def shop_view(request):
+    return await _product_listing(request, 'shop.html', Product.objects.cards(), {})
+
+
+async def category_filter_view(request, cat_name):
+    category = await Category.objects.filter(name__iexact=cat_name).afirst()
+    products = Product.objects.cards().filter(category=category) if category else Product.objects.none()
+    return await _product_listing(request, 'category_filter.html', products, {'cat_name': cat_name})
+
+
+async def brand_detail_view(request, brand_id):
+    try:
+        brand = await Brand.objects.aget(id=brand_id)
+    except Brand.DoesNotExist:
+        raise Http404("No Brand matches the given query.")
+    return await _product_listing(request, 'brand_detail.html', Product.objects.cards().filter(brand=brand), {
+        'brand': brand,
+    })
+
+
+@rate_limit('search')
+async def search_view(request):
     query = request.GET.get('q', '')
-    products = Product.objects.filter(name__icontains=query) if query else []
-    return render(request, 'search.html', {
+    products = [product async for product in Product.objects.cards().filter(name__icontains=query)] if query else []
+    return await _arender(request, 'search_results.html', {
         'query': query,
         'products': products,
     })
 
 
 @login_required
+@rate_limit('quotation', methods=('POST',))
 def ask_for_discount_view(request, sku):
     """
     Handles the discount request form:
       - Validates and saves the quotation header and line items.
       - Automatically generates order number and subject.
       - Generates a professional PDF of the quotation.
-      - Attaches the PDF to an email and sends it.
+      - Queues staff and customer emails with the PDF attached.
       - Renders a confirmation page that includes a download link for the PDF.
     """
     product = get_object_or_404(Product, sku=sku)
@@ -110,46 +170,30 @@ def ask_for_discount_view(request, sku):
             new_quote = header_form.save(commit=False)
             new_quote.customer = request.user
 
-            # Auto-generate order number and subject
-            generated_order_number = "ORD" + timezone.now().strftime("%Y%m%d%H%M%S")
-            new_quote.order_number = generated_order_number
-            new_quote.subject = f"Discount Request for order no: {generated_order_number} on {timezone.now().strftime('%Y-%m-%d')}"
-
             formset = QuotationLineFormSet(request.POST, instance=new_quote, prefix='lines')
             if formset.is_valid():
-                new_quote.save()
-                formset.save()
-                new_quote.compute_total()
-
-                # 1) Generate the PDF file
-                pdf_file_path, pdf_file_name = generate_pdf_file(new_quote)
-
-                # 2) Build a public URL for the PDF for download
-                shareable_file_url = os.path.join(
-                    settings.MEDIA_URL,
-                    "quotations",
-                    pdf_file_name
-                )
+                # Auto-generate order number and subject, only for a request
+                # that will be saved so invalid forms do not use up numbers.
+                generated_order_number = next_order_number()
+                new_quote.order_number = generated_order_number
+                new_quote.subject = f"Discount Request for order no: {generated_order_number} on {timezone.now().strftime('%Y-%m-%d')}"
 
-                # 3) Prepare an email with the PDF attached
-                subject_email = f"Discount request for {product.name}"
-                body = (
-                    f"User {request.user} requested a multi-line discount.\n"
-                    f"Quotation ID: {new_quote.pk}\n\n"
-                    f"Please find the attached PDF for full details."
-                )
-                email = EmailMessage(
-                    subject=subject_email,
-                    body=body,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    to=[settings.DEFAULT_FROM_EMAIL],  # Adjust recipient as needed
-                )
-                email.attach_file(pdf_file_path)
-                email.send()
+                # The quotation and the outgoing emails are committed together;
+                # `manage.py dispatch_outbox` renders the PDF and delivers them.
+                with transaction.atomic():
+                    new_quote.save()
+                    formset.save()
+                    new_quote.compute_total()
+                    enqueue_quotation_emails(new_quote, product=product)
+
+                QUOTATIONS_SUBMITTED.labels(currency=new_quote.currency).inc()
+
+                # The PDF download renders the quotation on demand.
+                shareable_file_url = reverse('quotation_pdf', args=[new_quote.pk])
 
                 messages.success(request,
                     f"Your discount request for Order No: {new_quote.order_number} has been successfully submitted! "
-                    "A professional PDF file has also been emailed."
+                    "A professional PDF file will be emailed to you shortly."
                 )
                 
                 return render(request, 'discount_submitted.html', {
@@ -190,100 +234,132 @@ def ask_for_discount_view(request, sku):
         })
 
 
-def generate_pdf_file(quotation):
-    """
-    Generate a professional PDF file with quotation details in a table layout.
-    The PDF is saved under MEDIA_ROOT/quotations.
-    Returns a tuple: (pdf_file_path, pdf_file_name).
-    """
-    timestamp = timezone.now().strftime("%Y%m%d%H%M%S")
-    file_name = f"quotation_{quotation.pk}_{timestamp}.pdf"
-    quotations_dir = os.path.join(settings.MEDIA_ROOT, "quotations")
-    os.makedirs(quotations_dir, exist_ok=True)
-    file_path = os.path.join(quotations_dir, file_name)
-
-    doc = SimpleDocTemplate(file_path, pagesize=letter)
-    story = []
-    styles = getSampleStyleSheet()
-
-    # Title
-    story.append(Paragraph("Professional Quotation Details", styles['Title']))
-    story.append(Spacer(1, 12))
-
-    # Header Table
-    header_data = [
-        ["Field", "Value"],
-        ["Quotation ID", str(quotation.pk)],
-        ["Customer", str(quotation.customer)],
-        ["Notes", quotation.notes or "N/A"],
-    ]
-    header_table = Table(header_data, colWidths=[120, 380])
-    header_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    story.append(header_table)
-    story.append(Spacer(1, 24))
-
-    # Line Items Table
-    line_items_data = [
-        ["Product", "Description", "Quantity", "Unit Price", "Discount (%)", "Line Total"]
-    ]
-    for line in quotation.lines.all():
-        line_total = line.line_total()
-        line_items_data.append([
-            line.product.name,
-            line.description or "",
-            str(line.quantity),
-            f"{line.unit_price:.2f}",
-            f"{line.discount_percent:.2f}",
-            f"{line_total:.2f}"
-        ])
-    # Total row
-    line_items_data.append(["", "", "", "", "Total Amount", f"{quotation.total_amount:.2f}"])
-
-    items_table = Table(line_items_data, colWidths=[100, 200, 60, 80, 80, 80])
-    items_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (2, 1), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-    ]))
-    story.append(items_table)
-    story.append(Spacer(1, 12))
-
-    doc.build(story)
-    return file_path, file_name
-
-
+@login_required
 def quotation_detail_view(request, pk):
-    quotation = get_object_or_404(Quotation, pk=pk)
+    # Customers see their own quotations only; staff see every quotation.
+    quotations = Quotation.objects.all() if request.user.is_staff else Quotation.objects.filter(customer=request.user)
+    quotation = get_object_or_404(quotations, pk=pk)
     return render(request, 'quotation_detail.html', {
         'quotation': quotation,
-        'lines': quotation.lines.all(),
+        'lines': quotation.lines.select_related('product'),
+        'can_requote': quotation.customer_id == request.user.pk,
     })
 
 
+@login_required
+def customer_portal_view(request):
+    """
+    The signed-in customer's quotations, newest first, with a summary of
+    their history. "Load more" pages by keyset cursor (?after=).
+    """
+    page = history_page(request.user, request.GET.get('after'))
+    next_url = f"{request.path}?{urlencode({'after': page.next_cursor})}" if page.has_next else None
+    return render(request, 'customer_portal.html', {
+        'summary': history_summary(request.user),
+        'quotations': page.items,
+        'next_url': next_url,
+    })
+
+
+@login_required
+@require_POST
+@rate_limit('quotation')
+def requote_view(request, pk):
+    """
+    Submit one of the customer's past quotations again, at current list
+    prices, as a new discount request.
+    """
+    quotation = get_object_or_404(Quotation, pk=pk, customer=request.user)
+    new_quote = requote(quotation, request.user)
+    messages.success(request,
+        f"Your re-quote of order no: {quotation.order_number} was submitted as order no: {new_quote.order_number}. "
+        "A professional PDF file will be emailed to you shortly."
+    )
+    return redirect('quotation_detail', pk=new_quote.pk)
+
+
+async def quotation_pdf_view(request, pk):
+    """
+    Stream a freshly rendered PDF of a quotation to its owner or to staff.
+    Large quotations are rendered chunk by chunk into a spooled temp file,
+    in the bounded "pdf" pool so a burst of downloads cannot tie up every
+    worker thread.
+    """
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    try:
+        quotation = await Quotation.objects.select_related('customer').aget(pk=pk)
+    except Quotation.DoesNotExist:
+        raise Http404("No Quotation matches the given query.")
+    if not user.is_staff and quotation.customer_id != user.pk:
+        raise Http404("No Quotation matches the given query.")
+    return FileResponse(
+        await offload('pdf', spooled_quotation_pdf, quotation),
+        as_attachment=True,
+        filename=f"quotation_{quotation.order_number or quotation.pk}.pdf",
+        content_type='application/pdf',
+    )
+
+
 @staff_member_required
 def order_management_view(request):
     """
     A simple order management dashboard for staff users.
     Filters orders by status if provided.
     """
-    orders = Quotation.objects.all().order_by('-created_at')
+    orders = Quotation.objects.select_related('customer').order_by('-created_at')
     status_filter = request.GET.get('status')
     if status_filter:
         orders = orders.filter(status=status_filter)
+    # Totals in every currency are computed by the database in the same query.
+    orders = annotate_totals(orders, rates=get_rates())
     context = {
         'orders': orders,
     }
     return TemplateResponse(request, 'order_management.html', context)
+
+
+@staff_member_required
+def performance_stats_view(request):
+    """
+    Rolling latency percentiles, query counts and template times per URL
+    name, as collected by RequestInstrumentationMiddleware in this worker.
+    """
+    config = instrumentation_config()
+    return JsonResponse({
+        'enabled': config['ENABLED'],
+        'window': config['WINDOW'],
+        'pid': os.getpid(),
+        'views': rolling_stats.snapshot(),
+    })
+
+
+@staff_member_required
+def template_profile_view(request):
+    """
+    Render counts and times per template and per {% for %} block, as
+    collected by TemplateProfilerMiddleware in this worker.
+    """
+    config = template_profiler_config()
+    return JsonResponse({
+        'enabled': config['ENABLED'],
+        'pid': os.getpid(),
+        **template_totals.snapshot(),
+    })
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Open to staff, to requests from
+    ESHOP_METRICS_ALLOWED_IPS and to bearers of ESHOP_METRICS_TOKEN.
+    """
+    token = getattr(settings, 'ESHOP_METRICS_TOKEN', None)
+    allowed = (
+        request.user.is_staff
+        or request.META.get('REMOTE_ADDR') in getattr(settings, 'ESHOP_METRICS_ALLOWED_IPS', ())
+        or (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'))
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(REGISTRY.exposition(), content_type=METRICS_CONTENT_TYPE)
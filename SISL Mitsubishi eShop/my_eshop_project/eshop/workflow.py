@@ -0,0 +1,156 @@
+"""
+Quotation lifecycle state machine.
+
+Allowed transitions:
+    Pending   -> Confirmed, Canceled
+    Confirmed -> Delivered, Canceled
+
+Every transition is recorded in QuotationStatusLog. Side effects
+(inventory, notifications, ...) are registered with @on_transition and run
+only after the surrounding transaction commits; eshop.outbox queues the
+customer's status email this way.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import OrderStatus, Quotation, QuotationStatusLog
+
+logger = logging.getLogger(__name__)
+
+TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.CONFIRMED, OrderStatus.CANCELED},
+    OrderStatus.CONFIRMED: {OrderStatus.DELIVERED, OrderStatus.CANCELED},
+    OrderStatus.CANCELED: set(),
+    OrderStatus.DELIVERED: set(),
+}
+
+LOG_BATCH_SIZE = 500
+CONFLICT_RETRIES = 3
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+class TransitionConflict(Exception):
+    """Raised when rows change status between selection and update."""
+
+
+_hooks = defaultdict(list)
+
+
+def on_transition(*statuses):
+    """
+    Register a side-effect hook for transitions into the given statuses.
+    Hooks are called after commit as hook(changes, to_status, user), where
+    changes is a list of (quotation_id, from_status) tuples.
+    """
+    def decorator(func):
+        for status in statuses:
+            _hooks[status].append(func)
+        return func
+    return decorator
+
+
+def allowed_sources(to_status):
+    return [source for source, targets in TRANSITIONS.items() if to_status in targets]
+
+
+def can_transition(from_status, to_status):
+    return to_status in TRANSITIONS.get(from_status, set())
+
+
+def _run_hooks(changes, to_status, user):
+    for hook in _hooks.get(to_status, []):
+        try:
+            hook(changes, to_status, user)
+        except Exception:
+            # The transition is already committed; a failing hook must not
+            # hide that from the caller.
+            logger.exception("Transition hook %r failed", hook)
+
+
+def _schedule_hooks(changes, to_status, user):
+    if changes and _hooks.get(to_status):
+        transaction.on_commit(lambda: _run_hooks(changes, to_status, user))
+
+
+def transition(quotation, to_status, user=None, note=''):
+    """Move a single quotation to `to_status`, raising InvalidTransition if not allowed."""
+    with transaction.atomic():
+        current = (
+            Quotation.objects.select_for_update()
+            .filter(pk=quotation.pk)
+            .values_list('status', flat=True)
+            .first()
+        )
+        if current is None or not can_transition(current, to_status):
+            raise InvalidTransition(
+                f"Cannot move quotation #{quotation.pk} from "
+                f"{OrderStatus(current).label if current else 'unknown'} to {OrderStatus(to_status).label}."
+            )
+        if not Quotation.objects.filter(pk=quotation.pk, status=current).update(status=to_status):
+            raise TransitionConflict(f"Quotation #{quotation.pk} changed status concurrently.")
+        QuotationStatusLog.objects.create(
+            quotation_id=quotation.pk,
+            from_status=current,
+            to_status=to_status,
+            changed_by=user,
+            note=note,
+        )
+        _schedule_hooks([(quotation.pk, current)], to_status, user)
+    quotation.status = to_status
+    return quotation
+
+
+def _bulk_transition_once(queryset, to_status, user, note):
+    sources = allowed_sources(to_status)
+    with transaction.atomic():
+        candidates = queryset.filter(status__in=sources)
+        changes = list(candidates.select_for_update().values_list('pk', 'status'))
+        if not changes:
+            return []
+        # One UPDATE ... WHERE status IN (...) for the whole selection.
+        updated = candidates.update(status=to_status)
+        if updated != len(changes):
+            raise TransitionConflict("Quotations changed status during a bulk transition.")
+        QuotationStatusLog.objects.bulk_create(
+            [
+                QuotationStatusLog(
+                    quotation_id=pk,
+                    from_status=from_status,
+                    to_status=to_status,
+                    changed_by=user,
+                    note=note,
+                )
+                for pk, from_status in changes
+            ],
+            batch_size=LOG_BATCH_SIZE,
+        )
+        _schedule_hooks(changes, to_status, user)
+    return changes
+
+
+def bulk_transition(queryset, to_status, user=None, note=''):
+    """
+    Transition every quotation in `queryset` that may legally move to
+    `to_status`; the rest are left untouched. Returns the list of
+    (quotation_id, from_status) pairs that changed.
+    """
+    for attempt in range(CONFLICT_RETRIES):
+        try:
+            return _bulk_transition_once(queryset, to_status, user, note)
+        except TransitionConflict:
+            if attempt == CONFLICT_RETRIES - 1:
+                raise
+    return []
+
+
+@on_transition(*OrderStatus.values)
+def log_transitions(changes, to_status, user):
+    logger.info(
+        "%d quotation(s) moved to %s by %s",
+        len(changes), OrderStatus(to_status).label, user or 'system',
+    )
@@ -3,6 +3,19 @@ ASGI config for eshop_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Passenger serves the site through passenger_wsgi.py. To run it under an
+ASGI server instead, so async views (listings, search, the catalog API and
+PDF downloads) wait on I/O without holding a thread, use for example:
+
+    gunicorn -c gunicorn_asgi.conf.py eshop_project.asgi:application
+    uvicorn eshop_project.asgi:application --workers 4 --limit-concurrency 400
+    daphne -b 0.0.0.0 -p 8000 eshop_project.asgi:application
+
+Blocking work started from async views runs in the bounded pools
+configured by ESHOP_OFFLOAD_POOLS. Like wsgi.py, importing this module
+runs the ESHOP_PRELOAD warm-up; uvicorn imports it inside its event loop,
+so preload() moves the database steps to a thread there.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -14,3 +27,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eshop_project.settings')
 
 application = get_asgi_application()
+
+from eshop.startup import preload  # noqa: E402  (needs the app registry)
+
+preload()
@@ -22,6 +22,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it times everything below it; a no-op unless enabled.
+    'eshop.instrumentation.RequestInstrumentationMiddleware',
+    # Per-template and per-{% for %} render times; a no-op unless enabled.
+    'eshop.template_profiler.TemplateProfilerMiddleware',
+    # Flags requests over their ESHOP_QUERY_BUDGETS; a no-op unless enabled.
+    'eshop.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -37,8 +43,16 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'eshop' / 'templates'],  # Look for templates in eshop/templates
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept in memory for the life of the worker
+            # (runserver's autoreloader resets them when a template changes).
+            # The loaders are listed explicitly, so APP_DIRS is left off.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -56,6 +70,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Wait for concurrent writers instead of failing with "database is locked".
+        'OPTIONS': {'timeout': 20},
+        # An on-disk test database, so concurrency tests can use real locking
+        # (the shared-cache in-memory database fails fast on lock contention).
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -79,4 +98,289 @@ EMAIL_HOST_PASSWORD = 'YOUR_GOOGLE_WORKSPACE_APP_PASSWORD'
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = 'info@sisl-bd.com'
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# USE_TZ is off, so datetimes are stored and compared as naive times in
+# this zone: created_at, order number dates and the cron schedules below.
+# Left unset, Django would use America/Chicago.
+TIME_ZONE = 'Asia/Dhaka'
+
+# ---------------------------------------------------------------------
+# Currencies & Exchange Rates
+# ---------------------------------------------------------------------
+# Optional local CSV/JSON rates file; admin-entered rates take precedence.
+ESHOP_EXCHANGE_RATES_FILE = None
+# Seconds each worker process keeps its copy of the rate table.
+ESHOP_EXCHANGE_RATE_TTL = 300
+
+# ---------------------------------------------------------------------
+# Order Numbers
+# ---------------------------------------------------------------------
+# Numbers are <PREFIX><period><counter>; the counter restarts every period.
+ESHOP_ORDER_NUMBER_PREFIX = 'ORD'
+ESHOP_ORDER_NUMBER_PERIOD = 'day'  # 'day', 'year' or None
+ESHOP_ORDER_NUMBER_DIGITS = 5
+# How many numbers each worker reserves per database round trip.
+ESHOP_ORDER_NUMBER_BLOCK_SIZE = 20
+
+# ---------------------------------------------------------------------
+# Email Outbox (delivered by `manage.py dispatch_outbox`)
+# ---------------------------------------------------------------------
+# Staff recipients of new discount requests; defaults to DEFAULT_FROM_EMAIL.
+ESHOP_SALES_EMAILS = [DEFAULT_FROM_EMAIL]
+ESHOP_EMAIL_MAX_ATTEMPTS = 5
+# Messages per second; None sends as fast as the mail server accepts them.
+ESHOP_EMAIL_RATE_LIMIT = 5
+# Seconds before a failed email is retried, doubled after each further
+# failure up to the maximum.
+ESHOP_EMAIL_RETRY_DELAY = 60
+ESHOP_EMAIL_RETRY_MAX_DELAY = 3600
+# Seconds a dispatcher holds the batch it claimed; must outlast sending a
+# batch, after which another dispatcher may take the unsent emails over.
+ESHOP_EMAIL_CLAIM_LEASE = 600
+
+# ---------------------------------------------------------------------
+# Request Instrumentation (stats at /perf/stats/, staff only)
+# ---------------------------------------------------------------------
+ESHOP_INSTRUMENTATION = {
+    'ENABLED': False,
+    # Requests slower than this are logged to "eshop.slow_requests" with their SQL.
+    'SLOW_REQUEST_MS': 500,
+    # Most recent requests per URL name used for the p50/p95/p99 figures.
+    'WINDOW': 1000,
+    'SERVER_TIMING': True,
+}
+
+# ---------------------------------------------------------------------
+# Metrics (Prometheus text format at /metrics)
+# ---------------------------------------------------------------------
+# Shared directory where every worker process writes its values, so a
+# scrape sees all Passenger workers. None reports only the scraped worker.
+# Per-view request and database metrics need ESHOP_INSTRUMENTATION enabled.
+ESHOP_METRICS_DIR = None
+ESHOP_METRICS_FLUSH_INTERVAL = 5  # seconds
+# Besides staff users, scrapers may authenticate with
+# "Authorization: Bearer <token>" or connect from an allowed address.
+ESHOP_METRICS_TOKEN = None
+ESHOP_METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# ---------------------------------------------------------------------
+# Product Compatibility Graph (configurator at /api/configurator/)
+# ---------------------------------------------------------------------
+# Seconds each worker keeps its copy of the related/compatible link index.
+# Admin edits invalidate it at once; this bounds staleness across workers.
+ESHOP_COMPAT_GRAPH_TTL = 300
+
+# ---------------------------------------------------------------------
+# Product Cards (listing pages, see eshop/templatetags/catalog_tags.py)
+# ---------------------------------------------------------------------
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered card HTML and spec lists, one entry each per product; sized
+    # for the whole catalog.
+    'product_cards': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'product-cards',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # Files shared by every worker on this host, for values that other
+    # workers must not keep serving once they are invalidated. Only for
+    # values written rarely: every write lists the directory to enforce
+    # MAX_ENTRIES. Several hosts need a shared backend (memcached, Redis).
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+ESHOP_PRODUCT_CARD_CACHE = 'product_cards'
+# Seconds a rendered card is reused; 0 renders every card on every request.
+ESHOP_PRODUCT_CARD_CACHE_TTL = 600
+# Seconds a rendered product specification list is reused; it is keyed by
+# the product's updated_at, so saving a product shows the change at once.
+ESHOP_PRODUCT_SPECS_CACHE_TTL = 3600
+# Products per page (and per "Load more") on the shop, category and brand pages.
+ESHOP_PAGE_SIZE = 24
+
+# ---------------------------------------------------------------------
+# ASGI mode (see eshop_project/asgi.py)
+# ---------------------------------------------------------------------
+# Threads per pool for blocking work started from async views (PDF
+# rendering). Requests beyond that wait for a free thread.
+ESHOP_OFFLOAD_POOLS = {
+    'pdf': 2,
+}
+
+# ---------------------------------------------------------------------
+# Worker startup (see eshop/startup.py and manage.py profile_startup)
+# ---------------------------------------------------------------------
+# Warm-up run when wsgi.py/asgi.py is imported, before the first request:
+# 'urls' (resolvers), 'templates' (compiled into the cached loader),
+# 'caches' (exchange rates, compatibility graph) and 'pdf', which imports
+# ReportLab up front instead of on the first quotation PDF.
+ESHOP_PRELOAD = ['urls', 'templates', 'caches']
+# Cold-start target: a fresh interpreter importing eshop_project.wsgi,
+# preload included, must be ready to serve within this many milliseconds.
+# Checked by the test suite; see "manage.py profile_startup" when it fails.
+ESHOP_COLD_START_TARGET_MS = 1500
+
+# ---------------------------------------------------------------------
+# Template Profiler (development; see eshop/template_profiler.py)
+# ---------------------------------------------------------------------
+# When enabled, every request logs its slowest templates and {% for %}
+# loops to the "eshop.template_profile" logger, and per-worker totals are
+# served to staff at /perf/templates/. Adds overhead to every render, so
+# it follows DEBUG by default.
+ESHOP_TEMPLATE_PROFILER = {
+    'ENABLED': DEBUG,
+    # Templates and loops listed per request in the log.
+    'TOP': 10,
+}
+
+# ---------------------------------------------------------------------
+# Customer Portal (quotation history at /account/quotations/)
+# ---------------------------------------------------------------------
+# Cache of the customers' history summaries. Any change to one of their
+# quotations drops the summary, so it must be a cache every worker shares.
+ESHOP_QUOTATION_HISTORY_CACHE = 'shared'
+# Seconds a summary is kept otherwise.
+ESHOP_QUOTATION_HISTORY_CACHE_TTL = 3600
+
+# ---------------------------------------------------------------------
+# Query Budgets (see eshop/query_budget.py)
+# ---------------------------------------------------------------------
+# In development, requests running more queries than their URL name's
+# budget are logged to "eshop.query_budget" with the repeated SQL and the
+# template tags that ran it; RAISE turns that into an error page. The test
+# suite checks every route against the same budgets, so a new route needs
+# one here.
+ESHOP_QUERY_BUDGET = {
+    'ENABLED': DEBUG,
+    'RAISE': False,
+    # Budget for URL names missing below; None leaves them unchecked.
+    'DEFAULT': None,
+}
+# Queries per request for a signed-in staff user with cold caches. They do
+# not depend on how many rows a page shows.
+ESHOP_QUERY_BUDGETS = {
+    'home': 9,
+    'product_detail': 4,
+    'fx_series': 3,
+    'vfd': 2,
+    'shop': 3,
+    'category_filter': 4,
+    'brand_detail': 4,
+    'search': 3,
+    'ask_for_discount': 5,
+    'quotation_detail': 4,
+    'quotation_pdf': 3,
+    'requote': 17,
+    'customer_portal': 5,
+    'order_management': 5,
+    # Session, user and one query per database-backed collector.
+    'metrics': 4,
+    'performance_stats': 2,
+    'template_profile': 2,
+    'api_product_list': 1,
+    'api_product_autocomplete': 1,
+    'api_product_detail': 1,
+    'api_product_recommendations': 3,
+    'api_configurator': 6,
+    'api_bill_of_materials': 5,
+    'api_quotation_transition': 7,
+    'api_quotation_lines': 4,
+    'api_quotation_import': 13,
+    # With ?since, the base version is looked up too.
+    'api_catalog_snapshot': 4,
+}
+
+# ---------------------------------------------------------------------
+# Offline Catalog Snapshots (field sales, see eshop/catalog_snapshot.py)
+# ---------------------------------------------------------------------
+# Versions kept on disk; devices older than that download a full snapshot
+# instead of a delta.
+ESHOP_CATALOG_SNAPSHOT_KEEP = 10
+# Bounding box of the JPEG thumbnails shipped in each snapshot.
+ESHOP_CATALOG_THUMBNAIL_SIZE = (160, 160)
+# Quotations accepted per upload to /api/quotations/import/.
+ESHOP_OFFLINE_IMPORT_MAX_QUOTATIONS = 200
+
+# ---------------------------------------------------------------------
+# Quotation Line Editing (see eshop/quotation_lines.py)
+# ---------------------------------------------------------------------
+# Add/update/delete operations accepted per batch to
+# /api/quotations/<id>/lines/.
+ESHOP_QUOTATION_LINE_BATCH_MAX = 500
+
+# ---------------------------------------------------------------------
+# Rate Limiting (see eshop/ratelimit.py)
+# ---------------------------------------------------------------------
+# Token buckets per scope: 'rate' refills the bucket ("30/m" = thirty a
+# minute), 'burst' is its size (default: the rate's count) and 'key' is
+# 'ip' or 'user' (signed-in users, anonymous requests by address).
+ESHOP_RATE_LIMITS = {
+    # Site search.
+    'search': {'rate': '60/m', 'burst': 20},
+    # Discount requests; each renders a PDF and emails the sales team.
+    'quotation': {'rate': '10/h', 'burst': 5, 'key': 'user'},
+    # JSON endpoints under /api/ (DRF views through TokenBucketThrottle).
+    'api': {'rate': '300/m', 'burst': 60},
+    'quotation_import': {'rate': '60/h', 'burst': 10, 'key': 'user'},
+}
+ESHOP_RATE_LIMIT_ENABLED = True
+# Cache holding the buckets. The rates above are site-wide only with a
+# backend every worker shares (memcached, Redis). 'default' is a
+# LocMemCache, and None likewise keeps buckets per process; each process
+# then refills at 1/ESHOP_RATE_LIMIT_PROCESSES of every rate and keeps the
+# full burst, so every client still gets its burst.
+ESHOP_RATE_LIMIT_CACHE = 'default'
+# Worker processes serving the site: PassengerMaxPoolSize (6 by default) or
+# the ASGI server's worker count.
+ESHOP_RATE_LIMIT_PROCESSES = 6
+
+# ---------------------------------------------------------------------
+# Scheduled Maintenance (`manage.py run_scheduler`, see eshop/scheduler.py)
+# ---------------------------------------------------------------------
+# Cron schedules are in TIME_ZONE (Asia/Dhaka). Each job may set 'kwargs',
+# 'lease' (seconds another scheduler waits before taking over a run that
+# never finished) and 'enabled'.
+ESHOP_SCHEDULED_JOBS = {
+    'clean_quotation_files': {
+        'schedule': '30 2 * * *',
+        'function': 'eshop.maintenance.clean_quotation_files',
+        'kwargs': {'max_age_days': 30},
+    },
+    'build_recommendations': {
+        'schedule': '0 3 * * *',
+        'function': 'eshop.recommendations.build_recommendations',
+    },
+    'expire_stale_quotations': {
+        'schedule': '30 3 * * *',
+        'function': 'eshop.maintenance.expire_stale_quotations',
+        'kwargs': {'max_age_days': 30},
+    },
+    'optimize_database': {
+        'schedule': '0 4 * * 1-6',
+        'function': 'eshop.maintenance.optimize_database',
+    },
+    'vacuum_database': {
+        'schedule': '0 4 * * 0',
+        'function': 'eshop.maintenance.optimize_database',
+        'kwargs': {'vacuum': True},
+    },
+    'prune_job_runs': {
+        'schedule': '30 4 * * *',
+        'function': 'eshop.scheduler.prune_job_runs',
+        'kwargs': {'keep_days': 90},
+    },
+}
+# Default 'lease', in seconds.
+ESHOP_SCHEDULER_LEASE = 3600
+# Longest sleep between checks for due jobs, in seconds.
+ESHOP_SCHEDULER_POLL_INTERVAL = 30
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': ['eshop.ratelimit.TokenBucketThrottle'],
+}
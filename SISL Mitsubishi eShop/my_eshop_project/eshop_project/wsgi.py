@@ -2,6 +2,9 @@
 WSGI config for eshop_project project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+Importing it also runs the ESHOP_PRELOAD warm-up (eshop/startup.py), so
+servers that import the application before forking or before accepting
+connections hand out workers that are already warm.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
@@ -14,3 +17,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eshop_project.settings')
 
 application = get_wsgi_application()
+
+from eshop.startup import preload  # noqa: E402  (needs the app registry)
+
+preload()
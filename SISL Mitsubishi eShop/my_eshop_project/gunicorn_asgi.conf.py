@@ -0,0 +1,22 @@
+"""
+Gunicorn settings for serving the shop over ASGI with uvicorn workers:
+
+    pip install gunicorn uvicorn
+    gunicorn -c gunicorn_asgi.conf.py eshop_project.asgi:application
+
+Every value can be overridden through the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('ESHOP_ASGI_BIND', '127.0.0.1:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Each worker is one event loop; more workers use more cores.
+workers = int(os.environ.get('ESHOP_ASGI_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('ESHOP_ASGI_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then, like Passenger does with its processes.
+max_requests = int(os.environ.get('ESHOP_ASGI_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('ESHOP_ASGI_ACCESS_LOG', '-')
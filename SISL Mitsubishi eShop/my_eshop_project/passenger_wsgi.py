@@ -1,14 +1,14 @@
 import os
 import sys
 
-# Add your project directory to sys.path
-path = '/home/mitsubishifabd/apps/sisl_shop/SISL Mitsubishi eShop\my_eshop_project'
-if path not in sys.path:
-    sys.path.insert(0, path)
+# Passenger imports this file from the project directory; make that
+# directory importable wherever the app is deployed.
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
 
-# Set environment variable for Django settings
-os.environ['DJANGO_SETTINGS_MODULE'] = 'eshop_project.settings'
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eshop_project.settings')
 
-# Create WSGI application
-from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
\ No newline at end of file
+# Sets up Django and runs the ESHOP_PRELOAD warm-up when the worker
+# starts, not on its first request.
+from eshop_project.wsgi import application  # noqa: E402,F401